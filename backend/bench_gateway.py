@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+
+# Load driver for the gateway. By default it starts fake_ollama.py and the gateway
+# (pointed at the fake) on free local ports, so it runs on any Linux box.
+
+SCENARIOS = ("generate_stream", "generate", "proxy_fetch", "chat")
+# Same requests sent straight to the fake model, to separate gateway overhead from model time
+BASELINES = {"generate_stream": "direct_stream", "generate": "direct", "proxy_fetch": "direct"}
+PROMPT = "Summarise the duty of care owed by an occupier to a lawful visitor."
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def spawn(args: List[str], env: Dict = None, cwd: str = None) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable] + args, env=env, cwd=cwd, stdout=subprocess.DEVNULL)
+
+async def wait_until_up(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return round(sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)], 2)
+
+def summarize(samples: List[Dict], elapsed: float) -> Dict:
+    ok = [s for s in samples if s["ok"]]
+    ttfb = sorted(s["ttfb"] * 1000 for s in ok)
+    total = sorted(s["total"] * 1000 for s in ok)
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "ttfb_p50_ms": percentile(ttfb, 50),
+        "ttfb_p95_ms": percentile(ttfb, 95),
+        "ttfb_p99_ms": percentile(ttfb, 99),
+        "total_p50_ms": percentile(total, 50),
+        "total_p95_ms": percentile(total, 95),
+        "total_p99_ms": percentile(total, 99),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        "seconds": round(elapsed, 3)
+    }
+
+async def http_request(session: aiohttp.ClientSession, url: str, payload: Dict, stream: bool) -> Dict:
+    t0 = time.perf_counter()
+    ttfb = None
+    try:
+        async with session.post(url, json=payload) as response:
+            if stream:
+                async for chunk in response.content.iter_any():
+                    if ttfb is None and chunk:
+                        ttfb = time.perf_counter() - t0
+            else:
+                await response.read()
+            ok = response.status == 200
+    except aiohttp.ClientError:
+        ok = False
+    total = time.perf_counter() - t0
+    return {"ok": ok, "ttfb": ttfb if ttfb is not None else total, "total": total}
+
+async def chat_request(session: aiohttp.ClientSession, url: str) -> Dict:
+    t0 = time.perf_counter()
+    ttfb = None
+    ok = False
+    try:
+        async with session.ws_connect(url) as ws:
+            await ws.send_str(PROMPT)
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                if ttfb is None:
+                    ttfb = time.perf_counter() - t0
+                if message.data == "[DONE]":
+                    ok = True
+                    break
+                if message.data.startswith("Error:"):
+                    break
+    except aiohttp.ClientError:
+        pass
+    total = time.perf_counter() - t0
+    return {"ok": ok, "ttfb": ttfb if ttfb is not None else total, "total": total}
+
+def make_request(scenario: str, gateway_url: str, ollama_url: str, model: str):
+    payload = {"model": model, "prompt": PROMPT}
+    if scenario == "chat":
+        ws_url = gateway_url.replace("http://", "ws://", 1) + "/chat"
+        return lambda session: chat_request(session, ws_url)
+    if scenario == "generate_stream":
+        return lambda session: http_request(session, f"{gateway_url}/api/generate", dict(payload, stream=True), True)
+    if scenario == "generate":
+        return lambda session: http_request(session, f"{gateway_url}/api/generate", dict(payload, stream=False), False)
+    if scenario == "proxy_fetch":
+        return lambda session: http_request(session, f"{gateway_url}/api/proxy/fetch", dict(payload, stream=False), False)
+    if scenario == "direct_stream":
+        return lambda session: http_request(session, ollama_url, dict(payload, stream=True), True)
+    if scenario == "direct":
+        return lambda session: http_request(session, ollama_url, dict(payload, stream=False), False)
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+async def run_level(request_fn, concurrency: int, total_requests: int) -> Dict:
+    """Keep `concurrency` requests in flight until total_requests have completed"""
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=600)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await request_fn(session)  # Warm-up, not measured
+        remaining = total_requests
+        samples = []
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                samples.append(await request_fn(session))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize(samples, time.perf_counter() - started)
+
+def add_overhead(result: Dict, baseline: Dict):
+    for metric in ("ttfb_p50_ms", "ttfb_p95_ms", "total_p50_ms", "total_p95_ms"):
+        if result.get(metric) is not None and baseline.get(metric) is not None:
+            result[f"overhead_{metric}"] = round(result[metric] - baseline[metric], 2)
+
+def fan_out_capacity(results: List[Dict], ttfb_slo_ms: float) -> Dict:
+    """Highest concurrency per scenario with no errors and p95 time-to-first-byte within the SLO"""
+    capacity = {}
+    for result in results:
+        healthy = result["errors"] == 0 and result["ttfb_p95_ms"] is not None and result["ttfb_p95_ms"] <= ttfb_slo_ms
+        if healthy:
+            capacity[result["scenario"]] = max(capacity.get(result["scenario"], 0), result["concurrency"])
+        else:
+            capacity.setdefault(result["scenario"], 0)
+    return capacity
+
+async def run(args) -> Dict:
+    levels = [int(level) for level in args.concurrency.split(",") if level]
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    processes = []
+    gateway_url, ollama_url = args.gateway, args.ollama
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+
+    try:
+        if not args.no_spawn:
+            ollama_port, gateway_port = free_port(), free_port()
+            ollama_url = f"http://127.0.0.1:{ollama_port}/api/generate"
+            gateway_url = f"http://127.0.0.1:{gateway_port}"
+            processes.append(spawn([
+                os.path.join(backend_dir, "fake_ollama.py"), "--port", str(ollama_port),
+                "--tokens-per-second", str(args.tokens_per_second), "--ttft", str(args.ttft), "--tokens", str(args.tokens),
+                "--error-rate", str(args.error_rate)
+            ]))
+            processes.append(spawn(
+                ["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(gateway_port), "--log-level", "warning"],
+                env=dict(os.environ, OLLAMA_API_URL=ollama_url),
+                cwd=backend_dir
+            ))
+            await wait_until_up(ollama_url.rsplit("/api/", 1)[0] + "/metrics")
+            await wait_until_up(gateway_url + "/")
+
+        results = []
+        baselines = {}
+        for scenario in scenarios:
+            baseline_name = BASELINES.get(scenario)
+            for concurrency in levels:
+                if baseline_name and (baseline_name, concurrency) not in baselines:
+                    baseline = await run_level(make_request(baseline_name, gateway_url, ollama_url, args.model), concurrency, args.requests)
+                    baselines[(baseline_name, concurrency)] = baseline
+                    results.append(dict(baseline, scenario=baseline_name, concurrency=concurrency))
+                result = await run_level(make_request(scenario, gateway_url, ollama_url, args.model), concurrency, args.requests)
+                result.update(scenario=scenario, concurrency=concurrency)
+                if baseline_name:
+                    add_overhead(result, baselines[(baseline_name, concurrency)])
+                results.append(result)
+                print(f"{scenario:<16} c={concurrency:<4} ttfb p50={result['ttfb_p50_ms']}ms p95={result['ttfb_p95_ms']}ms "
+                      f"total p50={result['total_p50_ms']}ms overhead(ttfb p50)={result.get('overhead_ttfb_p50_ms')}ms "
+                      f"{result['throughput_rps']} req/s errors={result['errors']}")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "results": results,
+        "fan_out_capacity": fan_out_capacity([r for r in results if r["scenario"] in SCENARIOS], args.ttfb_slo_ms)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the gateway against a fake Ollama server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,10,50,100", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests per scenario and level")
+    parser.add_argument("--model", default="mistral")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--ttft", type=float, default=0.1)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--ttfb-slo-ms", type=float, default=500.0, help="p95 TTFB a level must meet to count towards fan-out capacity")
+    parser.add_argument("--no-spawn", action="store_true", help="Use already running servers at --gateway and --ollama")
+    parser.add_argument("--gateway", default="http://localhost:8080")
+    parser.add_argument("--ollama", default="http://localhost:11435/api/generate")
+    parser.add_argument("--output", default=None, help="Write results as JSON (default: bench_gateway_<timestamp>.json)")
+    args = parser.parse_args()
+
+    for name in args.scenarios.split(","):
+        if name and name not in SCENARIOS:
+            parser.error(f"Unknown scenario: {name}")
+
+    report = asyncio.run(run(args))
+    print(f"Fan-out capacity (p95 TTFB <= {args.ttfb_slo_ms:.0f}ms, no errors): {report['fan_out_capacity']}")
+    output = args.output or f"bench_gateway_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+# Stand-in for Ollama's /api/generate, for exercising the gateway without a model box.
+# Point the gateway at it with OLLAMA_API_URL=http://localhost:11435/api/generate.
+
+VOCABULARY = (
+    "the court held that a contract requires offer acceptance and consideration and that "
+    "the insurer must prove the exclusion applies before coverage can be denied under the policy"
+).split()
+
+class FakeOllama:
+    def __init__(self, tokens_per_second: float = 30.0, ttft: float = 0.2, tokens: int = 200,
+                 error_rate: float = 0.0, error_status: int = 500, midstream_error_rate: float = 0.0, seed: int = 0):
+        self.tokens_per_second = tokens_per_second
+        self.ttft = ttft
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.midstream_error_rate = midstream_error_rate
+        self.rng = random.Random(seed)
+        self.metrics = {"requests": 0, "active": 0, "completed": 0, "cancelled": 0, "errors_injected": 0}
+        self.loaded = {}
+
+    def _settings(self, payload: dict):
+        # Per-request overrides, e.g. {"options": {"fake_tokens": 50, "fake_ttft": 0}}
+        options = payload.get("options") or {}
+        return (
+            int(options.get("fake_tokens", self.tokens)),
+            float(options.get("fake_ttft", self.ttft)),
+            float(options.get("fake_tokens_per_second", self.tokens_per_second))
+        )
+
+    def _chunk(self, model: str, text: str, done: bool, **extra) -> dict:
+        return dict(
+            model=model,
+            created_at=datetime.now(timezone.utc).isoformat(),
+            response=text,
+            done=done,
+            **extra
+        )
+
+    async def generate(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        model = payload.get("model", "mistral")
+        n_tokens, ttft, rate = self._settings(payload)
+        self.metrics["requests"] += 1
+        self.loaded[model] = payload.get("keep_alive", "5m")
+
+        if not payload.get("prompt"):
+            # Like Ollama, a request without a prompt just loads the model
+            return web.json_response(self._chunk(model, "", True, done_reason="load"))
+
+        if self.rng.random() < self.error_rate:
+            self.metrics["errors_injected"] += 1
+            return web.json_response({"error": "injected failure"}, status=self.error_status)
+
+        started = time.perf_counter()
+        interval = 1.0 / rate if rate > 0 else 0.0
+        fail_at = self.rng.randint(1, max(n_tokens - 1, 1)) if self.rng.random() < self.midstream_error_rate else None
+        context = [self.rng.randint(1, 32000) for _ in range(min(n_tokens, 64))]
+
+        self.metrics["active"] += 1
+        try:
+            await asyncio.sleep(ttft)
+            if not payload.get("stream", True):
+                await asyncio.sleep(interval * max(n_tokens - 1, 0))
+                text = "".join(self._token(i) for i in range(n_tokens))
+                self.metrics["completed"] += 1
+                return web.json_response(self._chunk(
+                    model, text, True, context=context, eval_count=n_tokens,
+                    total_duration=int((time.perf_counter() - started) * 1e9)
+                ))
+
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+            for i in range(n_tokens):
+                if i:
+                    await asyncio.sleep(interval)
+                if fail_at is not None and i == fail_at:
+                    self.metrics["errors_injected"] += 1
+                    # Drop the connection mid-stream, as a crashed model runner would
+                    request.transport.close()
+                    return response
+                await response.write((json.dumps(self._chunk(model, self._token(i), False)) + "\n").encode("utf-8"))
+            await response.write((json.dumps(self._chunk(
+                model, "", True, context=context, eval_count=n_tokens,
+                total_duration=int((time.perf_counter() - started) * 1e9)
+            )) + "\n").encode("utf-8"))
+            await response.write_eof()
+            self.metrics["completed"] += 1
+            return response
+        except (asyncio.CancelledError, ConnectionResetError):
+            # The gateway dropped the request (its client went away)
+            self.metrics["cancelled"] += 1
+            raise
+        finally:
+            self.metrics["active"] -= 1
+
+    def _token(self, i: int) -> str:
+        word = VOCABULARY[i % len(VOCABULARY)]
+        return word if i == 0 else " " + word
+
+    async def get_metrics(self, request: web.Request) -> web.Response:
+        return web.json_response(self.metrics)
+
+    async def list_loaded(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [
+            {"name": f"{name}:latest", "model": f"{name}:latest", "keep_alive": keep_alive} for name, keep_alive in self.loaded.items()
+        ]})
+
+def create_app(fake: FakeOllama) -> web.Application:
+    app = web.Application()
+    app.router.add_post("/api/generate", fake.generate)
+    app.router.add_get("/metrics", fake.get_metrics)
+    app.router.add_get("/api/ps", fake.list_loaded)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama /api/generate server for gateway benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=200, help="Tokens per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--midstream-error-rate", type=float, default=0.0, help="Fraction of streams cut off part-way")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeOllama(
+        tokens_per_second=args.tokens_per_second,
+        ttft=args.ttft,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        midstream_error_rate=args.midstream_error_rate,
+        seed=args.seed
+    )
+    print(f"Fake Ollama running at http://{args.host}:{args.port}/api/generate")
+    web.run_app(create_app(fake), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,16 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse, Response, HTMLResponse, StreamingResponse
 import aiohttp
 import json
-from typing import List, Dict
+from typing import List, Dict, Optional
 import asyncio
 import os
+import sys
+import time
+from urllib.parse import quote
+# Modules shared with the other service live in the repo's common/ package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.compression import CompressionMiddleware
+from common.profiling import ProfilingMiddleware, span
 
 app = FastAPI()
 
@@ -19,6 +26,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip for remote (ngrok) clients that ask for it; small bodies are sent as-is
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# Opt-in per-request profiling: with GATEWAY_PROFILING=1, send "X-Profile: 1" or ?profile=1
+PROFILING_ENABLED = os.environ.get("GATEWAY_PROFILING", "0") == "1"
+PROFILE_DIR = os.environ.get("GATEWAY_PROFILE_DIR", "profiles")
+app.add_middleware(ProfilingMiddleware, enabled=PROFILING_ENABLED, directory=PROFILE_DIR)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory=os.path.dirname(__file__)), name="static")
 
@@ -26,8 +42,329 @@ app.mount("/static", StaticFiles(directory=os.path.dirname(__file__)), name="sta
 async def get_test_page():
     return FileResponse(os.path.join(os.path.dirname(__file__), "test.html"))
 
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+OLLAMA_API_URL = os.environ.get("OLLAMA_API_URL", "http://localhost:11434/api/generate")
 RAG_API_URL = "http://localhost:8082"
+OLLAMA_BASE_URL = OLLAMA_API_URL.rsplit("/api/", 1)[0]
+
+# Model residency: models kept loaded in Ollama so requests never pay the model load.
+# DEFAULT_MODEL is used when a request names none; RESIDENT_MODELS are preloaded at
+# startup and pinged every OLLAMA_KEEP_ALIVE_INTERVAL seconds; OLLAMA_KEEP_ALIVE is
+# passed on every forwarded request so Ollama doesn't unload them in between.
+DEFAULT_MODEL = os.environ.get("OLLAMA_DEFAULT_MODEL", "mistral")
+RESIDENT_MODELS = [m.strip() for m in os.environ.get("OLLAMA_RESIDENT_MODELS", DEFAULT_MODEL).split(",") if m.strip()]
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_KEEP_ALIVE_INTERVAL = float(os.environ.get("OLLAMA_KEEP_ALIVE_INTERVAL", "240"))
+
+# Chat session limits: Ollama's returned context (token ids) is reused between turns
+# until it grows past CHAT_MAX_CONTEXT_TOKENS, then the session restarts from a
+# window of the most recent turns.
+CHAT_MAX_CONTEXT_TOKENS = int(os.environ.get("CHAT_MAX_CONTEXT_TOKENS", "3072"))
+CHAT_HISTORY_TURNS = int(os.environ.get("CHAT_HISTORY_TURNS", "4"))
+CHAT_HISTORY_MAX_CHARS = int(os.environ.get("CHAT_HISTORY_MAX_CHARS", "6000"))
+
+# Upstream generation counters, exposed at /api/metrics
+GATEWAY_METRICS = {
+    "generations_started": 0,
+    "generations_completed": 0,
+    "generations_cancelled": 0
+}
+# How often non-streaming proxies check whether the client is still connected
+DISCONNECT_POLL_INTERVAL = 0.5
+
+class ClientDisconnected(Exception):
+    pass
+
+async def run_unless_disconnected(request: Request, coro):
+    """Await coro, cancelling it (and so its upstream Ollama request) if the client goes away"""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                print(f"Client {request.client.host} disconnected, aborting upstream Ollama request")
+                GATEWAY_METRICS["generations_cancelled"] += 1
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def ollama_generate(payload: Dict):
+    """Non-streaming call to Ollama; returns (status, json body or error text)"""
+    with span("upstream_wait"):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                OLLAMA_API_URL,
+                json=payload,
+                headers={"Content-Type": "application/json"}
+            ) as response:
+                print(f"Ollama response status: {response.status}")
+                if response.status != 200:
+                    return response.status, await response.text()
+                return response.status, await response.json()
+
+async def proxy_ollama_json(request: Request, payload: Dict):
+    """Forward a non-streaming generate request, giving up if the client disconnects"""
+    GATEWAY_METRICS["generations_started"] += 1
+    try:
+        status, result = await run_unless_disconnected(request, ollama_generate(payload))
+    except ClientDisconnected:
+        # Nobody is listening; 499 mirrors nginx's "client closed request"
+        return Response(status_code=499)
+    if status != 200:
+        print(f"Ollama error: {result}")
+        return JSONResponse(
+            status_code=status,
+            content={"error": f"Ollama API error: {result}"}
+        )
+    GATEWAY_METRICS["generations_completed"] += 1
+    model_residency.mark_used(payload["model"])
+    print(f"Ollama response: {result}")
+    with span("serialize"):
+        return JSONResponse(content=result)
+
+class ModelResidency:
+    """Preloads models in Ollama and keeps them resident with periodic keep-alive pings"""
+
+    def __init__(self, models: List[str], keep_alive: str = OLLAMA_KEEP_ALIVE, interval: float = OLLAMA_KEEP_ALIVE_INTERVAL):
+        self.models = models
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.status: Dict[str, Dict] = {
+            model: {"warm": False, "last_ping": None, "load_seconds": None, "error": None} for model in models
+        }
+        self._task = None
+
+    async def ping(self, session: aiohttp.ClientSession, model: str):
+        # A generate request without a prompt only loads the model (and resets its keep_alive)
+        status = self.status[model]
+        started = time.monotonic()
+        try:
+            async with session.post(
+                OLLAMA_API_URL,
+                json={"model": model, "keep_alive": self.keep_alive, "stream": False}
+            ) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"HTTP {response.status}: {await response.text()}")
+                await response.read()
+            status.update(warm=True, error=None, last_ping=time.time())
+            if status["load_seconds"] is None:
+                status["load_seconds"] = round(time.monotonic() - started, 2)
+                print(f"Model {model} is resident (loaded in {status['load_seconds']}s)")
+        except Exception as e:
+            status.update(warm=False, error=str(e) or type(e).__name__)
+            print(f"Keep-alive for model {model} failed: {status['error']}")
+
+    async def _run(self):
+        timeout = aiohttp.ClientTimeout(total=600)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while True:
+                for model in self.models:
+                    await self.ping(session, model)
+                await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.models and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def mark_used(self, model: str):
+        # A successful request also proves the model is loaded
+        if model in self.status:
+            self.status[model].update(warm=True, error=None, last_ping=time.time())
+
+    async def loaded_models(self) -> List[Dict]:
+        """Models Ollama currently holds in memory, from /api/ps"""
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
+            async with session.get(f"{OLLAMA_BASE_URL}/api/ps") as response:
+                response.raise_for_status()
+                body = await response.json()
+        return [
+            {"name": model.get("name"), "expires_at": model.get("expires_at"), "size_vram": model.get("size_vram")}
+            for model in body.get("models", [])
+        ]
+
+model_residency = ModelResidency(RESIDENT_MODELS)
+
+@app.on_event("startup")
+async def start_model_residency():
+    model_residency.start()
+
+@app.on_event("shutdown")
+async def stop_model_residency():
+    await model_residency.stop()
+
+# Token coalescing for the /chat stream: buffered tokens are sent as one frame once
+# CHAT_FLUSH_CHARS characters have accumulated or CHAT_FLUSH_INTERVAL seconds have
+# passed since the first buffered token. At most CHAT_SEND_QUEUE_SIZE frames wait
+# for a slow client before we stop reading from Ollama.
+CHAT_FLUSH_CHARS = int(os.environ.get("CHAT_FLUSH_CHARS", "64"))
+CHAT_FLUSH_INTERVAL = float(os.environ.get("CHAT_FLUSH_INTERVAL", "0.05"))
+CHAT_SEND_QUEUE_SIZE = int(os.environ.get("CHAT_SEND_QUEUE_SIZE", "32"))
+
+class CoalescingSender:
+    """Batches token fragments into websocket frames with a bounded send queue"""
+
+    def __init__(self, websocket: WebSocket, flush_chars: int = CHAT_FLUSH_CHARS,
+                 flush_interval: float = CHAT_FLUSH_INTERVAL, queue_size: int = CHAT_SEND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.flush_chars = flush_chars
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.frames = 0
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._flush_timer: Optional[asyncio.Task] = None
+        self._sender_task = asyncio.create_task(self._send_loop())
+
+    async def add(self, text: str):
+        if not self._buffer:
+            # One-shot timer per buffered batch, so an idle connection has nothing waking up
+            self._flush_timer = asyncio.create_task(self._flush_later())
+        self._buffer.append(text)
+        self._buffered_chars += len(text)
+        if self._buffered_chars >= self.flush_chars:
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        frame = "".join(self._buffer)
+        self._buffer = []
+        self._buffered_chars = 0
+        self._cancel_flush_timer()
+        await self._enqueue(frame)
+
+    async def send(self, text: str):
+        """Flush pending tokens, then send text as its own frame (e.g. the [DONE] marker)"""
+        await self.flush()
+        await self._enqueue(text)
+
+    def _raise_if_stopped(self):
+        if self._sender_task.done():
+            # Surface send failures (e.g. a disconnected client) to the reading loop
+            self._sender_task.result()
+            raise RuntimeError("Chat sender stopped")
+
+    async def _enqueue(self, frame):
+        self._raise_if_stopped()
+        try:
+            self.queue.put_nowait(frame)
+            return
+        except asyncio.QueueFull:
+            pass
+        # Blocks while the client is behind, which in turn stops us reading from Ollama,
+        # but gives up if the sender dies meanwhile and can no longer make room
+        put = asyncio.ensure_future(self.queue.put(frame))
+        await asyncio.wait({put, self._sender_task}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            self._raise_if_stopped()
+
+    async def _send_loop(self):
+        while True:
+            frame = await self.queue.get()
+            if frame is None:
+                break
+            await self.websocket.send_text(frame)
+            self.frames += 1
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        # Detach first so the flush below doesn't cancel this task
+        self._flush_timer = None
+        try:
+            await self.flush()
+        except Exception:
+            # The sender has stopped; the reading loop gets the error on its next add/send
+            pass
+
+    def _cancel_flush_timer(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    async def close(self, drain: bool = True):
+        """Stop sending, after the queued frames have gone out when drain is set"""
+        timer = self._flush_timer
+        self._cancel_flush_timer()
+        if timer is not None:
+            try:
+                await timer
+            except asyncio.CancelledError:
+                pass
+        if drain:
+            try:
+                await self._enqueue(None)
+            except Exception:
+                pass
+        else:
+            self._sender_task.cancel()
+        try:
+            await self._sender_task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+class ChatSession:
+    """Per-connection conversation state for the /chat websocket"""
+
+    def __init__(self, model: str = DEFAULT_MODEL):
+        self.model = model
+        self.context: List[int] = []
+        self.turns: List[tuple] = []
+
+    def build_request(self, message: str) -> Dict:
+        if self.context:
+            # Ollama only evaluates the new prompt tokens on top of the cached context
+            return {"model": self.model, "prompt": message, "stream": True, "context": self.context, "keep_alive": OLLAMA_KEEP_ALIVE}
+        return {"model": self.model, "prompt": self._windowed_prompt(message), "stream": True, "keep_alive": OLLAMA_KEEP_ALIVE}
+
+    def _windowed_prompt(self, message: str) -> str:
+        if not self.turns:
+            return message
+        transcript = ""
+        for user_text, assistant_text in reversed(self.turns):
+            turn = f"User: {user_text}\nAssistant: {assistant_text}\n\n"
+            if len(transcript) + len(turn) > CHAT_HISTORY_MAX_CHARS:
+                break
+            transcript = turn + transcript
+        return f"Conversation so far:\n\n{transcript}User: {message}\nAssistant:"
+
+    def record(self, message: str, answer: str, context: List[int]):
+        self.turns = (self.turns + [(message, answer)])[-CHAT_HISTORY_TURNS:]
+        if context and len(context) <= CHAT_MAX_CONTEXT_TOKENS:
+            self.context = context
+        else:
+            if context:
+                print(f"Chat context reached {len(context)} tokens, restarting from the last {len(self.turns)} turns")
+            self.context = []
+
+async def forward_rag_json(request: Request, path: str):
+    # Relay rag_backend's JSON bytes as-is rather than decoding and re-encoding them here
+    body = await request.body()
+    with span("upstream_wait"):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{RAG_API_URL}{path}",
+                data=body,
+                # Loopback hop: fetch uncompressed and let this gateway compress for the remote client
+                headers={"Content-Type": "application/json", "Accept-Encoding": "identity"}
+            ) as response:
+                content = await response.read()
+    return Response(
+        content=content,
+        status_code=response.status,
+        media_type=response.headers.get("Content-Type", "application/json")
+    )
 
 # Proxy endpoint for RAG queries
 @app.options("/api/rag/query")
@@ -36,33 +373,116 @@ async def options_rag_query():
 
 @app.post("/api/rag/query")
 async def proxy_rag_query(request: Request):
-    body = await request.json()
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{RAG_API_URL}/query", json=body) as response:
-            result = await response.json()
-            return result
+    return await forward_rag_json(request, "/query")
+
+# Streaming (NDJSON) variant for large result sets; lines are relayed as rag_backend produces them
+@app.options("/api/rag/query/stream")
+async def options_rag_query_stream():
+    return {"message": "OK"}
+
+@app.post("/api/rag/query/stream")
+async def proxy_rag_query_stream(request: Request):
+    body = await request.body()
+    session = aiohttp.ClientSession()
+    try:
+        with span("upstream_wait"):
+            response = await session.post(
+                f"{RAG_API_URL}/query/stream",
+                data=body,
+                headers={"Content-Type": "application/json", "Accept-Encoding": "identity"}
+            )
+    except Exception:
+        await session.close()
+        raise
+    if response.status != 200:
+        content = await response.read()
+        response.close()
+        await session.close()
+        return Response(content=content, status_code=response.status, media_type=response.headers.get("Content-Type"))
+    return StreamingResponse(relay_rag_stream(session, response), media_type="application/x-ndjson")
+
+# Proxy endpoint for token-budgeted RAG context assembly
+@app.options("/api/rag/context")
+async def options_rag_context():
+    return {"message": "OK"}
+
+@app.post("/api/rag/context")
+async def proxy_rag_context(request: Request):
+    return await forward_rag_json(request, "/context")
 
 # Proxy endpoint for RAG document downloads
-@app.get("/api/rag/download/{filename}")
-async def proxy_rag_download(filename: str):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{RAG_API_URL}/download/{filename}") as response:
-            if response.status != 200:
-                return JSONResponse(
-                    status_code=response.status,
-                    content={"detail": "Error downloading document"}
-                )
-            content = await response.read()
-            headers = {
-                "Content-Disposition": response.headers.get("Content-Disposition", f"attachment; filename={filename}"),
-                "Content-Type": response.headers.get("Content-Type", "application/octet-stream")
-            }
-            return Response(content=content, headers=headers)
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+# Request headers passed to rag_backend so Range requests and revalidation work end to end
+DOWNLOAD_REQUEST_HEADERS = ("Range", "If-Range", "If-None-Match")
+DOWNLOAD_RESPONSE_HEADERS = ("Content-Disposition", "Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "ETag")
+
+async def relay_rag_stream(session, response):
+    # Relay bytes as they arrive instead of buffering the whole body in gateway memory
+    try:
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            yield chunk
+    finally:
+        response.close()
+        await session.close()
+
+@app.get("/api/rag/download/{filename:path}")
+async def proxy_rag_download(filename: str, request: Request):
+    forward_headers = {
+        name: request.headers[name] for name in DOWNLOAD_REQUEST_HEADERS if name in request.headers
+    }
+    # Bytes are relayed without decoding, so make sure rag_backend does not encode them
+    forward_headers["Accept-Encoding"] = "identity"
+    session = aiohttp.ClientSession(auto_decompress=False)
+    try:
+        with span("upstream_wait"):
+            response = await session.get(f"{RAG_API_URL}/download/{quote(filename)}", headers=forward_headers)
+    except Exception:
+        await session.close()
+        raise
+
+    if response.status not in (200, 206, 304):
+        response.close()
+        await session.close()
+        return JSONResponse(
+            status_code=response.status,
+            content={"detail": "Error downloading document"}
+        )
+
+    headers = {name: response.headers[name] for name in DOWNLOAD_RESPONSE_HEADERS if name in response.headers}
+    headers.setdefault("Content-Disposition", f"attachment; filename={filename}")
+    if response.status == 304:
+        response.close()
+        await session.close()
+        return Response(status_code=304, headers=headers)
+    return StreamingResponse(
+        relay_rag_stream(session, response),
+        status_code=response.status,
+        headers=headers
+    )
 
 @app.get("/")
 async def read_root():
     return {"status": "healthy"}
 
+@app.get("/api/metrics")
+async def gateway_metrics():
+    return GATEWAY_METRICS
+
+@app.get("/api/models/warm")
+async def warm_models():
+    """Configured resident models and what Ollama actually has loaded"""
+    try:
+        loaded = await model_residency.loaded_models()
+    except Exception as e:
+        loaded = None
+        print(f"Could not list loaded Ollama models: {str(e)}")
+    return {
+        "default_model": DEFAULT_MODEL,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "models": model_residency.status,
+        "loaded": loaded
+    }
+
 # Proxy endpoint for Ollama API
 @app.options("/api/generate")
 async def options_generate():
@@ -119,43 +539,51 @@ async def proxy_ollama_generate(request: Request):
                 )
         
         # Extract parameters
-        model = json_data.get("model", "mistral")
+        model = json_data.get("model", DEFAULT_MODEL)
         prompt = json_data.get("prompt", "")
         stream = json_data.get("stream", False)
         
         print(f"Model: {model}, Stream: {stream}, Prompt length: {len(prompt)}")
         
-        # Forward the request to Ollama
-        async with aiohttp.ClientSession() as session:
-            ollama_url = "http://localhost:11434/api/generate"
-            print(f"Forwarding request to Ollama at {ollama_url}")
-            
-            async with session.post(
-                ollama_url,
-                json={"model": model, "prompt": prompt, "stream": stream},
-                headers={"Content-Type": "application/json"}
-            ) as response:
-                print(f"Ollama response status: {response.status}")
-                
-                if response.status != 200:
-                    error_text = await response.text()
-                    print(f"Ollama error: {error_text}")
-                    return JSONResponse(
-                        status_code=response.status,
-                        content={"error": f"Ollama API error: {error_text}"}
-                    )
-                
-                if stream:
-                    print("Processing streaming response")
-                    return StreamingResponse(
-                        stream_ollama_response(response),
-                        media_type="text/event-stream"
-                    )
-                else:
-                    print("Processing non-streaming response")
-                    response_json = await response.json()
-                    print(f"Ollama response: {response_json}")
-                    return JSONResponse(content=response_json)
+        payload = {"model": model, "prompt": prompt, "stream": stream, "keep_alive": json_data.get("keep_alive", OLLAMA_KEEP_ALIVE)}
+        print(f"Forwarding request to Ollama at {OLLAMA_API_URL}")
+
+        if not stream:
+            print("Processing non-streaming response")
+            return await proxy_ollama_json(request, payload)
+
+        # Forward the request to Ollama; the stream generator owns the upstream
+        # session so it can abort generation if the client goes away
+        session = aiohttp.ClientSession()
+        try:
+            # Time until Ollama starts answering (response headers)
+            with span("upstream_wait"):
+                response = await session.post(
+                    OLLAMA_API_URL,
+                    json=payload,
+                    headers={"Content-Type": "application/json"}
+                )
+        except Exception:
+            await session.close()
+            raise
+        print(f"Ollama response status: {response.status}")
+
+        if response.status != 200:
+            error_text = await response.text()
+            response.close()
+            await session.close()
+            print(f"Ollama error: {error_text}")
+            return JSONResponse(
+                status_code=response.status,
+                content={"error": f"Ollama API error: {error_text}"}
+            )
+
+        print("Processing streaming response")
+        GATEWAY_METRICS["generations_started"] += 1
+        return StreamingResponse(
+            stream_ollama_response(session, response, model),
+            media_type="text/event-stream"
+        )
     except Exception as e:
         print(f"Exception in proxy_ollama_generate: {str(e)}")
         import traceback
@@ -165,70 +593,107 @@ async def proxy_ollama_generate(request: Request):
             content={"error": f"Internal server error: {str(e)}"}
         )
 
+async def stream_chat_reply(chat: ChatSession, sender: CoalescingSender, message: str):
+    """Stream one Ollama answer to the websocket; cancelled if the client disconnects"""
+    response_sent = False
+    frames_before = sender.frames
+
+    # Prepare the request to Ollama, continuing this connection's conversation
+    data = chat.build_request(message)
+    answer = ""
+    GATEWAY_METRICS["generations_started"] += 1
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(OLLAMA_API_URL, json=data) as response:
+                print("Started receiving response from Ollama")  # Debug log
+                async for line in response.content:
+                    if line:
+                        try:
+                            json_response = json.loads(line.decode('utf-8'))
+                            if 'response' in json_response:
+                                response_text = json_response['response']
+                                answer += response_text
+                                if response_text:
+                                    await sender.add(response_text)
+                                    response_sent = True
+                            if json_response.get('done', False):
+                                print("Received done signal from Ollama")  # Debug log
+                                chat.record(message, answer, json_response.get('context', []))
+                                await sender.send("[DONE]")
+                                print(f"Queued [DONE] marker to client after {sender.frames - frames_before} frames")  # Debug log
+                                response_sent = False  # Reset for next message
+                                break  # Exit the loop after sending [DONE]
+                        except json.JSONDecodeError:
+                            continue
+                
+                # Double check to ensure [DONE] is sent if we got any response
+                if response_sent:
+                    print("Sending final [DONE] marker")  # Debug log
+                    await sender.send("[DONE]")
+        GATEWAY_METRICS["generations_completed"] += 1
+        model_residency.mark_used(chat.model)
+    except asyncio.CancelledError:
+        # Leaving the aiohttp context mid-stream drops the upstream connection
+        GATEWAY_METRICS["generations_cancelled"] += 1
+        print("Client disconnected, aborted Ollama generation")  # Debug log
+        raise
+    except Exception as e:
+        print(f"Error in Ollama communication: {str(e)}")
+        if response_sent:
+            await sender.send("[DONE]")
+        raise  # Re-raise the exception to be caught by the websocket loop
+
 @app.websocket("/chat")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    chat = ChatSession()
+    sender = CoalescingSender(websocket)
+    pending_messages: List[str] = []
+    disconnected = False
     
     try:
         while True:
             try:
                 # Receive message from client
-                message = await websocket.receive_text()
+                message = pending_messages.pop(0) if pending_messages else await websocket.receive_text()
                 print(f"Received message from client: {message}")  # Debug log
-                response_sent = False
                 
-                # Prepare the request to Ollama
-                data = {
-                    "model": "mistral",
-                    "prompt": message,
-                    "stream": True,
-                    "context": []  # Reset context for each message
-                }
-                
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.post(OLLAMA_API_URL, json=data) as response:
-                            print("Started receiving response from Ollama")  # Debug log
-                            async for line in response.content:
-                                if line:
-                                    try:
-                                        json_response = json.loads(line.decode('utf-8'))
-                                        if 'response' in json_response:
-                                            response_text = json_response['response']
-                                            if response_text.strip():  # Only send non-empty responses
-                                                await websocket.send_text(response_text)
-                                                response_sent = True
-                                        if json_response.get('done', False):
-                                            print("Received done signal from Ollama")  # Debug log
-                                            await websocket.send_text("[DONE]")
-                                            print("Sent [DONE] marker to client")  # Debug log
-                                            response_sent = False  # Reset for next message
-                                            break  # Exit the loop after sending [DONE]
-                                    except json.JSONDecodeError:
-                                        continue
-                            
-                            # Double check to ensure [DONE] is sent if we got any response
-                            if response_sent:
-                                print("Sending final [DONE] marker")  # Debug log
-                                await websocket.send_text("[DONE]")
-                                await asyncio.sleep(0.1)  # Small delay to ensure [DONE] is received
-                except Exception as e:
-                    print(f"Error in Ollama communication: {str(e)}")
-                    if response_sent:
-                        await websocket.send_text("[DONE]")
-                    raise  # Re-raise the exception to be caught by outer try-except
+                generation = asyncio.create_task(stream_chat_reply(chat, sender, message))
+                # Keep reading the socket while generating so a closed tab aborts the upstream request
+                while not generation.done():
+                    receiver = asyncio.create_task(websocket.receive())
+                    done, _ = await asyncio.wait({generation, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                    if receiver not in done:
+                        receiver.cancel()
+                        continue
+                    event = receiver.result()
+                    if event["type"] == "websocket.disconnect":
+                        generation.cancel()
+                        try:
+                            await generation
+                        except asyncio.CancelledError:
+                            pass
+                        raise WebSocketDisconnect(event.get("code", 1000))
+                    if event.get("text") is not None:
+                        # Client sent its next message early; answer it after this one
+                        pending_messages.append(event["text"])
+                await generation
                                     
             except WebSocketDisconnect:
                 print("WebSocket disconnected")  # Debug log
+                disconnected = True
                 break
             except Exception as e:
                 print(f"Error processing message: {str(e)}")
-                await websocket.send_text(f"Error: {str(e)}")
-                await websocket.send_text("[DONE]")
+                await sender.send(f"Error: {str(e)}")
+                await sender.send("[DONE]")
                     
     except Exception as e:
         print(f"WebSocket Error: {str(e)}")
     finally:
+        # Drain queued frames before closing, unless nobody is left to read them
+        await sender.close(drain=not disconnected)
         try:
             await websocket.close()
         except:
@@ -272,7 +737,7 @@ async def api_proxy_page():
         <h1>API Proxy</h1>
         <p>Enter your JSON request below:</p>
         <textarea id="requestData">{
-  "model": "mistral",
+  "model": "__DEFAULT_MODEL__",
   "prompt": "Say hello briefly",
   "stream": false
 }</textarea>
@@ -311,13 +776,25 @@ async def api_proxy_page():
     </body>
     </html>
     """
-    return HTMLResponse(content=html_content)
+    return HTMLResponse(content=html_content.replace("__DEFAULT_MODEL__", DEFAULT_MODEL))
 
 # Function to stream Ollama API responses
-async def stream_ollama_response(response):
-    async for chunk in response.content.iter_any():
-        if chunk:
-            yield chunk
+async def stream_ollama_response(session, response, model: str):
+    # Starlette cancels this generator when the client disconnects; closing an
+    # unfinished upstream response drops the connection, which stops Ollama generating
+    try:
+        async for chunk in response.content.iter_any():
+            if chunk:
+                yield chunk
+        GATEWAY_METRICS["generations_completed"] += 1
+        model_residency.mark_used(model)
+    except (asyncio.CancelledError, GeneratorExit):
+        GATEWAY_METRICS["generations_cancelled"] += 1
+        print("Client disconnected mid-stream, aborting upstream Ollama generation")
+        raise
+    finally:
+        response.close()
+        await session.close()
 
 # Add a proxy endpoint for fetch requests
 @app.post("/api/proxy/fetch")
@@ -330,37 +807,17 @@ async def proxy_fetch(request: Request):
         print(f"Request body: {body}")
         
         # Extract parameters
-        model = body.get("model", "mistral")
+        model = body.get("model", DEFAULT_MODEL)
         prompt = body.get("prompt", "")
         stream = body.get("stream", False)
         
         print(f"Model: {model}, Stream: {stream}, Prompt length: {len(prompt)}")
         
-        # Forward the request to Ollama
-        async with aiohttp.ClientSession() as session:
-            ollama_url = "http://localhost:11434/api/generate"
-            print(f"Forwarding request to Ollama at {ollama_url}")
-            
-            async with session.post(
-                ollama_url,
-                json={"model": model, "prompt": prompt, "stream": stream},
-                headers={"Content-Type": "application/json"}
-            ) as response:
-                print(f"Ollama response status: {response.status}")
-                
-                if response.status != 200:
-                    error_text = await response.text()
-                    print(f"Ollama error: {error_text}")
-                    return JSONResponse(
-                        status_code=response.status,
-                        content={"error": f"Ollama API error: {error_text}"}
-                    )
-                
-                # For non-streaming responses
-                print("Processing non-streaming response")
-                response_json = await response.json()
-                print(f"Ollama response: {response_json}")
-                return JSONResponse(content=response_json)
+        # Forward the request to Ollama (non-streaming), cancelled if the client disconnects
+        print(f"Forwarding request to Ollama at {OLLAMA_API_URL}")
+        return await proxy_ollama_json(request, {
+            "model": model, "prompt": prompt, "stream": stream, "keep_alive": body.get("keep_alive", OLLAMA_KEEP_ALIVE)
+        })
     except Exception as e:
         print(f"Exception in proxy_fetch: {str(e)}")
         import traceback
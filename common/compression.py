@@ -0,0 +1,170 @@
+import zlib
+from typing import List, Optional, Tuple
+
+# Shared by backend/ and rag_backend/; each service puts the repo root on sys.path.
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+
+# Appended inside the quotes of a compressed response's ETag, since its bytes differ from the identity body
+ETAG_SUFFIX = b"-gzip"
+
+def gzip_quality(accept_encoding: str) -> float:
+    """q-value the client gives gzip in an Accept-Encoding header (0 = not acceptable)"""
+    gzip_q = star_q = None
+    for part in accept_encoding.split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        coding = coding.lower()
+        if coding in ("gzip", "x-gzip"):
+            gzip_q = q
+        elif coding == "*":
+            star_q = q
+    if gzip_q is not None:
+        return gzip_q
+    return star_q or 0.0
+
+def _with_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    """Add Accept-Encoding to the Vary header, keeping whatever it already lists"""
+    for i, (name, value) in enumerate(headers):
+        if name == b"vary":
+            if b"accept-encoding" in value.lower() or value.strip() == b"*":
+                return headers
+            return headers[:i] + [(b"vary", value + b", Accept-Encoding")] + headers[i + 1:]
+    return headers + [(b"vary", b"Accept-Encoding")]
+
+def _strip_etag_suffix(value: bytes) -> Optional[bytes]:
+    """If-None-Match with our compressed ETags turned back into the identity ones, or None if it had none"""
+    tags = [tag.strip() for tag in value.split(b",")]
+    marker = ETAG_SUFFIX + b'"'
+    if not any(tag.endswith(marker) for tag in tags):
+        return None
+    return b", ".join(tag[:-len(marker)] + b'"' if tag.endswith(marker) else tag for tag in tags)
+
+def _tag_etag(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    """Give the ETag a -gzip suffix so the compressed and identity bodies never share a validator"""
+    tagged = []
+    for name, value in headers:
+        if name == b"etag" and value.endswith(b'"') and not value.endswith(ETAG_SUFFIX + b'"'):
+            value = value[:-1] + ETAG_SUFFIX + b'"'
+        tagged.append((name, value))
+    return tagged
+
+class CompressionMiddleware:
+    """Negotiated gzip compression that also works for streaming responses.
+
+    Complete bodies smaller than minimum_size are sent as-is. Streaming bodies
+    are compressed chunk by chunk with a sync flush after each one, so tokens
+    and NDJSON lines still reach the client as soon as they are produced
+    instead of sitting in the compressor's buffer. Every compressible response
+    carries Vary: Accept-Encoding, whether or not it was compressed.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, compresslevel: int = 6):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepts_gzip = self._accepts_gzip(scope)
+        revalidating = False
+        if accepts_gzip:
+            # The app only knows its identity ETags; map the compressed ones back for its If-None-Match check
+            headers = []
+            for name, value in scope.get("headers", []):
+                if name == b"if-none-match":
+                    stripped = _strip_etag_suffix(value)
+                    if stripped is not None:
+                        value, revalidating = stripped, True
+                headers.append((name, value))
+            scope = dict(scope, headers=headers)
+        responder = _GzipResponder(send, self.minimum_size, self.compresslevel, accepts_gzip, revalidating)
+        await self.app(scope, receive, responder.send)
+
+    @staticmethod
+    def _accepts_gzip(scope) -> bool:
+        values = [value.decode("latin-1") for name, value in scope.get("headers", []) if name == b"accept-encoding"]
+        return bool(values) and gzip_quality(",".join(values)) > 0
+
+class _GzipResponder:
+    def __init__(self, send, minimum_size: int, compresslevel: int, accepts_gzip: bool = True, revalidating: bool = False):
+        self._send = send
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.accepts_gzip = accepts_gzip
+        self.revalidating = revalidating
+        self._start = None
+        self._compressor = None
+        self._passthrough = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            if message.get("status") == 304 and self.revalidating:
+                # The client revalidated its compressed copy, so confirm it under that copy's ETag
+                message = dict(message, headers=_tag_etag(message.get("headers", [])))
+            self._start = message
+            compressible = self._compressible(message)
+            self._passthrough = not (compressible and self.accepts_gzip)
+            if self._passthrough:
+                if compressible:
+                    message = dict(message, headers=_with_vary(list(message.get("headers", []))))
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._compressor is None:
+            if not more_body and len(body) < self.minimum_size:
+                # Small complete response: not worth compressing, but caches still need to know it varies
+                self._passthrough = True
+                await self._send(dict(self._start, headers=_with_vary(list(self._start.get("headers", [])))))
+                await self._send(message)
+                return
+            self._compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 31)
+            headers = [(name, value) for name, value in self._start["headers"] if name != b"content-length"]
+            headers = _with_vary(_tag_etag(headers))
+            headers.append((b"content-encoding", b"gzip"))
+            if not more_body:
+                compressed = self._compressor.compress(body) + self._compressor.flush()
+                headers.append((b"content-length", str(len(compressed)).encode()))
+                await self._send(dict(self._start, headers=headers))
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            await self._send(dict(self._start, headers=headers))
+
+        if more_body:
+            chunk = self._compressor.compress(body) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        else:
+            chunk = self._compressor.compress(body) + self._compressor.flush()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    @staticmethod
+    def _compressible(start) -> bool:
+        if start.get("status") in (204, 206, 304):
+            return False
+        content_type = b""
+        for name, value in start.get("headers", []):
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value
+        return content_type.decode("latin-1").lower().startswith(COMPRESSIBLE_TYPES)
@@ -0,0 +1,128 @@
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+# Shared by backend/ and rag_backend/; each service puts the repo root on sys.path.
+
+class RequestProfile:
+    """Timing spans (and optionally a cProfile) collected for one request"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+
+    def add_span(self, name: str, start: float, end: float):
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3)
+        })
+
+    def totals(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span["name"]] = round(totals.get(span["name"], 0.0) + span["duration_ms"], 3)
+        return totals
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+_NO_SPAN = contextlib.nullcontext()
+
+@contextlib.contextmanager
+def _timed_span(profile: RequestProfile, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_span(name, start, time.perf_counter())
+
+def span(name: str):
+    """Time a stage of the current request; a shared no-op unless the request is being profiled"""
+    profile = _current_profile.get()
+    if profile is None:
+        return _NO_SPAN
+    return _timed_span(profile, name)
+
+class ProfilingMiddleware:
+    """Opt-in per-request profiling.
+
+    When enabled, a request sending "X-Profile: 1" or "?profile=1" is run under
+    cProfile and its spans are collected; <directory>/<request id>.prof (pstats)
+    and <request id>.json (spans) are written when it finishes. cProfile only
+    sees the event loop thread, and sees any other request interleaved there,
+    so only one request is profiled with cProfile at a time; threadpool work
+    shows up through spans. When disabled this adds one attribute check per
+    request.
+    """
+
+    def __init__(self, app, enabled: bool = False, directory: str = "profiles"):
+        self.app = app
+        self.enabled = enabled
+        self.directory = directory
+        self._profiler_lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1") or uuid.uuid4().hex
+        profile = RequestProfile(request_id)
+        status = {}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"x-profile-id", request_id.encode("latin-1"))])
+            await send(message)
+
+        profiler = cProfile.Profile() if self._profiler_lock.acquire(blocking=False) else None
+        token = _current_profile.set(profile)
+        try:
+            if profiler is not None:
+                profiler.enable()
+            await self.app(scope, receive, send_with_id)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiler_lock.release()
+            _current_profile.reset(token)
+            self._save(scope, profile, profiler, status.get("code"))
+
+    @staticmethod
+    def _requested(scope) -> bool:
+        if parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile") == ["1"]:
+            return True
+        for name, value in scope.get("headers", []):
+            if name == b"x-profile":
+                return value in (b"1", b"true")
+        return False
+
+    def _save(self, scope, profile: RequestProfile, profiler, status_code):
+        os.makedirs(self.directory, exist_ok=True)
+        # Request ids may come from the client, keep them filename-safe
+        safe_id = "".join(c for c in profile.request_id if c.isalnum() or c in "-_")[:64] or uuid.uuid4().hex
+        base = os.path.join(self.directory, safe_id)
+        if profiler is not None:
+            profiler.dump_stats(base + ".prof")
+        report = {
+            "request_id": profile.request_id,
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "status": status_code,
+            "total_ms": round((time.perf_counter() - profile.started) * 1000, 3),
+            "cprofile": base + ".prof" if profiler is not None else None,
+            "span_totals_ms": profile.totals(),
+            "spans": profile.spans
+        }
+        with open(base + ".json", "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved request profile {base}.json ({report['total_ms']}ms, spans: {report['span_totals_ms']})")
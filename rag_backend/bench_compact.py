@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+import compact_index
+from bench_query import EMBEDDING_DIM, percentile
+
+# Memory / recall / latency trade-off of the compact tier against exact float32 search
+# and against Chroma's own HNSW index, which is what a query without the tier uses.
+# Runs on synthetic clustered vectors by default, or on a real collection with --collection.
+
+class ArraySource:
+    """Serves vectors the way Collection.get() pages them, so build_index can read synthetic data"""
+
+    def __init__(self, vectors: np.ndarray, name: str = "synthetic"):
+        self.vectors = vectors
+        self.name = name
+
+    def count(self) -> int:
+        return len(self.vectors)
+
+    def get(self, include: List[str], limit: int, offset: int) -> Dict:
+        end = min(offset + limit, len(self.vectors))
+        return {"ids": [f"v-{i}" for i in range(offset, end)], "embeddings": self.vectors[offset:end]}
+
+def clustered_vectors(rng: np.random.Generator, count: int, dim: int = EMBEDDING_DIM, clusters: int = 1000) -> np.ndarray:
+    """Unit vectors around random topic centres, closer to real embeddings than uniform noise"""
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 100000):
+        end = min(start + 100000, count)
+        vectors[start:end] = centres[rng.integers(0, clusters, end - start)]
+        vectors[start:end] += 0.4 * rng.standard_normal((end - start, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def exact_top_k(index: compact_index.CompactIndex, queries: np.ndarray, k: int, space: str) -> List[set]:
+    """Ground truth ids by brute force over the float32 vectors, scanned in blocks"""
+    full = index.full
+    best_rows = [np.zeros(0, dtype=np.int64) for _ in queries]
+    best_distances = [np.zeros(0, dtype=np.float32) for _ in queries]
+    query_norms = np.linalg.norm(queries, axis=1)
+    for start in range(0, len(full), compact_index.SCAN_BLOCK_ROWS):
+        block = np.asarray(full[start:start + compact_index.SCAN_BLOCK_ROWS], dtype=np.float32)
+        for i, query in enumerate(queries):
+            distances = compact_index._exact_distances(block, query, space, float(query_norms[i]))
+            rows = np.arange(start, start + len(block))
+            keep = np.argsort(distances)[:k]
+            merged_rows = np.concatenate([best_rows[i], rows[keep]])
+            merged_distances = np.concatenate([best_distances[i], distances[keep]])
+            order = np.argsort(merged_distances)[:k]
+            best_rows[i], best_distances[i] = merged_rows[order], merged_distances[order]
+    return [{index.id_at(int(row)) for row in rows} for rows in best_rows]
+
+def load_into_chroma(db_path: str, vectors: np.ndarray, space: str, batch_size: int = 5000):
+    """Copy synthetic vectors into a throwaway Chroma collection so its HNSW index can be measured"""
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=db_path).create_collection(name="bench-hnsw", metadata={"hnsw:space": space})
+    for start in range(0, len(vectors), batch_size):
+        end = min(start + batch_size, len(vectors))
+        collection.add(ids=[f"v-{i}" for i in range(start, end)], embeddings=vectors[start:end].tolist())
+    return collection
+
+def hnsw_index_bytes(db_path: str, collection) -> int:
+    """Size of the collection's HNSW files, which hnswlib reads into memory whole"""
+    with sqlite3.connect(os.path.join(db_path, "chroma.sqlite3")) as conn:
+        rows = conn.execute("SELECT id FROM segments WHERE collection = ? AND scope = 'VECTOR'", (str(collection.id),)).fetchall()
+    total = 0
+    for (segment_id,) in rows:
+        directory = os.path.join(db_path, segment_id)
+        if os.path.isdir(directory):
+            total += sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    return total
+
+def bench_hnsw(collection, db_path: str, queries: np.ndarray, truth: List[set], k: int) -> Dict:
+    # The first query loads the index from disk; time it separately from the steady state
+    started = time.perf_counter()
+    collection.query(query_embeddings=[queries[0].tolist()], n_results=k, include=["distances"])
+    load_ms = (time.perf_counter() - started) * 1000
+    latencies = []
+    recall = 0.0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        results = collection.query(query_embeddings=[query.tolist()], n_results=k, include=["distances"])
+        latencies.append((time.perf_counter() - started) * 1000)
+        recall += len(set(results["ids"][0]) & expected) / k
+    latencies.sort()
+    return {
+        "index_mb": round(hnsw_index_bytes(db_path, collection) / 2 ** 20, 2),
+        "first_query_ms": round(load_ms, 2),
+        "recall_at_k": round(recall / len(queries), 4),
+        "latency_p50_ms": percentile(latencies, 50),
+        "latency_p95_ms": percentile(latencies, 95)
+    }
+
+def bench_mode(index: compact_index.CompactIndex, queries: np.ndarray, truth: List[set], k: int, rescore_factor: int) -> Dict:
+    latencies = []
+    recall = 0.0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        ids, _ = index.search(query, k, rescore_factor)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recall += len(set(ids) & expected) / k
+    latencies.sort()
+    return {
+        "rescore_factor": rescore_factor,
+        "recall_at_k": round(recall / len(queries), 4),
+        "latency_p50_ms": percentile(latencies, 50),
+        "latency_p95_ms": percentile(latencies, 95)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compact (quantized) vector tier: memory, recall@k and latency")
+    parser.add_argument("--collection", default=None, help="Benchmark a real collection instead of synthetic vectors")
+    parser.add_argument("--db", default="./db", help="ChromaDB directory for --collection (default: ./db)")
+    parser.add_argument("--size", type=int, default=200000, help="Synthetic vectors (ignored with --collection)")
+    parser.add_argument("--modes", default=",".join(compact_index.MODES), help="Subset of: " + ", ".join(compact_index.MODES))
+    parser.add_argument("--pca-dim", type=int, default=compact_index.DEFAULT_PCA_DIM)
+    parser.add_argument("--rescore-factors", default="1,5,10,20", help="Candidates re-scored per result")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--recall-tolerance", type=float, default=0.01, help="Allowed recall@k loss against exact search")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-hnsw", action="store_true", help="Don't measure Chroma's HNSW index (loading synthetic vectors takes a while)")
+    parser.add_argument("--output", default=None, help="Write results as JSON (default: bench_compact_<timestamp>.json)")
+    args = parser.parse_args()
+    modes = [mode for mode in args.modes.split(",") if mode]
+    factors = [int(factor) for factor in args.rescore_factors.split(",") if factor]
+    rng = np.random.default_rng(args.seed)
+
+    if args.collection:
+        import chromadb
+        import index_config
+
+        collection = chromadb.PersistentClient(path=args.db).get_collection(name=args.collection)
+        source, space = collection, index_config.current_config(collection)["space"]
+        hnsw_db = args.db
+    else:
+        print(f"Generating {args.size} synthetic vectors...")
+        source, space = ArraySource(clustered_vectors(rng, args.size)), "cosine"
+        collection = hnsw_db = None
+
+    work_dir = tempfile.mkdtemp(prefix="rag_compact_bench_")
+    report = {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args), "space": space, "results": {}}
+    try:
+        queries = truth = None
+        for mode in modes:
+            directory = os.path.join(work_dir, mode)
+            meta = compact_index.build_index(source, directory, mode, space, args.pca_dim)
+            index = compact_index.CompactIndex(directory)
+            if queries is None:
+                # Queries near stored vectors, so each has real neighbours; truth comes from the float32 copy
+                picked = np.sort(rng.choice(index.count, size=min(args.queries, index.count), replace=False))
+                queries = np.asarray(index.full[picked], dtype=np.float32)
+                queries += 0.05 * rng.standard_normal(queries.shape, dtype=np.float32) * np.abs(queries).mean()
+                print(f"Computing exact top-{args.k} for {len(queries)} queries...")
+                truth = exact_top_k(index, queries, args.k, space)
+
+            runs = [bench_mode(index, queries, truth, args.k, factor) for factor in factors]
+            result = {
+                "vectors": meta["count"],
+                "code_dim": meta["code_dim"],
+                "build_seconds": meta["seconds"],
+                "compact_mb": round(index.memory_bytes() / 2 ** 20, 2),
+                "float32_mb": round(meta["float32_bytes"] / 2 ** 20, 2),
+                "reduction": round(meta["float32_bytes"] / max(index.memory_bytes(), 1), 2),
+                "runs": runs,
+                # Smallest re-scoring depth that keeps recall within the tolerance of exact search
+                "rescore_factor_within_tolerance": next(
+                    (run["rescore_factor"] for run in runs if run["recall_at_k"] >= 1.0 - args.recall_tolerance), None
+                )
+            }
+            report["results"][mode] = result
+            print(f"{mode:<8} {result['compact_mb']}MB vs {result['float32_mb']}MB float32 ({result['reduction']}x), "
+                  f"within tolerance from rescore factor {result['rescore_factor_within_tolerance']}")
+            for run in runs:
+                print(f"         rescore x{run['rescore_factor']:<3} recall@{args.k}={run['recall_at_k']} "
+                      f"p50={run['latency_p50_ms']}ms p95={run['latency_p95_ms']}ms")
+            del index
+
+        if not args.skip_hnsw:
+            if collection is None:
+                hnsw_db = os.path.join(work_dir, "chroma")
+                print(f"Loading {source.count()} vectors into Chroma for the HNSW comparison...")
+                collection = load_into_chroma(hnsw_db, source.vectors, space)
+            hnsw = bench_hnsw(collection, hnsw_db, queries, truth, args.k)
+            report["results"]["hnsw"] = hnsw
+            print(f"hnsw     {hnsw['index_mb']}MB index, recall@{args.k}={hnsw['recall_at_k']} "
+                  f"p50={hnsw['latency_p50_ms']}ms p95={hnsw['latency_p95_ms']}ms (first query {hnsw['first_query_ms']}ms)")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or f"bench_compact_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict, Optional
+
+import requests
+
+from bench_query import WORDS, free_port, start_server
+
+LINES_PER_PAGE = 48
+WORDS_PER_LINE = 14
+
+def synthetic_line(rng: random.Random) -> str:
+    return " ".join(rng.choices(WORDS, k=WORDS_PER_LINE))
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_synthetic_pdf(path: str, pages: int, seed: int = 0):
+    """Write a plain-text PDF (Helvetica, one content stream per page) without any PDF library.
+
+    Objects are streamed to disk one page at a time and the xref table is
+    built from the recorded offsets, so page count does not affect memory.
+    """
+    rng = random.Random(seed)
+    offsets = []
+    with open(path, "wb") as f:
+        def write_object(body: bytes):
+            offsets.append(f.tell())
+            f.write(f"{len(offsets)} 0 obj\n".encode("ascii") + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        # 1: catalog, 2: page tree, 3: font, then (page, content) pairs from 4 onwards
+        kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+        write_object(b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode("ascii"))
+        write_object(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        for i in range(pages):
+            write_object(
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode("ascii")
+            )
+            lines = [f"Page {i + 1}"] + [synthetic_line(rng) for _ in range(LINES_PER_PAGE)]
+            content = "BT /F1 9 Tf 11 TL 40 760 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+            stream = content.encode("latin-1")
+            write_object(f"<< /Length {len(stream)} >>\nstream\n".encode("ascii") + stream + b"\nendstream")
+
+        xref_offset = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode("ascii"))
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode("ascii"))
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("ascii"))
+
+def write_synthetic_qa_csv(path: str, rows: int, seed: int = 0):
+    """Question,Answer CSV; about one answer in ten is long enough to be split into several chunks"""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("Question,Answer\n")
+        for i in range(rows):
+            question = f"Question {i} about " + " ".join(rng.choices(WORDS, k=8))
+            answer_words = rng.randint(180, 400) if rng.random() < 0.1 else rng.randint(20, 80)
+            f.write(f"\"{question}\",\"{' '.join(rng.choices(WORDS, k=answer_words))}\"\n")
+
+def server_peak_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process(pid).memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+def reset_peak(pid: int):
+    # Linux only: writing 5 to clear_refs resets VmHWM so each case reports its own peak
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def own_peak_mb() -> Optional[float]:
+    try:
+        import resource
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:
+        return server_peak_mb(os.getpid())
+
+def bench_upload(base_url: str, server_pid: int, path: str, collection: str) -> Dict:
+    """Time one file through the full /upload path"""
+    reset_peak(server_pid)
+    with open(path, "rb") as f:
+        started = time.perf_counter()
+        response = requests.post(
+            f"{base_url}/upload",
+            files={"file": (os.path.basename(path), f)},
+            data={"collection": collection},
+            timeout=3600
+        )
+        seconds = time.perf_counter() - started
+    response.raise_for_status()
+    body = response.json()
+    summary = body.get("summary", {})
+    result = {
+        "seconds": round(seconds, 3),
+        "file_mb": round(os.path.getsize(path) / (1024 * 1024), 2),
+        "chunks": summary.get("chunks"),
+        "chunks_per_second": round(summary["chunks"] / seconds, 1) if summary.get("chunks") else None,
+        "server_peak_mb": server_peak_mb(server_pid),
+        "summary": summary
+    }
+    if "pipeline" in body:
+        result["pipeline"] = {"stages": body["pipeline"]["stages"], "queues": body["pipeline"]["queues"]}
+    if "stages" in body:
+        # CSV uploads run parse, plan, embed, write and index one after another; seconds per stage
+        result["stages"] = body["stages"]
+    return result
+
+def _run_qa_loader(db_path: str, csv_path: str, results):
+    import upload_insurance_qa
+
+    upload_insurance_qa.DB_PATH = db_path
+    stats = {}
+    started = time.perf_counter()
+    upload_insurance_qa.upload_csv(csv_path, stats=stats)
+    stats["seconds"] = time.perf_counter() - started
+    stats["peak_mb"] = own_peak_mb()
+    results.put(stats)
+
+def bench_qa_loader(db_path: str, csv_path: str) -> Dict:
+    """Time upload_insurance_qa.upload_csv stage by stage in a fresh process (so its peak RSS is its own)"""
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_qa_loader, args=(db_path, csv_path, results))
+    process.start()
+    while True:
+        try:
+            stats = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"QA loader exited with code {process.exitcode}")
+    process.join()
+    seconds = stats["seconds"]
+    return {
+        "seconds": round(seconds, 3),
+        "rows": stats["rows"],
+        "chunks": stats["chunks"],
+        "rows_per_second": round(stats["rows"] / seconds, 1) if seconds else None,
+        "chunks_per_second": round(stats["chunks"] / seconds, 1) if seconds else None,
+        "stages": {name: round(stats[f"{name}_seconds"], 3) for name in ("read", "chunk", "embed", "write")},
+        "peak_mb": stats["peak_mb"]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion: PDF and CSV /upload plus the insurance QA loader")
+    parser.add_argument("--pages", type=int, default=300, help="Pages in the synthetic PDF")
+    parser.add_argument("--csv-rows", type=int, default=20000, help="Rows in the synthetic Q&A CSV")
+    parser.add_argument("--cases", default="pdf_upload,csv_upload,qa_loader", help="Subset of: pdf_upload, csv_upload, qa_loader")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write results as JSON (default: bench_ingest_<timestamp>.json)")
+    args = parser.parse_args()
+    cases = [case for case in args.cases.split(",") if case]
+
+    # A fresh store per run, so the embedding cache is cold and every chunk is really embedded
+    work_dir = tempfile.mkdtemp(prefix="rag_ingest_bench_")
+    db_path = os.path.join(work_dir, "db")
+    pdf_path = os.path.join(work_dir, f"synthetic_{args.pages}p.pdf")
+    csv_path = os.path.join(work_dir, f"synthetic_qa_{args.csv_rows}.csv")
+    report = {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args), "results": {}}
+
+    try:
+        print(f"Generating inputs in {work_dir}...")
+        if "pdf_upload" in cases:
+            write_synthetic_pdf(pdf_path, args.pages, args.seed)
+        if "csv_upload" in cases or "qa_loader" in cases:
+            write_synthetic_qa_csv(csv_path, args.csv_rows, args.seed)
+
+        if "pdf_upload" in cases or "csv_upload" in cases:
+            port = free_port()
+            server = start_server(db_path, port)
+            base_url = f"http://127.0.0.1:{port}"
+            try:
+                if "pdf_upload" in cases:
+                    result = bench_upload(base_url, server.pid, pdf_path, "bench_pdf")
+                    result["pages"] = args.pages
+                    result["pages_per_second"] = round(args.pages / result["seconds"], 1)
+                    report["results"]["pdf_upload"] = result
+                    print(f"PDF /upload: {args.pages} pages, {result['chunks']} chunks in {result['seconds']}s "
+                          f"({result['pages_per_second']} pages/s, {result['chunks_per_second']} chunks/s, "
+                          f"peak {result['server_peak_mb']}MB)")
+                if "csv_upload" in cases:
+                    result = bench_upload(base_url, server.pid, csv_path, "bench_csv")
+                    report["results"]["csv_upload"] = result
+                    print(f"CSV /upload: {result['chunks']} chunks in {result['seconds']}s "
+                          f"({result['chunks_per_second']} chunks/s, stages {result.get('stages')}, "
+                          f"peak {result['server_peak_mb']}MB)")
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+        if "qa_loader" in cases:
+            result = bench_qa_loader(db_path, csv_path)
+            report["results"]["qa_loader"] = result
+            print(f"upload_insurance_qa: {result['rows']} rows, {result['chunks']} chunks in {result['seconds']}s "
+                  f"({result['chunks_per_second']} chunks/s, stages {result['stages']}, peak {result['peak_mb']}MB)")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or f"bench_ingest_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import chromadb
+import numpy as np
+import requests
+
+# Vectors match all-MiniLM-L6-v2, the model the server embeds query text with
+EMBEDDING_DIM = 384
+DEFAULT_SIZES = "10000,100000,1000000"
+DEFAULT_CONCURRENCY = "1,8,32"
+SCENARIOS = ("query", "query_direct", "browse")
+
+WORDS = (
+    "contract tort negligence liability damages plaintiff defendant appeal court statute "
+    "insurance policy premium claim coverage exclusion deductible breach remedy injunction "
+    "evidence testimony jurisdiction precedent ruling judgment settlement arbitration clause "
+    "employment lease property trust estate negligent duty care causation fraud disclosure"
+).split()
+
+def synthetic_text(rng: random.Random, words: int = 120) -> str:
+    return " ".join(rng.choices(WORDS, k=words))
+
+def random_unit_vectors(rng: np.random.Generator, count: int, dim: int = EMBEDDING_DIM) -> List[List[float]]:
+    vectors = rng.standard_normal((count, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.tolist()
+
+def build_collection(db_path: str, size: int, seed: int = 0) -> str:
+    """Create (or reuse) a synthetic collection of size chunks with random embeddings"""
+    name = f"bench_{size}"
+    client = chromadb.PersistentClient(path=db_path)
+    collection = client.get_or_create_collection(name=name)
+    if collection.count() >= size:
+        print(f"Reusing {name} ({collection.count()} chunks)")
+        return name
+
+    rng = random.Random(seed)
+    vector_rng = np.random.default_rng(seed)
+    batch_size = min(5000, client.max_batch_size)
+    started = time.time()
+    for start in range(collection.count(), size, batch_size):
+        count = min(batch_size, size - start)
+        collection.add(
+            ids=[f"bench-{i}" for i in range(start, start + count)],
+            documents=[synthetic_text(rng) for _ in range(count)],
+            metadatas=[{"source": f"bench_{i % 1000}.pdf", "type": "pdf_document", "chunk_index": i // 1000} for i in range(start, start + count)],
+            embeddings=random_unit_vectors(vector_rng, count)
+        )
+        print(f"  {name}: {start + count}/{size} chunks ({time.time() - started:.0f}s)")
+    return name
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import psutil
+        return round(psutil.Process(pid).memory_info().rss / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+def start_server(db_path: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ, RAG_DB_PATH=db_path)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            # /ready only passes once the embedding model and indexes are warm
+            if requests.get(f"http://127.0.0.1:{port}/ready", timeout=1).ok:
+                return server
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("Server did not become ready within 120s")
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return round(sorted_values[index], 2)
+
+def scenario_request(scenario: str, collection: str, rng: random.Random, n_results: int):
+    if scenario == "browse":
+        return "/query", {"query": "", "collection": collection, "n_results": n_results}
+    query = " ".join(rng.choice(WORDS) for _ in range(6))
+    path = "/query_direct" if scenario == "query_direct" else "/query"
+    return path, {"query": query, "collection": collection, "n_results": n_results}
+
+def run_scenario(base_url: str, scenario: str, collection: str, concurrency: int, total_requests: int,
+                 n_results: int, seed: int = 0) -> Dict:
+    rng = random.Random(seed)
+    payloads = [scenario_request(scenario, collection, rng, n_results) for _ in range(total_requests)]
+    http = requests.Session()
+    http.mount("http://", requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency))
+
+    def send(item):
+        path, payload = item
+        t0 = time.perf_counter()
+        try:
+            ok = http.post(f"{base_url}{path}", json=payload, timeout=300).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - t0, ok
+
+    # One unmeasured request so model loading and index warm-up don't land in the percentiles
+    send(payloads[0])
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(send, payloads))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(seconds * 1000 for seconds, ok in outcomes if ok)
+    return {
+        "requests": total_requests,
+        "errors": sum(1 for _, ok in outcomes if not ok),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "seconds": round(elapsed, 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test rag_backend query endpoints against synthetic collections")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma-separated collection sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help=f"Comma-separated client concurrency levels (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario and concurrency level")
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--db", default=None, help="Reuse/keep synthetic collections in this directory (default: temp dir, removed afterwards)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write results as JSON (default: bench_query_<timestamp>.json)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    levels = [int(level) for level in args.concurrency.split(",") if level]
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"Unknown scenario: {name}")
+
+    db_path = args.db or tempfile.mkdtemp(prefix="rag_bench_")
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {**vars(args), "db": db_path},
+        "results": []
+    }
+
+    try:
+        print(f"Building synthetic collections in {db_path}...")
+        collections = {size: build_collection(db_path, size, args.seed) for size in sizes}
+
+        port = free_port()
+        server = start_server(db_path, port)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            for size in sizes:
+                for scenario in scenarios:
+                    for concurrency in levels:
+                        result = run_scenario(base_url, scenario, collections[size], concurrency, args.requests, args.n_results, args.seed)
+                        result.update(size=size, scenario=scenario, concurrency=concurrency, server_rss_mb=rss_mb(server.pid))
+                        report["results"].append(result)
+                        print(f"{size:>8} {scenario:<13} c={concurrency:<3} p50={result['p50_ms']}ms "
+                              f"p95={result['p95_ms']}ms p99={result['p99_ms']}ms {result['throughput_rps']} req/s "
+                              f"rss={result['server_rss_mb']}MB errors={result['errors']}")
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    finally:
+        if args.db is None:
+            shutil.rmtree(db_path, ignore_errors=True)
+
+    output = args.output or f"bench_query_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Plain word tokens plus "compound" tokens that keep legal references such as
+# s.12(3), [2019] or 1998/42 intact so they can be matched exactly.
+WORD_RE = re.compile(r"\w+")
+COMPOUND_RE = re.compile(r"[\w\[\]().:/-]*\d[\w\[\]().:/-]*")
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens and legal citation tokens"""
+    text = text.lower()
+    tokens = WORD_RE.findall(text)
+    for compound in COMPOUND_RE.findall(text):
+        compound = compound.strip(".,:;-")
+        if compound and not compound.isalnum():
+            tokens.append(compound)
+    return tokens
+
+class BM25Index:
+    """On-disk BM25 inverted index for a single collection, stored in SQLite"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS docs (doc_id TEXT PRIMARY KEY, length INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS postings_term ON postings (term);
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+        """)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def add(self, ids: List[str], texts: List[str]):
+        """Index (or re-index) documents by id"""
+        with self._lock, self._conn:
+            self._delete_ids(ids)
+            for doc_id, text in zip(ids, texts):
+                terms = Counter(tokenize(text or ""))
+                self._conn.execute(
+                    "INSERT INTO docs (doc_id, length) VALUES (?, ?)",
+                    (doc_id, sum(terms.values()))
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    [(term, doc_id, tf) for term, tf in terms.items()]
+                )
+
+    def remove(self, ids: List[str]):
+        """Drop documents from the index"""
+        with self._lock, self._conn:
+            self._delete_ids(ids)
+
+    def _delete_ids(self, ids: List[str]):
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM postings WHERE doc_id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM docs WHERE doc_id IN ({placeholders})", batch)
+
+    def search(self, query: str, n_results: int) -> List[Tuple[str, float]]:
+        """Return (doc_id, bm25_score) pairs, best first"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            total_docs, total_length = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs"
+            ).fetchone()
+            if total_docs == 0:
+                return []
+            avg_length = total_length / total_docs
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                rows = self._conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id WHERE p.term = ?",
+                    (term,)
+                ).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (total_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                for doc_id, tf, length in rows:
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:n_results]
+
+    def sync(self, collection, batch_size: int = 1000):
+        """Index what the collection has and the index lacks, and drop what it no longer has.
+
+        For chunks written around the index (e.g. by other tools); cheaper than a
+        rebuild since only the missing documents are fetched, and searches keep
+        working on the existing postings meanwhile.
+        """
+        stored = set()
+        offset = 0
+        while True:
+            page = collection.get(include=[], limit=10000, offset=offset)
+            if not page["ids"]:
+                break
+            stored.update(page["ids"])
+            offset += len(page["ids"])
+        with self._lock:
+            indexed = {row[0] for row in self._conn.execute("SELECT doc_id FROM docs")}
+        missing = sorted(stored - indexed)
+        extra = sorted(indexed - stored)
+        for start in range(0, len(missing), batch_size):
+            batch = collection.get(ids=missing[start:start + batch_size], include=["documents"])
+            self.add(batch["ids"], batch["documents"])
+        if extra:
+            self.remove(extra)
+        print(f"Synced BM25 index {self.path}: {len(missing)} added, {len(extra)} removed")
+
+    def rebuild(self, collection, batch_size: int = 1000):
+        """Rebuild the index from the documents stored in a Chroma collection"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+        offset = 0
+        while True:
+            batch = collection.get(include=["documents"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            self.add(batch["ids"], batch["documents"])
+            offset += len(batch["ids"])
+        print(f"Rebuilt BM25 index {self.path} with {offset} documents")
+
+_indexes: Dict[str, BM25Index] = {}
+_indexes_lock = threading.Lock()
+
+def get_index(db_path: str, collection_name: str) -> BM25Index:
+    """Get the (cached) BM25 index for a collection"""
+    path = os.path.join(db_path, "bm25", f"{collection_name}.sqlite3")
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = BM25Index(path)
+        return _indexes[path]
+
+def unload(db_path: str, collection_name: str):
+    """Drop the cached handle; its connection closes once no request still holds it"""
+    path = os.path.join(db_path, "bm25", f"{collection_name}.sqlite3")
+    with _indexes_lock:
+        _indexes.pop(path, None)
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = RRF_K, weights: Optional[List[float]] = None) -> List[Tuple[str, float]]:
+    """Fuse several ranked id lists into one using reciprocal rank fusion"""
+    rankings = list(rankings)
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,226 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+import chromadb
+
+import bm25_index
+import index_config
+import ingestion
+import sharding
+from embedding_cache import get_embedding_function
+
+DB_PATH = "./db"
+SUPPORTED_EXTENSIONS = (".pdf", ".csv")
+
+class Manifest:
+    """Checkpoint of ingested files (path, size, mtime, hash) so interrupted runs resume"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                collection TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                sha256 TEXT NOT NULL,
+                chunks INTEGER NOT NULL,
+                ingested_at REAL NOT NULL,
+                PRIMARY KEY (collection, path)
+            )
+        """)
+        self._conn.commit()
+
+    def lookup(self, collection: str, path: str) -> Optional[Tuple[int, float, str]]:
+        return self._conn.execute(
+            "SELECT size, mtime, sha256 FROM files WHERE collection = ? AND path = ?", (collection, path)
+        ).fetchone()
+
+    def record(self, collection: str, entries: List[Dict]):
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (collection, path, size, mtime, sha256, chunks, ingested_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(collection, e["path"], e["size"], e["mtime"], e["sha256"], e["chunks"], now) for e in entries]
+            )
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def extract_file(path: str, chunk_size: int, chunk_overlap: int) -> Tuple[str, List[str], List[Dict]]:
+    """Worker: hash a file and turn it into chunks (runs in a separate process)"""
+    sha256 = file_sha256(path)
+    source = os.path.basename(path)
+
+    if path.lower().endswith(".csv"):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            documents, metadatas = ingestion.parse_qa_csv(f.read(), source)
+        return sha256, documents, metadatas
+
+    # Same extraction and splitting as /upload, so chunk ids line up with API uploads
+    from ingest_pipeline import StreamingSplitter, extract_pdf_pages
+
+    splitter = StreamingSplitter(chunk_size, chunk_overlap)
+    documents = []
+    for text in extract_pdf_pages(path):
+        documents.extend(splitter.feed(text))
+    documents.extend(splitter.finish())
+    # The same metadata the /upload pipeline writes (no total_chunks), so re-ingesting an uploaded file is a no-op
+    metadatas = [{"source": source, "type": "pdf_document", "chunk_index": i} for i in range(len(documents))]
+    return sha256, documents, metadatas
+
+def walk_files(root: str, extensions=SUPPORTED_EXTENSIONS):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions):
+                yield os.path.join(dirpath, filename)
+
+def bulk_ingest(root: str, collection_name: str, db_path: str = DB_PATH, workers: int = None,
+                batch_size: int = 5000, chunk_size: int = 1000, chunk_overlap: int = 200, manifest_path: str = None):
+    """Ingest a directory tree into a collection, skipping files already in the manifest"""
+    workers = workers or os.cpu_count() or 2
+    manifest = Manifest(manifest_path or os.path.join(db_path, "bulk_ingest_manifest.sqlite3"))
+    client = chromadb.PersistentClient(path=db_path)
+    embed_fn = get_embedding_function(db_path)
+    # Write targets: the collection itself, or (when it is sharded) one shard per court
+    targets: Dict[str, Tuple] = {}
+
+    def open_target(name: str):
+        if name not in targets:
+            targets[name] = (index_config.open_collection(client, name, embed_fn), bm25_index.get_index(db_path, name))
+        return targets[name]
+
+    stats = {"seen": 0, "skipped": 0, "ingested": 0, "failed": 0, "chunks_written": 0}
+    pending: Dict[str, ingestion.SyncPlan] = {}
+    pending_entries: List[Dict] = []
+    started = time.time()
+
+    def pending_writes() -> int:
+        return sum(len(plan.upsert_ids) + len(plan.update_ids) for plan in pending.values())
+
+    def flush():
+        nonlocal pending, pending_entries
+        if pending_entries:
+            for name, plan in pending.items():
+                collection, lexical_index = open_target(name)
+                ingestion.apply_sync_plan(collection, plan, lexical_index, batch_size=min(batch_size, client.max_batch_size))
+                stats["chunks_written"] += len(plan.upsert_ids)
+            manifest.record(collection_name, pending_entries)
+            stats["ingested"] += len(pending_entries)
+            elapsed = time.time() - started
+            print(f"Checkpoint: {stats['ingested']} files ingested, {stats['skipped']} skipped, "
+                  f"{stats['failed']} failed, {stats['chunks_written']} chunks written ({elapsed:.0f}s)")
+        pending = {}
+        pending_entries = []
+
+    def handle_result(entry: Dict, sha256: str, documents: List[str], metadatas: List[Dict]):
+        previous = manifest.lookup(collection_name, entry["path"])
+        entry["sha256"] = sha256
+        entry["chunks"] = len(documents)
+        if previous and previous[2] == sha256:
+            # Touched but not changed: just refresh size/mtime in the manifest
+            manifest.record(collection_name, [entry])
+            stats["skipped"] += 1
+            return
+        if not documents:
+            print(f"No text extracted from {entry['path']}, skipping")
+            stats["failed"] += 1
+            return
+
+        relative_path = entry["path"]
+        for metadata in metadatas:
+            metadata["relative_path"] = relative_path
+            if collection_name == "case_law":
+                metadata["court"] = relative_path.split(os.sep)[0]
+        # Same routing as /upload: a file's chunks all share its court
+        target = sharding.write_target(collection_name, metadatas[0])
+        collection, _ = open_target(target)
+        pending.setdefault(target, ingestion.SyncPlan()).extend(
+            ingestion.plan_source_sync(collection, relative_path, documents, metadatas)
+        )
+        pending_entries.append(entry)
+        if pending_writes() >= batch_size:
+            flush()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        try:
+            for path in walk_files(root):
+                stats["seen"] += 1
+                relative_path = os.path.relpath(path, root)
+                stat = os.stat(path)
+                previous = manifest.lookup(collection_name, relative_path)
+                if previous and previous[0] == stat.st_size and previous[1] == stat.st_mtime:
+                    stats["skipped"] += 1
+                    continue
+
+                # Keep a bounded number of files in flight so memory stays flat on huge trees
+                while len(in_flight) >= workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        _collect(future, in_flight.pop(future), handle_result, stats)
+
+                entry = {"path": relative_path, "size": stat.st_size, "mtime": stat.st_mtime}
+                in_flight[pool.submit(extract_file, path, chunk_size, chunk_overlap)] = entry
+
+            for future in list(in_flight):
+                _collect(future, in_flight.pop(future), handle_result, stats)
+        finally:
+            # Persist whatever completed, so an interrupted run resumes after it
+            flush()
+
+    stats["seconds"] = round(time.time() - started, 1)
+    return stats
+
+def _collect(future, entry: Dict, handle_result, stats: Dict):
+    try:
+        sha256, documents, metadatas = future.result()
+    except Exception as e:
+        print(f"Error processing {entry['path']}: {str(e)}")
+        stats["failed"] += 1
+        return
+    handle_result(entry, sha256, documents, metadatas)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory tree of PDFs/CSVs into a collection")
+    parser.add_argument("root", help="Directory to walk")
+    parser.add_argument("collection", help="Target collection name")
+    parser.add_argument("--db", default=DB_PATH, help="ChromaDB directory (default: ./db)")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Chunks per store write batch")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--manifest", default=None, help="Checkpoint manifest path (default: <db>/bulk_ingest_manifest.sqlite3)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        print(f"Not a directory: {args.root}")
+        sys.exit(1)
+
+    print(f"Ingesting {args.root} into {args.collection}...")
+    stats = bulk_ingest(
+        args.root,
+        args.collection,
+        db_path=args.db,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        manifest_path=args.manifest
+    )
+    print(f"Done: {stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import importlib.util
+import io
+import json
+import os
+import struct
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import orjson
+
+    def _dumps(value) -> bytes:
+        return orjson.dumps(value)
+except ImportError:
+    def _dumps(value) -> bytes:
+        return json.dumps(value).encode("utf-8")
+
+# pyarrow is optional and slow to import, so it is only loaded on the first Arrow export
+_pyarrow = None
+
+def arrow_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+def _arrow():
+    global _pyarrow
+    if _pyarrow is None:
+        import pyarrow
+        _pyarrow = pyarrow
+    return _pyarrow
+
+EXPORT_PAGE_SIZE = int(os.environ.get("RAG_EXPORT_PAGE_SIZE", "5000"))
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PACKED_MEDIA_TYPE = "application/x-npz-frames"
+MEDIA_TYPES = {"arrow": ARROW_MEDIA_TYPE, "packed": PACKED_MEDIA_TYPE}
+
+# Length prefix for each packed frame (little-endian uint64)
+_FRAME_HEADER = struct.Struct("<Q")
+
+class ExportFormatError(ValueError):
+    pass
+
+def check_format(fmt: str):
+    if fmt not in MEDIA_TYPES:
+        raise ExportFormatError(f"Unknown format {fmt!r}, expected one of: json, {', '.join(MEDIA_TYPES)}")
+    if fmt == "arrow" and not arrow_available():
+        raise ExportFormatError("Arrow output needs pyarrow installed; use format=packed instead")
+
+def _string_column(values: List[Optional[str]]):
+    """Pack strings as (offsets, utf-8 bytes), the same layout Arrow uses"""
+    encoded = [(value or "").encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+def decode_strings(offsets: np.ndarray, data: np.ndarray) -> List[str]:
+    raw = data.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+def _batch_columns(batch: Dict) -> Dict:
+    """Normalise a Chroma get/query result page to flat columns; metadata goes out as JSON text"""
+    columns = {"ids": batch["ids"]}
+    if batch.get("documents") is not None:
+        columns["documents"] = batch["documents"]
+    if batch.get("metadatas") is not None:
+        columns["metadatas"] = [_dumps(m or {}).decode("utf-8") for m in batch["metadatas"]]
+    if batch.get("distances") is not None:
+        columns["distances"] = np.asarray(batch["distances"], dtype=np.float32)
+    if batch.get("embeddings") is not None and len(batch["embeddings"]):
+        columns["embeddings"] = np.asarray(batch["embeddings"], dtype=np.float32)
+    return columns
+
+def encode_packed_frame(batch: Dict) -> bytes:
+    """One length-prefixed .npz frame; read back with read_packed_frames"""
+    arrays = {}
+    for name, column in _batch_columns(batch).items():
+        if isinstance(column, np.ndarray):
+            arrays[name] = column
+        else:
+            arrays[f"{name}_offsets"], arrays[f"{name}_data"] = _string_column(column)
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    payload = buffer.getvalue()
+    return _FRAME_HEADER.pack(len(payload)) + payload
+
+def read_packed_frames(stream) -> Iterator[Dict]:
+    """Decode a packed export from a binary file object, one dict of columns per frame"""
+    while True:
+        header = stream.read(_FRAME_HEADER.size)
+        if len(header) < _FRAME_HEADER.size:
+            return
+        (length,) = _FRAME_HEADER.unpack(header)
+        with np.load(io.BytesIO(stream.read(length)), allow_pickle=False) as frame:
+            columns = {}
+            for name in frame.files:
+                if name.endswith("_offsets"):
+                    base = name[:-len("_offsets")]
+                    columns[base] = decode_strings(frame[name], frame[f"{base}_data"])
+                elif not name.endswith("_data"):
+                    columns[name] = frame[name]
+            if "metadatas" in columns:
+                columns["metadatas"] = [json.loads(m) for m in columns["metadatas"]]
+            yield columns
+
+def _record_batch(columns: Dict):
+    pa = _arrow()
+    arrays, names = [], []
+    for name, column in columns.items():
+        if name == "embeddings":
+            array = pa.FixedSizeListArray.from_arrays(pa.array(column.reshape(-1)), column.shape[1])
+        elif isinstance(column, np.ndarray):
+            array = pa.array(column)
+        else:
+            array = pa.array(column, type=pa.string())
+        arrays.append(array)
+        names.append(name)
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+class _ArrowStreamEncoder:
+    """Writes record batches to an Arrow IPC stream and hands back the bytes produced so far"""
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._writer = None
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def write(self, batch: Dict) -> bytes:
+        record_batch = _record_batch(_batch_columns(batch))
+        if self._writer is None:
+            # The schema (including embedding width) is fixed by the first page
+            self._writer = _arrow().ipc.new_stream(self._buffer, record_batch.schema)
+        self._writer.write_batch(record_batch)
+        return self._drain()
+
+    def close(self) -> bytes:
+        if self._writer is None:
+            # Nothing was written: still emit a valid (empty) stream
+            pa = _arrow()
+            self._writer = pa.ipc.new_stream(self._buffer, pa.schema([("ids", pa.string())]))
+        self._writer.close()
+        return self._drain()
+
+def encode_results(batch: Dict, fmt: str) -> bytes:
+    """Encode a single result page (e.g. one /query_direct result) in one go"""
+    if fmt == "packed":
+        return encode_packed_frame(batch)
+    encoder = _ArrowStreamEncoder()
+    return encoder.write(batch) + encoder.close()
+
+def iter_collection_pages(collection, include: List[str], page_size: int = EXPORT_PAGE_SIZE) -> Iterator[Dict]:
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+def export_collection(collection, fmt: str, include_embeddings: bool = False, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[bytes]:
+    """Stream a whole collection page by page, so memory stays bounded by page_size"""
+    include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+    pages = iter_collection_pages(collection, include, page_size)
+    if fmt == "packed":
+        for page in pages:
+            yield encode_packed_frame(page)
+        return
+    encoder = _ArrowStreamEncoder()
+    for page in pages:
+        yield encoder.write(page)
+    yield encoder.close()
@@ -0,0 +1,311 @@
+import argparse
+import bisect
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Optional compact vector tier for large collections. The first pass scans int8,
+# float16 or PCA-reduced float16 copies of the embeddings, which are held in RAM;
+# the best candidates are then re-scored exactly against the float32 vectors, which
+# stay on disk and are memory-mapped. Built offline from a collection's stored
+# embeddings (python compact_index.py build <collection>) and searched with
+# "compact": true on /query. It is a snapshot: chunks added after a build are not
+# found through it until it is rebuilt, and deleted ones are dropped at fetch time.
+# Filtered compact queries take the matching ids from Chroma's metadata store and
+# scan only those rows, so they never load the collection's HNSW index either.
+# Warm-up skips collections with a tier; only a query without "compact" (or a
+# hybrid one) and writes still bring their HNSW index into memory.
+
+MODES = ("int8", "float16", "pca")
+DEFAULT_PCA_DIM = 128
+# Candidates re-scored exactly, per requested result
+RESCORE_FACTOR = int(os.environ.get("RAG_COMPACT_RESCORE_FACTOR", "10"))
+# Rows scored per block in the first pass, bounding its float32 scratch memory
+SCAN_BLOCK_ROWS = 65536
+# Vectors sampled to fit the PCA projection
+PCA_SAMPLE_ROWS = 20000
+
+class CompactIndexError(ValueError):
+    pass
+
+def index_dir(db_path: str, collection_name: str) -> str:
+    return os.path.join(db_path, "compact", collection_name)
+
+def _exact_distances(vectors: np.ndarray, query: np.ndarray, space: str, query_norm: float) -> np.ndarray:
+    """Distances as Chroma reports them for the space (l2 is squared)"""
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * query_norm
+        return 1.0 - (vectors @ query) / np.maximum(norms, 1e-12)
+    if space == "ip":
+        return 1.0 - vectors @ query
+    return np.sum((vectors - query) ** 2, axis=1)
+
+class CompactIndex:
+    """A built compact tier, loaded from its directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.mode = self.meta["mode"]
+        self.space = self.meta["space"]
+        self.count = self.meta["count"]
+
+        # The compact tier proper, resident in RAM
+        self.codes = np.load(os.path.join(directory, "codes.npy"))
+        self.scales = np.load(os.path.join(directory, "scales.npy")) if self.mode == "int8" else None
+        self.components = np.load(os.path.join(directory, "components.npy")) if self.mode == "pca" else None
+        self.sq_norms = np.load(os.path.join(directory, "sq_norms.npy")) if self.space == "l2" else None
+
+        # Full precision vectors and ids stay on disk; only the rows that are read get paged in
+        self.full = np.load(os.path.join(directory, "full.npy"), mmap_mode="r")
+        self._id_offsets = np.load(os.path.join(directory, "id_offsets.npy"), mmap_mode="r")
+        self._id_data = np.load(os.path.join(directory, "id_data.npy"), mmap_mode="r")
+        # Rows in id order, for looking up the rows a metadata filter allows
+        self._id_order = None
+
+    def memory_bytes(self) -> int:
+        """RAM held by the first-pass tier (the memory-mapped files are paged in on demand)"""
+        arrays = (self.codes, self.scales, self.components, self.sq_norms)
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def id_at(self, row: int) -> str:
+        start, end = int(self._id_offsets[row]), int(self._id_offsets[row + 1])
+        return self._id_data[start:end].tobytes().decode("utf-8")
+
+    def rows_for_ids(self, ids: List[str]) -> np.ndarray:
+        """Rows holding the given ids, skipping ids added after the build"""
+        if self._id_order is None:
+            self._id_order = np.array(sorted(range(self.count), key=self.id_at), dtype=np.int64)
+        order = self._id_order
+        rows = []
+        for doc_id in ids:
+            position = bisect.bisect_left(order, doc_id, key=lambda row: self.id_at(int(row)))
+            if position < self.count and self.id_at(int(order[position])) == doc_id:
+                rows.append(int(order[position]))
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def _first_pass_query(self, query: np.ndarray) -> np.ndarray:
+        if self.space == "cosine":
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+        if self.mode == "pca":
+            query = self.components @ query
+        return query.astype(np.float32)
+
+    def candidates(self, query: np.ndarray, n: int, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Rows of the n best approximate scores, best first, among `rows` if given"""
+        query = np.asarray(query, dtype=np.float32)
+        projected = self._first_pass_query(query)
+        total = self.count if rows is None else len(rows)
+        n = min(n, total)
+        if n <= 0:
+            return np.zeros(0, dtype=np.int64)
+
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start in range(0, total, SCAN_BLOCK_ROWS):
+            end = min(start + SCAN_BLOCK_ROWS, total)
+            # A slice scans in place; an explicit row list gathers just those rows
+            selected = slice(start, end) if rows is None else rows[start:end]
+            # einsum casts the codes as it goes instead of materialising a float32 copy of
+            # each block, which made the scan several times slower
+            scores = np.einsum("ij,j->i", self.codes[selected], projected, dtype=np.float32)
+            if self.scales is not None:
+                scores *= self.scales[selected]
+            if self.sq_norms is not None:
+                # Ranking by -||x - q||^2 is ranking by 2 x.q - ||x||^2
+                scores = 2 * scores - self.sq_norms[selected]
+            rows_kept = np.arange(start, end, dtype=np.int64) if rows is None else rows[start:end]
+            if len(scores) > n:
+                keep = np.argpartition(-scores, n - 1)[:n]
+                rows_kept, scores = rows_kept[keep], scores[keep]
+            best_rows = np.concatenate([best_rows, rows_kept])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > n:
+                keep = np.argpartition(-best_scores, n - 1)[:n]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        return best_rows[np.argsort(-best_scores)]
+
+    def search(self, query, k: int, rescore_factor: int = RESCORE_FACTOR,
+               rows: Optional[np.ndarray] = None) -> Tuple[List[str], List[float]]:
+        """Approximate first pass, then exact re-scoring of k * rescore_factor candidates"""
+        query = np.asarray(query, dtype=np.float32)
+        rows = self.candidates(query, max(k * rescore_factor, k), rows)
+        if len(rows) == 0:
+            return [], []
+        # Sorted rows turn the memory-mapped reads into a forward scan
+        rows = np.sort(rows)
+        distances = _exact_distances(np.asarray(self.full[rows]), query, self.space, float(np.linalg.norm(query)))
+        order = np.argsort(distances)[:k]
+        return [self.id_at(int(rows[i])) for i in order], [float(distances[i]) for i in order]
+
+def _write_ids(directory: str, ids: List[str]):
+    """Store ids as (offsets, utf-8 bytes) so single ids can be read from a memory map"""
+    encoded = [doc_id.encode("utf-8") for doc_id in ids]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, "id_offsets.npy"), offsets)
+    np.save(os.path.join(directory, "id_data.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+def _fit_pca(full: np.ndarray, dim: int, normalize: bool, seed: int = 0) -> np.ndarray:
+    """Top principal directions of a sample (uncentered, so dot products carry over)"""
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(len(full), size=min(PCA_SAMPLE_ROWS, len(full)), replace=False))
+    sample = np.asarray(full[sample_rows], dtype=np.float32)
+    if normalize:
+        sample /= np.maximum(np.linalg.norm(sample, axis=1, keepdims=True), 1e-12)
+    _, _, vt = np.linalg.svd(sample, full_matrices=False)
+    return vt[:dim].astype(np.float32)
+
+def build_index(collection, directory: str, mode: str = "int8", space: str = "cosine",
+                pca_dim: int = DEFAULT_PCA_DIM, page_size: int = 5000) -> Dict:
+    """Build the compact tier for a collection from its stored embeddings"""
+    if mode not in MODES:
+        raise CompactIndexError(f"Unknown mode {mode!r}, expected one of: {', '.join(MODES)}")
+    count = collection.count()
+    if count == 0:
+        raise CompactIndexError(f"Collection {collection.name} is empty")
+
+    # Build next to the live copy and swap directories at the end
+    staging = directory + ".building"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    started = time.perf_counter()
+
+    full = None
+    ids: List[str] = []
+    offset = 0
+    while offset < count:
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        vectors = np.asarray(page["embeddings"], dtype=np.float32)
+        if full is None:
+            full = np.lib.format.open_memmap(os.path.join(staging, "full.npy"), mode="w+", dtype=np.float32, shape=(count, vectors.shape[1]))
+        # Anything added while building is left out of this snapshot
+        vectors = vectors[:count - offset]
+        full[offset:offset + len(vectors)] = vectors
+        ids += page["ids"][:len(vectors)]
+        offset += len(vectors)
+        print(f"Read {offset}/{count} embeddings")
+    if offset < count:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise CompactIndexError(f"{collection.name} shrank while building ({offset} of {count} read), run it again")
+    full.flush()
+    _write_ids(staging, ids)
+
+    dim = full.shape[1]
+    components = _fit_pca(full, min(pca_dim, dim), normalize=space == "cosine") if mode == "pca" else None
+    code_dim = components.shape[0] if components is not None else dim
+    codes = np.zeros((count, code_dim), dtype=np.int8 if mode == "int8" else np.float16)
+    scales = np.zeros(count, dtype=np.float32) if mode == "int8" else None
+    sq_norms = np.zeros(count, dtype=np.float32) if space == "l2" else None
+    for start in range(0, count, SCAN_BLOCK_ROWS):
+        end = min(start + SCAN_BLOCK_ROWS, count)
+        block = np.asarray(full[start:end], dtype=np.float32)
+        if sq_norms is not None:
+            sq_norms[start:end] = np.sum(block ** 2, axis=1)
+        if space == "cosine":
+            block = block / np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        if mode == "int8":
+            # Symmetric per-vector scale: the largest component maps to +/-127
+            block_scales = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127.0
+            codes[start:end] = np.round(block / block_scales[:, None]).astype(np.int8)
+            scales[start:end] = block_scales
+        elif mode == "pca":
+            codes[start:end] = (block @ components.T).astype(np.float16)
+        else:
+            codes[start:end] = block.astype(np.float16)
+
+    np.save(os.path.join(staging, "codes.npy"), codes)
+    if scales is not None:
+        np.save(os.path.join(staging, "scales.npy"), scales)
+    if components is not None:
+        np.save(os.path.join(staging, "components.npy"), components)
+    if sq_norms is not None:
+        np.save(os.path.join(staging, "sq_norms.npy"), sq_norms)
+    meta = {
+        "collection": collection.name,
+        "mode": mode,
+        "space": space,
+        "count": count,
+        "dim": dim,
+        "code_dim": code_dim,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+    with open(os.path.join(staging, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    del full
+
+    previous = directory + ".previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.isdir(directory):
+        os.replace(directory, previous)
+    os.replace(staging, directory)
+    shutil.rmtree(previous, ignore_errors=True)
+
+    meta["seconds"] = round(time.perf_counter() - started, 2)
+    meta["compact_bytes"] = int(codes.nbytes + (scales.nbytes if scales is not None else 0)
+                                + (components.nbytes if components is not None else 0)
+                                + (sq_norms.nbytes if sq_norms is not None else 0))
+    meta["float32_bytes"] = count * dim * 4
+    return meta
+
+_indexes: Dict[str, Tuple[float, CompactIndex]] = {}
+_indexes_lock = threading.Lock()
+
+def get_index(db_path: str, collection_name: str) -> Optional[CompactIndex]:
+    """Get the (cached) compact tier for a collection, or None if none has been built.
+
+    A rebuild replaces meta.json, so a changed mtime reloads the index.
+    """
+    directory = index_dir(db_path, collection_name)
+    try:
+        built = os.stat(os.path.join(directory, "meta.json")).st_mtime
+    except OSError:
+        return None
+    with _indexes_lock:
+        cached = _indexes.get(directory)
+        if cached is None or cached[0] != built:
+            _indexes[directory] = (built, CompactIndex(directory))
+        return _indexes[directory][1]
+
+def unload(db_path: str, collection_name: str):
+    """Drop the cached tier; its arrays are freed once no request still holds it"""
+    with _indexes_lock:
+        _indexes.pop(index_dir(db_path, collection_name), None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or drop the compact (quantized) vector tier of a collection")
+    parser.add_argument("action", choices=("build", "drop"))
+    parser.add_argument("collection", help="Collection name")
+    parser.add_argument("--db", default="./db", help="ChromaDB directory (default: ./db)")
+    parser.add_argument("--mode", choices=MODES, default="int8", help="First-pass encoding (default: int8)")
+    parser.add_argument("--pca-dim", type=int, default=DEFAULT_PCA_DIM, help="Dimensions kept by --mode pca")
+    parser.add_argument("--page-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    directory = index_dir(args.db, args.collection)
+    if args.action == "drop":
+        shutil.rmtree(directory, ignore_errors=True)
+        print(f"Dropped compact tier of {args.collection}")
+        return
+
+    import chromadb
+    import index_config
+
+    client = chromadb.PersistentClient(path=args.db)
+    collection = client.get_collection(name=args.collection)
+    space = index_config.current_config(collection)["space"]
+    meta = build_index(collection, directory, args.mode, space, args.pca_dim, args.page_size)
+    print(f"Built {meta['mode']} tier for {args.collection}: {meta['count']} vectors, "
+          f"{meta['compact_bytes'] / 2 ** 20:.1f}MB in RAM vs {meta['float32_bytes'] / 2 ** 20:.1f}MB float32 "
+          f"({meta['float32_bytes'] / max(meta['compact_bytes'], 1):.1f}x smaller) in {meta['seconds']}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import hashlib
+import os
+from typing import Dict, List
+
+# Rough token estimate for budgeting; close enough for English legal text with Mistral's tokenizer
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", "3000"))
+# Longest overlap we look for between neighbouring chunks (PDF chunks overlap by 200 characters)
+MAX_OVERLAP_CHARS = 400
+MIN_OVERLAP_CHARS = 20
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def strip_overlap(previous: str, following: str) -> str:
+    """Drop the prefix of following that repeats the tail of previous"""
+    tail = previous[-MAX_OVERLAP_CHARS:]
+    probe = following[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return following
+    start = tail.find(probe)
+    while start != -1:
+        overlap = len(tail) - start
+        if following.startswith(tail[start:]):
+            return following[overlap:]
+        start = tail.find(probe, start + 1)
+    return following
+
+def _source_key(metadata: Dict) -> str:
+    return metadata.get("source_path") or metadata.get("source") or "Unknown"
+
+def merge_passages(matches: List[Dict]) -> List[Dict]:
+    """Merge matches from the same source with consecutive chunk_index into passages.
+
+    Passages keep the rank of their best-ranked chunk; exact duplicate texts
+    are dropped.
+    """
+    seen_texts = set()
+    by_source: Dict[str, List[Dict]] = {}
+    for rank, match in enumerate(matches):
+        text = match.get("text") or ""
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if not text or digest in seen_texts:
+            continue
+        seen_texts.add(digest)
+        metadata = match.get("metadata") or {}
+        by_source.setdefault(_source_key(metadata), []).append(dict(match, rank=rank))
+
+    passages = []
+    for source, source_matches in by_source.items():
+        source_matches.sort(key=lambda m: (m["metadata"].get("chunk_index") is None, m["metadata"].get("chunk_index", 0), m["rank"]))
+        current = None
+        for match in source_matches:
+            chunk_index = match["metadata"].get("chunk_index")
+            if current is not None and chunk_index is not None and chunk_index == current["last_chunk"] + 1:
+                current["text"] += strip_overlap(current["text"], match["text"])
+                current["last_chunk"] = chunk_index
+                current["rank"] = min(current["rank"], match["rank"])
+                current["chunks"] += 1
+                continue
+            if current is not None:
+                passages.append(current)
+            current = {
+                "source": source,
+                "metadata": match["metadata"],
+                "text": match["text"],
+                "first_chunk": chunk_index,
+                "last_chunk": chunk_index if chunk_index is not None else -2,
+                "rank": match["rank"],
+                "chunks": 1
+            }
+        if current is not None:
+            passages.append(current)
+
+    passages.sort(key=lambda passage: passage["rank"])
+    return passages
+
+def build_context(matches: List[Dict], token_budget: int = DEFAULT_TOKEN_BUDGET) -> Dict:
+    """Assemble a deduplicated, budget-limited context string from query matches"""
+    tokens_original = sum(estimate_tokens(match.get("text") or "") for match in matches)
+
+    packed = []
+    tokens_used = 0
+    for passage in merge_passages(matches):
+        header = f"[Source: {passage['metadata'].get('source', passage['source'])}]"
+        block = f"{header}\n{passage['text'].strip()}"
+        block_tokens = estimate_tokens(block)
+        if tokens_used + block_tokens > token_budget:
+            remaining_chars = (token_budget - tokens_used) * CHARS_PER_TOKEN
+            # Only truncate when a useful amount still fits; otherwise try smaller passages
+            if remaining_chars < 400:
+                continue
+            block = block[:remaining_chars]
+            block_tokens = estimate_tokens(block)
+        packed.append({
+            "source": passage["source"],
+            "metadata": passage["metadata"],
+            "first_chunk": passage["first_chunk"],
+            "chunks": passage["chunks"],
+            "text": block
+        })
+        tokens_used += block_tokens
+
+    return {
+        "context": "\n\n".join(passage["text"] for passage in packed),
+        "passages": packed,
+        "token_budget": token_budget,
+        "tokens_used": tokens_used,
+        "tokens_original": tokens_original,
+        "tokens_saved": max(tokens_original - tokens_used, 0)
+    }
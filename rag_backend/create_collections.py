@@ -1,6 +1,8 @@
 import chromadb
 from chromadb.config import Settings
 
+import index_config
+
 def create_collections():
     # Initialize ChromaDB client
     client = chromadb.PersistentClient(path="./db")
@@ -17,8 +19,9 @@ def create_collections():
     created_collections = []
     for name in collections:
         try:
-            collection = client.create_collection(name=name)
-            print(f"Created collection: {name}")
+            config = index_config.config_for(name)
+            collection = client.create_collection(name=name, metadata=index_config.hnsw_metadata(config))
+            print(f"Created collection: {name} ({config})")
             created_collections.append(name)
         except ValueError as e:
             if "Collection already exists" in str(e):
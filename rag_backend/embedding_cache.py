@@ -0,0 +1,153 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, List
+
+# The CLIs import this module too, so it finds the repo's common/ package itself
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import profiling
+
+# Model id of Chroma's default embedding function; part of every cache key so a
+# model change never serves stale vectors.
+DEFAULT_MODEL_ID = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_MAX_MB = int(os.environ.get("RAG_EMBEDDING_CACHE_MAX_MB", "2048"))
+
+def normalize_text(text: str) -> str:
+    """Normalize chunk text so whitespace-only differences share a cache entry"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def cache_key(model_id: str, text: str) -> str:
+    return hashlib.sha256(f"{model_id}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Size-bounded on-disk embedding cache keyed by model id and text hash"""
+
+    def __init__(self, path: str, max_bytes: int = EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+        """)
+        self._size = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+        with self._lock, self._conn:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows]
+                    )
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock, self._conn:
+            # Replaced entries give back their old size, or _size drifts above the real total
+            for start in range(0, len(rows), 500):
+                batch = [key for key, _, _ in rows[start:start + 500]]
+                placeholders = ",".join("?" * len(batch))
+                self._size -= self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._size += sum(len(blob) for _, blob, _ in rows)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its budget"""
+        target = int(self.max_bytes * 0.9)
+        while self._size > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in rows])
+            self._size -= sum(size for _, size in rows)
+        print(f"Embedding cache evicted down to {self._size} bytes")
+
+class CachedEmbeddingFunction:
+    """Chroma embedding function that only embeds texts missing from the cache"""
+
+    def __init__(self, inner, cache: EmbeddingCache, model_id: str = DEFAULT_MODEL_ID):
+        self.inner = inner
+        self.cache = cache
+        self.model_id = model_id
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        with profiling.span("embed"):
+            return self._embed(input)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a search query without the cache.
+
+        Queries rarely repeat, so caching them would cost a SQLite write under the
+        cache lock on every search and fill the cache with one-off strings.
+        """
+        with profiling.span("embed"):
+            return [float(x) for x in self.inner([text])[0]]
+
+    def _embed(self, input: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model_id, text) for text in input]
+        cached = self.cache.get_many(list(set(keys)))
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, input):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.inner(list(missing.values()))
+            fresh = {key: array("f", [float(x) for x in vector]).tolist() for key, vector in zip(missing.keys(), vectors)}
+            self.cache.put_many(fresh)
+            cached.update(fresh)
+
+        return [cached[key] for key in keys]
+
+_embedding_functions: Dict[str, CachedEmbeddingFunction] = {}
+_embedding_functions_lock = threading.Lock()
+
+def get_embedding_function(db_path: str) -> CachedEmbeddingFunction:
+    """Cached wrapper around Chroma's default embedding function, shared per database"""
+    path = os.path.join(db_path, "embedding_cache.sqlite3")
+    with _embedding_functions_lock:
+        if path not in _embedding_functions:
+            from chromadb.utils import embedding_functions
+            _embedding_functions[path] = CachedEmbeddingFunction(
+                embedding_functions.DefaultEmbeddingFunction(),
+                EmbeddingCache(path)
+            )
+        return _embedding_functions[path]
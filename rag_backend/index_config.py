@@ -0,0 +1,80 @@
+import json
+import os
+from typing import Dict
+
+# HNSW settings applied when a collection is created. Chroma fixes them at creation
+# time, so changing them for an existing collection means running reindex.py.
+#   space            distance: "cosine", "l2" or "ip"
+#   M                graph links per node; more means better recall and more memory
+#   construction_ef  candidate list while building; more means a better graph and slower inserts
+#   search_ef        candidate list while querying; more means better recall and slower queries
+INDEX_PARAMS = ("space", "M", "construction_ef", "search_ef")
+SPACES = ("cosine", "l2", "ip")
+
+# Chroma's defaults, except cosine: the sentence-transformer embeddings are compared by angle
+DEFAULT_INDEX_CONFIG = {"space": "cosine", "M": 16, "construction_ef": 100, "search_ef": 10}
+
+# Per-collection overrides; shards (case_law__<court>) use their base collection's entry
+COLLECTION_INDEX_CONFIG = {
+    "case_law": {"M": 32, "construction_ef": 200, "search_ef": 64}
+}
+
+class IndexConfigError(ValueError):
+    pass
+
+def validate(config: Dict) -> Dict:
+    unknown = set(config) - set(INDEX_PARAMS)
+    if unknown:
+        raise IndexConfigError(f"Unknown index parameters: {', '.join(sorted(unknown))}")
+    if "space" in config and config["space"] not in SPACES:
+        raise IndexConfigError(f"Unknown space {config['space']!r}, expected one of: {', '.join(SPACES)}")
+    for param in ("M", "construction_ef", "search_ef"):
+        if param in config and (not isinstance(config[param], int) or config[param] < 1):
+            raise IndexConfigError(f"{param} must be a positive integer")
+    return config
+
+def _load_overrides() -> Dict[str, Dict]:
+    # e.g. RAG_INDEX_CONFIG='{"insurance_qa": {"search_ef": 100}}'
+    raw = os.environ.get("RAG_INDEX_CONFIG")
+    if not raw:
+        return {}
+    overrides = json.loads(raw)
+    for config in overrides.values():
+        validate(config)
+    return overrides
+
+_overrides = _load_overrides()
+
+def config_for(collection_name: str) -> Dict:
+    """Index settings for a new collection: defaults, then the repo presets, then RAG_INDEX_CONFIG"""
+    # Shards are named <collection>__<value> (see sharding.py)
+    base_name = collection_name.split("__", 1)[0]
+    config = dict(DEFAULT_INDEX_CONFIG)
+    for name in dict.fromkeys((base_name, collection_name)):
+        config.update(COLLECTION_INDEX_CONFIG.get(name, {}))
+        config.update(_overrides.get(name, {}))
+    return config
+
+def hnsw_metadata(config: Dict) -> Dict:
+    return {f"hnsw:{param}": value for param, value in config.items()}
+
+def current_config(collection) -> Dict:
+    """Settings an existing collection was built with (Chroma's defaults where none were given)"""
+    metadata = collection.metadata or {}
+    defaults = dict(DEFAULT_INDEX_CONFIG, space="l2")
+    return {param: metadata.get(f"hnsw:{param}", defaults[param]) for param in INDEX_PARAMS}
+
+def open_collection(client, name: str, embedding_function=None):
+    """Get a collection, creating it with its configured index settings if it doesn't exist.
+
+    Existing collections are opened without metadata: get_or_create_collection
+    would overwrite their stored hnsw:* settings without rebuilding the index.
+    """
+    try:
+        return client.get_collection(name=name, embedding_function=embedding_function)
+    except ValueError:
+        return client.get_or_create_collection(
+            name=name,
+            metadata=hnsw_metadata(config_for(name)),
+            embedding_function=embedding_function
+        )
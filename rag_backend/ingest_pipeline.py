@@ -0,0 +1,289 @@
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List
+
+import ingestion
+
+EXTRACT_QUEUE_SIZE = 16  # pages
+CHUNK_QUEUE_SIZE = 256  # chunks
+WRITE_QUEUE_SIZE = 8  # embedded batches
+EMBED_BATCH_SIZE = 64
+
+_DONE = object()
+
+class StageStats:
+    """Items handled and busy time (excluding queue waits) for one pipeline stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy, 3),
+            "items_per_second": round(self.items / self.busy, 1) if self.busy else None
+        }
+
+class MonitoredQueue:
+    """Bounded queue that samples its occupancy on every put"""
+
+    def __init__(self, name: str, maxsize: int, stop: threading.Event):
+        self.name = name
+        self.maxsize = maxsize
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stop = stop
+        self.samples = 0
+        self.total_occupancy = 0
+        self.max_occupancy = 0
+
+    def put(self, item):
+        occupancy = self._queue.qsize()
+        self.samples += 1
+        self.total_occupancy += occupancy
+        self.max_occupancy = max(self.max_occupancy, occupancy)
+        # Block for backpressure, but give up promptly if another stage failed
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(self):
+        while True:
+            try:
+                return self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _DONE
+
+    def as_dict(self) -> Dict:
+        return {
+            "maxsize": self.maxsize,
+            "avg_occupancy": round(self.total_occupancy / self.samples, 2) if self.samples else 0,
+            "max_occupancy": self.max_occupancy
+        }
+
+def extract_pdf_pages(path: str) -> Iterator[str]:
+    """Yield the text of each PDF page as soon as it is parsed"""
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        print(f"PDF has {len(pdf.pages)} pages")
+        for page in pdf.pages:
+            yield page.extract_text() or ""
+            # Release the parsed page objects, they are not needed once the text is out
+            page.flush_cache()
+
+class StreamingSplitter:
+    """Feeds page text through RecursiveCharacterTextSplitter without holding the whole document.
+
+    Text is buffered until it spans several chunks; all but the last chunk are
+    emitted and the last one is kept as the start of the next buffer, so the
+    configured overlap is preserved across page boundaries.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        self.chunk_size = chunk_size
+        self._splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        if text:
+            self._buffer += text + "\n\n"
+        if len(self._buffer) < self.chunk_size * 4:
+            return []
+        chunks = self._splitter.split_text(self._buffer)
+        self._buffer = chunks[-1] if chunks else ""
+        return chunks[:-1]
+
+    def finish(self) -> List[str]:
+        chunks = self._splitter.split_text(self._buffer) if self._buffer.strip() else []
+        self._buffer = ""
+        return chunks
+
+class IngestionPipeline:
+    """Streams one document through extract -> chunk -> embed -> write stages.
+
+    Each stage runs in its own thread and hands work to the next through a
+    bounded queue, so extraction of later pages overlaps with embedding and
+    writing of earlier chunks while memory stays bounded. Only chunks whose
+    content is not already stored for the source are embedded (see
+    ingestion.sync_source for the non-streaming equivalent).
+    """
+
+    def __init__(self, collection, source_path: str, base_metadata: Dict, embed_fn: Callable[[List[str]], List[List[float]]],
+                 lexical_index=None, chunk_size: int = 1000, chunk_overlap: int = 200, embed_batch_size: int = EMBED_BATCH_SIZE):
+        self.collection = collection
+        self.source_path = source_path
+        self.base_metadata = dict(base_metadata, source_path=source_path)
+        self.embed_fn = embed_fn
+        self.lexical_index = lexical_index
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embed_batch_size = embed_batch_size
+
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self.stats = {name: StageStats(name) for name in ("extract", "chunk", "embed", "write")}
+        self.pages = MonitoredQueue("pages", EXTRACT_QUEUE_SIZE, self._stop)
+        self.chunks = MonitoredQueue("chunks", CHUNK_QUEUE_SIZE, self._stop)
+        self.writes = MonitoredQueue("writes", WRITE_QUEUE_SIZE, self._stop)
+
+        self._existing: Dict[str, Dict] = {}
+        self._seen_ids: List[str] = []
+        # Chunks whose content is stored but whose metadata moved; updated in _finalize
+        self._stale: Dict[str, Dict] = {}
+        self._counts = {"added": 0, "updated": 0, "unchanged": 0}
+        self._deleted = 0
+
+    def run(self, pages: Iterable[str]) -> Dict:
+        started = time.perf_counter()
+        self._existing = ingestion.existing_source_chunks(
+            self.collection, self.source_path, self.base_metadata.get("source")
+        )
+
+        threads = [
+            threading.Thread(target=self._guard, args=(self._extract_stage, pages), name="ingest-extract"),
+            threading.Thread(target=self._guard, args=(self._chunk_stage,), name="ingest-chunk"),
+            threading.Thread(target=self._guard, args=(self._embed_stage,), name="ingest-embed"),
+            threading.Thread(target=self._guard, args=(self._write_stage,), name="ingest-write"),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+        total_chunks = len(self._seen_ids)
+        if total_chunks == 0:
+            raise ValueError("No text could be extracted from the document")
+        self._finalize()
+
+        summary = dict(self._counts, chunks=total_chunks, deleted=self._deleted)
+        report = {
+            "summary": summary,
+            "seconds": round(time.perf_counter() - started, 3),
+            "stages": {name: stage.as_dict() for name, stage in self.stats.items()},
+            "queues": {q.name: q.as_dict() for q in (self.pages, self.chunks, self.writes)}
+        }
+        print(f"Ingested {self.source_path}: {report}")
+        return report
+
+    def _guard(self, stage, *args):
+        try:
+            stage(*args)
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _extract_stage(self, pages: Iterable[str]):
+        stats = self.stats["extract"]
+        iterator = iter(pages)
+        while not self._stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                text = next(iterator)
+            except StopIteration:
+                break
+            stats.busy += time.perf_counter() - t0
+            stats.items += 1
+            self.pages.put(text)
+        self.pages.put(_DONE)
+
+    def _chunk_stage(self):
+        stats = self.stats["chunk"]
+        splitter = StreamingSplitter(self.chunk_size, self.chunk_overlap)
+        while True:
+            text = self.pages.get()
+            t0 = time.perf_counter()
+            chunks = splitter.finish() if text is _DONE else splitter.feed(text)
+            stats.busy += time.perf_counter() - t0
+            for chunk in chunks:
+                stats.items += 1
+                self.chunks.put(chunk)
+            if text is _DONE:
+                break
+        self.chunks.put(_DONE)
+
+    def _embed_stage(self):
+        stats = self.stats["embed"]
+        assigner = ingestion.ChunkIdAssigner(self.source_path)
+        batch = []
+        while True:
+            chunk = self.chunks.get()
+            if chunk is not _DONE:
+                batch.append(chunk)
+            if batch and (chunk is _DONE or len(batch) >= self.embed_batch_size):
+                t0 = time.perf_counter()
+                self._embed_batch(batch, assigner)
+                stats.busy += time.perf_counter() - t0
+                batch = []
+            if chunk is _DONE:
+                break
+        self.writes.put(_DONE)
+
+    def _embed_batch(self, batch: List[str], assigner: ingestion.ChunkIdAssigner):
+        new_ids, new_docs, new_metas = [], [], []
+        for text in batch:
+            doc_id = assigner.next_id(text)
+            metadata = dict(self.base_metadata, chunk_index=len(self._seen_ids))
+            self._seen_ids.append(doc_id)
+
+            # Streamed chunks carry no total_chunks (unknown until the stream ends), so new
+            # chunks are written once with their final metadata
+            stored = self._existing.get(doc_id)
+            if stored is None:
+                new_ids.append(doc_id)
+                new_docs.append(text)
+                new_metas.append(metadata)
+            elif not ingestion.same_metadata(stored, metadata):
+                self._stale[doc_id] = metadata
+                self._counts["updated"] += 1
+            else:
+                self._counts["unchanged"] += 1
+
+        if new_ids:
+            embeddings = self.embed_fn(new_docs)
+            self.stats["embed"].items += len(new_ids)
+            self._counts["added"] += len(new_ids)
+            self.writes.put((new_ids, new_docs, new_metas, embeddings))
+
+    def _write_stage(self):
+        stats = self.stats["write"]
+        while True:
+            item = self.writes.get()
+            if item is _DONE:
+                break
+            ids, documents, metadatas, embeddings = item
+            t0 = time.perf_counter()
+            self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+            if self.lexical_index is not None:
+                self.lexical_index.add(ids, documents)
+            stats.busy += time.perf_counter() - t0
+            stats.items += len(ids)
+
+    def _finalize(self):
+        """Re-tag stored chunks whose metadata moved and delete chunks that vanished from the source"""
+        stale_ids, stale_metas = list(self._stale), list(self._stale.values())
+        for start in range(0, len(stale_ids), ingestion.WRITE_BATCH_SIZE):
+            end = start + ingestion.WRITE_BATCH_SIZE
+            self.collection.update(ids=stale_ids[start:end], metadatas=stale_metas[start:end])
+
+        seen = set(self._seen_ids)
+        vanished = [doc_id for doc_id in self._existing if doc_id not in seen]
+        for start in range(0, len(vanished), ingestion.WRITE_BATCH_SIZE):
+            self.collection.delete(ids=vanished[start:start + ingestion.WRITE_BATCH_SIZE])
+        if vanished and self.lexical_index is not None:
+            self.lexical_index.remove(vanished)
+        self._deleted = len(vanished)
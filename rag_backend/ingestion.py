@@ -0,0 +1,181 @@
+import hashlib
+import time
+from typing import Dict, List, Optional
+
+# Keep individual Chroma writes well below the client's max batch size
+WRITE_BATCH_SIZE = 500
+
+class ChunkIdAssigner:
+    """Content-addressed chunk ids: hash of source path, chunk text and occurrence number.
+
+    The occurrence number keeps ids unique when the same text (e.g. a repeated
+    heading) appears more than once in one source. Ids are assigned in order,
+    so chunks can be fed one at a time as they are produced.
+    """
+
+    def __init__(self, source_path: str):
+        self.source_path = source_path
+        self._seen: Dict[str, int] = {}
+
+    def next_id(self, text: str) -> str:
+        digest = hashlib.sha256(f"{self.source_path}\0{text}".encode("utf-8")).hexdigest()
+        occurrence = self._seen.get(digest, 0)
+        self._seen[digest] = occurrence + 1
+        return digest if occurrence == 0 else f"{digest}-{occurrence}"
+
+def chunk_ids(source_path: str, documents: List[str]) -> List[str]:
+    assigner = ChunkIdAssigner(source_path)
+    return [assigner.next_id(text) for text in documents]
+
+def existing_source_chunks(collection, source_path: str, source: Optional[str] = None) -> Dict[str, Dict]:
+    """Map id -> metadata for the chunks currently stored for a source.
+
+    Chunks written before content-addressed ids have no "source_path"; those
+    are matched by their "source" filename so a re-upload replaces them, but
+    only when their relative path (or, without one, the filename) is this
+    source path, so same-named files in other folders are left alone.
+    """
+    existing = collection.get(where={"source_path": source_path}, include=["metadatas"])
+    chunks = dict(zip(existing["ids"], existing["metadatas"]))
+    if source:
+        legacy = collection.get(where={"source": source}, include=["metadatas"])
+        for doc_id, metadata in zip(legacy["ids"], legacy["metadatas"]):
+            if "source_path" not in metadata and metadata.get("relative_path", source) == source_path:
+                chunks[doc_id] = metadata
+    return chunks
+
+class SyncPlan:
+    """Writes needed to bring a collection in line with one or more sources"""
+
+    def __init__(self):
+        self.upsert_ids: List[str] = []
+        self.upsert_documents: List[str] = []
+        self.upsert_metadatas: List[Dict] = []
+        self.update_ids: List[str] = []
+        self.update_metadatas: List[Dict] = []
+        self.delete_ids: List[str] = []
+        self.chunks = 0
+
+    def extend(self, other: "SyncPlan"):
+        self.upsert_ids += other.upsert_ids
+        self.upsert_documents += other.upsert_documents
+        self.upsert_metadatas += other.upsert_metadatas
+        self.update_ids += other.update_ids
+        self.update_metadatas += other.update_metadatas
+        self.delete_ids += other.delete_ids
+        self.chunks += other.chunks
+
+    def summary(self) -> Dict:
+        return {
+            "chunks": self.chunks,
+            "added": len(self.upsert_ids),
+            "updated": len(self.update_ids),
+            "deleted": len(self.delete_ids),
+            "unchanged": self.chunks - len(self.upsert_ids) - len(self.update_ids)
+        }
+
+def same_metadata(stored: Dict, metadata: Dict) -> bool:
+    """Whether stored chunk metadata already matches; total_chunks, which older ingests
+    wrote and current ones don't, is ignored so those chunks aren't re-tagged forever"""
+    return {key: value for key, value in stored.items() if key != "total_chunks"} == metadata
+
+def plan_source_sync(collection, source_path: str, documents: List[str], metadatas: List[Dict]) -> SyncPlan:
+    """Work out which chunks of a source must be embedded, re-tagged or deleted.
+
+    Only chunks whose content is new are embedded and upserted; chunks whose
+    content is unchanged but whose metadata moved (e.g. chunk_index) get a
+    metadata-only update, and chunks that vanished from the source are deleted.
+    """
+    for metadata in metadatas:
+        metadata["source_path"] = source_path
+    ids = chunk_ids(source_path, documents)
+    existing = existing_source_chunks(collection, source_path, metadatas[0].get("source") if metadatas else None)
+
+    plan = SyncPlan()
+    plan.chunks = len(ids)
+    for doc_id, document, metadata in zip(ids, documents, metadatas):
+        if doc_id not in existing:
+            plan.upsert_ids.append(doc_id)
+            plan.upsert_documents.append(document)
+            plan.upsert_metadatas.append(metadata)
+        elif not same_metadata(existing[doc_id], metadata):
+            plan.update_ids.append(doc_id)
+            plan.update_metadatas.append(metadata)
+    wanted = set(ids)
+    plan.delete_ids = [doc_id for doc_id in existing if doc_id not in wanted]
+    return plan
+
+def apply_sync_plan(collection, plan: SyncPlan, lexical_index=None, batch_size: int = WRITE_BATCH_SIZE,
+                    embed_fn=None, stats: Optional[Dict] = None):
+    """Apply a SyncPlan to the collection (and BM25 index) in batches.
+
+    With embed_fn, new chunks are embedded here rather than inside Chroma's
+    upsert, so a stats dict can time embedding and writing separately
+    (embed_seconds, write_seconds, index_seconds are added to it).
+    """
+    timings = {"embed_seconds": 0.0, "write_seconds": 0.0, "index_seconds": 0.0}
+    for start in range(0, len(plan.upsert_ids), batch_size):
+        end = start + batch_size
+        documents = plan.upsert_documents[start:end]
+        t0 = time.perf_counter()
+        embeddings = embed_fn(documents) if embed_fn is not None else None
+        t1 = time.perf_counter()
+        collection.upsert(
+            ids=plan.upsert_ids[start:end],
+            documents=documents,
+            metadatas=plan.upsert_metadatas[start:end],
+            embeddings=embeddings
+        )
+        timings["embed_seconds"] += t1 - t0
+        timings["write_seconds"] += time.perf_counter() - t1
+    t0 = time.perf_counter()
+    for start in range(0, len(plan.update_ids), batch_size):
+        end = start + batch_size
+        collection.update(ids=plan.update_ids[start:end], metadatas=plan.update_metadatas[start:end])
+    for start in range(0, len(plan.delete_ids), batch_size):
+        collection.delete(ids=plan.delete_ids[start:start + batch_size])
+    t1 = time.perf_counter()
+    timings["write_seconds"] += t1 - t0
+
+    if lexical_index is not None:
+        if plan.delete_ids:
+            lexical_index.remove(plan.delete_ids)
+        if plan.upsert_ids:
+            lexical_index.add(plan.upsert_ids, plan.upsert_documents)
+    timings["index_seconds"] += time.perf_counter() - t1
+    if stats is not None:
+        for key, seconds in timings.items():
+            stats[key] = stats.get(key, 0.0) + seconds
+
+def sync_source(collection, source_path: str, documents: List[str], metadatas: List[Dict], lexical_index=None,
+                embed_fn=None, stats: Optional[Dict] = None) -> Dict:
+    """Make the collection's chunks for source_path match documents/metadatas.
+
+    Pass a dict as stats to collect per-stage timings (plan, embed, write,
+    index); see apply_sync_plan for embed_fn.
+    """
+    t0 = time.perf_counter()
+    plan = plan_source_sync(collection, source_path, documents, metadatas)
+    if stats is not None:
+        stats["plan_seconds"] = stats.get("plan_seconds", 0.0) + time.perf_counter() - t0
+    apply_sync_plan(collection, plan, lexical_index, embed_fn=embed_fn, stats=stats)
+    summary = plan.summary()
+    print(f"Synced {source_path}: {summary}")
+    return summary
+
+def parse_qa_csv(content: str, source: str):
+    """Turn a Question,Answer CSV into (documents, metadatas), one QA pair per row"""
+    documents = []
+    metadatas = []
+    for line in content.splitlines()[1:]:  # Skip header
+        parts = line.split(',')
+        if len(parts) >= 2:
+            question = parts[0].strip('"')
+            answer = parts[1].strip('"')
+            documents.append(f"Question: {question}\nAnswer: {answer}")
+            metadatas.append({
+                "source": source,
+                "type": "qa_pair",
+                "question": question
+            })
+    return documents, metadatas
@@ -1,15 +1,47 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
-import chromadb
 import os
+import sys
+# Modules shared with the other service live in the repo's common/ package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import json
-import uvicorn
-import pdfplumber
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import threading
+import time
+import bm25_index
+import reranker
+import ingestion
+import embedding_cache
+import context_builder
+from common import profiling
+import columnar_export
+import compact_index
+import residency
+import sharding
+import index_config
+from ingest_pipeline import IngestionPipeline, extract_pdf_pages
+from originals_store import OriginalsStore, RangeNotSatisfiable, iter_file_range, parse_range
+from urllib.parse import quote
+from common.compression import CompressionMiddleware
+from common.profiling import ProfilingMiddleware
 
-app = FastAPI()
+# orjson is several times faster than the stdlib encoder for large match lists
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+
+    def ndjson_line(value) -> bytes:
+        return orjson.dumps(value) + b"\n"
+except ImportError:
+    FastJSONResponse = JSONResponse
+
+    def ndjson_line(value) -> bytes:
+        return (json.dumps(value) + "\n").encode("utf-8")
+
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -20,18 +52,265 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiated gzip; responses smaller than this are not worth compressing
+COMPRESSION_MIN_SIZE = int(os.environ.get("RAG_COMPRESSION_MIN_SIZE", "1024"))
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# Opt-in per-request profiling: with RAG_PROFILING=1, send "X-Profile: 1" or ?profile=1
+PROFILING_ENABLED = os.environ.get("RAG_PROFILING", "0") == "1"
+PROFILE_DIR = os.environ.get("RAG_PROFILE_DIR", "profiles")
+app.add_middleware(ProfilingMiddleware, enabled=PROFILING_ENABLED, directory=PROFILE_DIR)
+
+DB_PATH = os.environ.get("RAG_DB_PATH", "../db")
+
+# Server-side ceiling on n_results for every query endpoint
+MAX_N_RESULTS = int(os.environ.get("RAG_MAX_N_RESULTS", "1000"))
+# Matches materialized per Chroma get() when streaming NDJSON results
+STREAM_PAGE_SIZE = int(os.environ.get("RAG_STREAM_PAGE_SIZE", "100"))
+
+# Number of candidates pulled from each ranker before fusion, per requested result
+HYBRID_CANDIDATE_FACTOR = 4
+
 class QueryRequest(BaseModel):
     query: str
     n_results: Optional[int] = 3
     collection: str
+    mode: Optional[str] = "vector"  # "vector" or "hybrid" (BM25 + vector, fused with RRF)
+    rerank: Optional[bool] = False  # Rescore a wider candidate set with a cross-encoder
+    rerank_candidates: Optional[int] = 50  # Candidates retrieved before reranking down to n_results
+    fields: Optional[List[str]] = None  # Subset of MATCH_FIELDS to return; all when omitted
+    preview_chars: Optional[int] = None  # Truncate returned text to this many characters
+    format: Optional[str] = "json"  # /query_direct only: "json", "arrow" (Arrow IPC) or "packed" (NumPy frames)
+    where: Optional[dict] = None  # Chroma metadata filter, e.g. {"court": "Supreme Court"}
+    where_document: Optional[dict] = None  # Chroma document filter, e.g. {"$contains": "negligence"}
+    compact: Optional[bool] = False  # Search the quantized tier (compact_index.py) where one is built
+
+MATCH_FIELDS = ("id", "text", "metadata", "distance", "score", "rerank_score")
+# /query field names mapped to the keys /query_direct returns
+RAW_RESULT_FIELDS = {"id": "ids", "text": "documents", "metadata": "metadatas", "distance": "distances"}
+
+def project_matches(matches: List[dict], fields: Optional[List[str]], preview_chars: Optional[int]) -> List[dict]:
+    """Keep only the requested match fields and optionally truncate text to a preview"""
+    if fields is None and preview_chars is None:
+        return matches
+    wanted = set(fields) if fields is not None else set(MATCH_FIELDS)
+    projected = []
+    for match in matches:
+        item = {key: value for key, value in match.items() if key in wanted}
+        if preview_chars is not None and item.get("text"):
+            item["text"] = item["text"][:preview_chars]
+        projected.append(item)
+    return projected
+
+def wants(request: QueryRequest, field: str) -> bool:
+    return request.fields is None or field in request.fields
+
+class ContextRequest(QueryRequest):
+    token_budget: Optional[int] = context_builder.DEFAULT_TOKEN_BUDGET
 
 class DeleteRequest(BaseModel):
     source: str
     collection: str
 
 def get_collection(name: str):
-    client = chromadb.PersistentClient(path="../db")
-    return client.get_or_create_collection(name=name)
+    client = residency.get_client(DB_PATH)
+    # Chroma loads (and, under a memory budget, evicts) the vector index itself; this records the use
+    residency.manager.touch(name, "vector")
+    # New collections are created with their configured HNSW settings (index_config.py)
+    return index_config.open_collection(client, name, embedding_cache.get_embedding_function(DB_PATH))
+
+def embed_query(query: str) -> List[float]:
+    # Queries skip the embedding cache (see CachedEmbeddingFunction.embed_query), so they are
+    # embedded here and handed to Chroma as vectors rather than as query_texts
+    return embedding_cache.get_embedding_function(DB_PATH).embed_query(query)
+
+def get_lexical_index(name: str) -> bm25_index.BM25Index:
+    index = bm25_index.get_index(DB_PATH, name)
+    residency.manager.touch(name, "bm25", residency.BM25_HANDLE_BYTES, lambda: bm25_index.unload(DB_PATH, name))
+    return index
+
+def get_compact_index(name: str) -> Optional[compact_index.CompactIndex]:
+    index = compact_index.get_index(DB_PATH, name)
+    if index is not None:
+        residency.manager.touch(name, "compact", index.memory_bytes(), lambda: compact_index.unload(DB_PATH, name))
+    return index
+
+_originals_store = None
+
+def get_originals_store() -> OriginalsStore:
+    global _originals_store
+    if _originals_store is None:
+        _originals_store = OriginalsStore(os.path.join(DB_PATH, "originals"))
+    return _originals_store
+
+def search_targets(collection_name: str, where: Optional[dict] = None) -> List[str]:
+    """Collections a query has to touch: the collection itself, or the shards its filter allows"""
+    if not sharding.is_sharded(collection_name):
+        return [collection_name]
+    client = residency.get_client(DB_PATH)
+    targets = sharding.target_shards(client, collection_name, where)
+    print(f"Sharded collection {collection_name}: searching {len(targets)} shard(s)")
+    return targets
+
+def compact_query(name: str, index: compact_index.CompactIndex, query_embedding, n_results: int, include: List[str],
+                  where: Optional[dict] = None, where_document: Optional[dict] = None) -> dict:
+    """Search a collection's compact tier, then fetch the requested fields from Chroma"""
+    rows = None
+    if where or where_document:
+        # Chroma answers a get without embeddings from its metadata store alone, leaving HNSW unloaded
+        with profiling.span("filter"):
+            allowed = get_collection(name).get(where=where or None, where_document=where_document or None, include=[])
+            rows = index.rows_for_ids(allowed["ids"])
+    with profiling.span("search"):
+        ids, distances = index.search(query_embedding, n_results, rows=rows)
+    fetch_include = [key for key in ("documents", "metadatas") if key in include]
+    with profiling.span("fetch"):
+        records = get_collection(name).get(ids=ids, include=fetch_include) if ids else {"ids": []}
+    by_id = {doc_id: i for i, doc_id in enumerate(records["ids"])}
+    # Chunks deleted since the tier was built are dropped here
+    kept = [i for i, doc_id in enumerate(ids) if doc_id in by_id]
+    results = {"ids": [[ids[i] for i in kept]], "distances": [[distances[i] for i in kept]]}
+    for key in fetch_include:
+        results[key] = [[records[key][by_id[ids[i]]] for i in kept]]
+    return results
+
+def unique_by_id(items: list, key) -> list:
+    """First occurrence of each id; a base collection being split holds copies of its shards' chunks"""
+    seen = set()
+    unique = []
+    for item in items:
+        if key(item) not in seen:
+            seen.add(key(item))
+            unique.append(item)
+    return unique
+
+def vector_query(names: List[str], query: str, n_results: int, include: List[str],
+                 where: Optional[dict] = None, where_document: Optional[dict] = None, compact: bool = False) -> dict:
+    """Nearest neighbours across one or more collections, as flat ids/documents/metadatas/distances lists"""
+    include = list(dict.fromkeys(include + ["distances"]))
+    # Embed once and reuse the vector for every shard
+    query_embedding = embed_query(query)
+
+    rows = []
+    for name in names:
+        index = get_compact_index(name) if compact else None
+        if index is not None:
+            results = compact_query(name, index, query_embedding, n_results, include, where, where_document)
+        else:
+            with profiling.span("search"):
+                results = get_collection(name).query(
+                    n_results=n_results,
+                    where=where or None,
+                    where_document=where_document or None,
+                    include=include,
+                    query_embeddings=[query_embedding]
+                )
+        ids = results["ids"][0] if results.get("ids") else []
+        for i, doc_id in enumerate(ids):
+            rows.append((
+                results["distances"][0][i],
+                doc_id,
+                results["documents"][0][i] if results.get("documents") else None,
+                results["metadatas"][0][i] if results.get("metadatas") else None
+            ))
+    if len(names) > 1:
+        # Shards share one embedding model, so their distances compare directly
+        rows.sort(key=lambda row: row[0])
+        rows = unique_by_id(rows, lambda row: row[1])[:n_results]
+
+    merged = {"ids": [row[1] for row in rows], "distances": [row[0] for row in rows]}
+    if "documents" in include:
+        merged["documents"] = [row[2] for row in rows]
+    if "metadatas" in include:
+        merged["metadatas"] = [row[3] for row in rows]
+    return merged
+
+def browse_collections(names: List[str], limit: int, include: List[str],
+                       where: Optional[dict] = None, where_document: Optional[dict] = None) -> dict:
+    """The first `limit` chunks matching the filters across collections, in storage order"""
+    merged = {"ids": [], "documents": [], "metadatas": []}
+    for name in names:
+        remaining = limit - len(merged["ids"])
+        if remaining <= 0:
+            break
+        with profiling.span("fetch"):
+            page = get_collection(name).get(
+                limit=remaining,
+                where=where or None,
+                where_document=where_document or None,
+                include=include
+            )
+        seen = set(merged["ids"])
+        for i, doc_id in enumerate(page["ids"]):
+            # Skip copies of chunks a base collection being split shares with its shards
+            if doc_id in seen:
+                continue
+            merged["ids"].append(doc_id)
+            for key in ("documents", "metadatas"):
+                if key in include:
+                    merged[key].append(page[key][i])
+    return {key: value for key, value in merged.items() if key == "ids" or key in include}
+
+def hybrid_search(collection, collection_name: str, query: str, limit: int,
+                  where: Optional[dict] = None, where_document: Optional[dict] = None):
+    """Fuse BM25 and vector rankings with reciprocal rank fusion"""
+    n_candidates = limit * HYBRID_CANDIDATE_FACTOR
+
+    lexical_index = get_lexical_index(collection_name)
+    # Uploads keep both in step; a count mismatch means chunks were written or deleted around the index
+    if lexical_index.count() != collection.count():
+        print(f"BM25 index for {collection_name} is out of step with the collection, syncing")
+        lexical_index.sync(collection)
+    with profiling.span("lexical_search"):
+        lexical_hits = lexical_index.search(query, n_candidates)
+
+    with profiling.span("search"):
+        vector_results = collection.query(
+            query_embeddings=[embed_query(query)],
+            n_results=min(n_candidates, max(collection.count(), 1)),
+            where=where or None,
+            where_document=where_document or None,
+            include=["distances"]
+        )
+    vector_ids = vector_results["ids"][0] if vector_results["ids"] else []
+    vector_distances = dict(zip(vector_ids, vector_results["distances"][0] if vector_results["distances"] else []))
+    print(f"Hybrid search: {len(lexical_hits)} lexical hits, {len(vector_ids)} vector hits")
+
+    fused = bm25_index.reciprocal_rank_fusion([[doc_id for doc_id, _ in lexical_hits], vector_ids])
+    if not (where or where_document):
+        fused = fused[:limit]
+    if not fused:
+        return []
+
+    # BM25 knows nothing about metadata: with filters, the fetch drops lexical hits that don't match
+    fused_ids = [doc_id for doc_id, _ in fused]
+    with profiling.span("fetch"):
+        records = collection.get(
+            ids=fused_ids,
+            where=where or None,
+            where_document=where_document or None,
+            include=["documents", "metadatas"]
+        )
+    by_id = {
+        doc_id: (records["documents"][i], records["metadatas"][i])
+        for i, doc_id in enumerate(records["ids"])
+    }
+
+    matches = []
+    for doc_id, score in fused:
+        if doc_id not in by_id:
+            continue
+        doc_text, doc_metadata = by_id[doc_id]
+        matches.append({
+            "id": doc_id,
+            "text": doc_text,
+            "metadata": doc_metadata,
+            "distance": vector_distances.get(doc_id),
+            "score": score
+        })
+        if len(matches) >= limit:
+            break
+    return matches
 
 @app.post("/upload")
 async def upload_document(file: UploadFile = File(...), collection: str = Form(...), metadata: str = Form(None)):
@@ -55,6 +334,15 @@ async def upload_document(file: UploadFile = File(...), collection: str = Form(.
         # Read file content
         content = await file.read()
         print(f"Read {len(content)} bytes from file")
+
+        # Chunks are keyed by source path, so same-named files in different folders don't collide
+        source_path = metadata or file.filename
+        lexical_index = get_lexical_index(collection)
+        
+        # Keep the original so it can be downloaded later; identical files are stored once
+        if file.filename.lower().endswith(('.csv', '.pdf')):
+            content_hash = get_originals_store().put(content, file.filename, file.content_type, source_path)
+            print(f"Stored original {file.filename} as {content_hash}")
         
         if file.filename.lower().endswith('.csv'):
             print("Processing CSV file...")
@@ -64,22 +352,27 @@ async def upload_document(file: UploadFile = File(...), collection: str = Form(.
                 raise HTTPException(status_code=400, detail="CSV file is empty or invalid")
             
             # Process each line as a QA pair
-            for i, line in enumerate(lines[1:], 1):  # Skip header
-                parts = line.split(',')
-                if len(parts) >= 2:
-                    question = parts[0].strip('"')
-                    answer = parts[1].strip('"')
-                    
-                    # Add to ChromaDB
-                    db_collection.add(
-                        documents=[f"Question: {question}\nAnswer: {answer}"],
-                        metadatas=[{
-                            "source": file.filename,
-                            "type": "qa_pair",
-                            "question": question
-                        }],
-                        ids=[f"{file.filename}-{i}"]
-                    )
+            started = time.perf_counter()
+            documents, metadatas = ingestion.parse_qa_csv(content.decode(), file.filename)
+            stages = {"parse_seconds": time.perf_counter() - started}
+            target = sharding.write_target(collection, metadatas[0] if metadatas else {})
+            if target != collection:
+                print(f"Routing {file.filename} to shard {target}")
+                db_collection = get_collection(target)
+                lexical_index = get_lexical_index(target)
+
+            # Add to ChromaDB, embedding only new or changed pairs
+            with profiling.span("sync"):
+                summary = ingestion.sync_source(
+                    db_collection, source_path, documents, metadatas, lexical_index,
+                    embed_fn=embedding_cache.get_embedding_function(DB_PATH),
+                    stats=stages
+                )
+            return {
+                "message": f"Successfully processed {file.filename}",
+                "summary": summary,
+                "stages": {name[:-len("_seconds")]: round(seconds, 3) for name, seconds in stages.items()}
+            }
         
         elif file.filename.lower().endswith('.pdf'):
             print("Processing PDF file...")
@@ -103,62 +396,51 @@ async def upload_document(file: UploadFile = File(...), collection: str = Form(.
                 print(f"Temp file size: {os.path.getsize(temp_path)} bytes")
                 print(f"Content type: {file.content_type}")
 
-                print(f"Extracting text from PDF: {file.filename}")
-                # Extract text from PDF
-                extracted_text = ""
-                try:
-                    with pdfplumber.open(temp_path) as pdf:
-                        print(f"PDF has {len(pdf.pages)} pages")
-                        for page_num, page in enumerate(pdf.pages, 1):
-                            print(f"Processing page {page_num}")
-                            text = page.extract_text()
-                            if text:
-                                extracted_text += text + "\n\n"
-                except Exception as e:
-                    print(f"Error in pdfplumber: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
-                    raise HTTPException(status_code=500, detail=f"Error extracting text from PDF: {str(e)}")
-
-                if not extracted_text.strip():
-                    raise HTTPException(status_code=400, detail="No text could be extracted from the PDF")
-
-                print(f"Splitting text into chunks for {file.filename}")
-                # Split text into chunks
-                text_splitter = RecursiveCharacterTextSplitter(
+                # Base metadata shared by every chunk of this PDF
+                base_metadata = {
+                    "source": file.filename,
+                    "type": "pdf_document"
+                }
+                
+                # Add relative path to metadata if provided
+                if metadata:
+                    base_metadata["relative_path"] = metadata
+                    # Extract court level from path for case law
+                    if collection == "case_law":
+                        path_parts = metadata.split(os.sep)
+                        if len(path_parts) > 0:
+                            base_metadata["court"] = path_parts[0]
+
+                target = sharding.write_target(collection, base_metadata)
+                if target != collection:
+                    print(f"Routing {file.filename} to shard {target}")
+                    db_collection = get_collection(target)
+                    lexical_index = get_lexical_index(target)
+
+                print(f"Streaming {file.filename} through the ingestion pipeline")
+                # Extraction, chunking, embedding and writes run as overlapping stages;
+                # only new or changed chunks are embedded, vanished ones are deleted
+                pipeline = IngestionPipeline(
+                    db_collection,
+                    source_path,
+                    base_metadata,
+                    embed_fn=embedding_cache.get_embedding_function(DB_PATH),
+                    lexical_index=lexical_index,
                     chunk_size=1000,
-                    chunk_overlap=200,
-                    length_function=len,
+                    chunk_overlap=200
                 )
-                chunks = text_splitter.split_text(extracted_text)
-
-                print(f"Adding {len(chunks)} chunks to ChromaDB for {file.filename}")
-                # Add chunks to ChromaDB with enhanced metadata
-                for i, chunk in enumerate(chunks):
-                    metadata_dict = {
-                        "source": file.filename,
-                        "type": "pdf_document",
-                        "chunk_index": i,
-                        "total_chunks": len(chunks)
-                    }
-                    
-                    # Add relative path to metadata if provided
-                    if metadata:
-                        metadata_dict["relative_path"] = metadata
-                        # Extract court level from path for case law
-                        if collection == "case_law":
-                            path_parts = metadata.split(os.sep)
-                            if len(path_parts) > 0:
-                                metadata_dict["court"] = path_parts[0]
-                    
-                    db_collection.add(
-                        documents=[chunk],
-                        metadatas=[metadata_dict],
-                        ids=[f"{file.filename}-{i}"]
-                    )
+                try:
+                    with profiling.span("ingest"):
+                        report = await run_in_threadpool(pipeline.run, extract_pdf_pages(temp_path))
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
 
                 print(f"Successfully processed PDF: {file.filename}")
-                return {"message": f"Successfully processed {file.filename}"}
+                return {
+                    "message": f"Successfully processed {file.filename}",
+                    "summary": report["summary"],
+                    "pipeline": report
+                }
 
             except Exception as e:
                 print(f"Error processing PDF {file.filename}: {str(e)}")
@@ -189,103 +471,106 @@ async def upload_document(file: UploadFile = File(...), collection: str = Form(.
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/query")
-async def query_documents(request: QueryRequest):
-    try:
-        # Get the appropriate collection
-        collection = get_collection(request.collection)
+async def retrieve_matches(request: QueryRequest) -> List[dict]:
+    """Run a /query-style retrieval and return the full match dicts"""
+    # Print debug info
+    print(f"Querying collection: {request.collection}")
+    print(f"Query text: {request.query}")
+    print(f"Requested results: {request.n_results}")
+    if request.where or request.where_document:
+        print(f"Filters: where={request.where} where_document={request.where_document}")
+
+    # The collection itself, or the shards the filter leaves to search
+    names = search_targets(request.collection, request.where)
+    
+    # If query is empty, return limited documents
+    if not request.query.strip():
+        print("Empty query, getting limited documents")
+        # Add a hard limit for empty queries to prevent timeouts
+        limit = min(request.n_results, MAX_N_RESULTS)
+        print(f"Using limit: {limit}")
         
-        # Print debug info
-        print(f"Querying collection: {request.collection}")
-        print(f"Query text: {request.query}")
-        print(f"Requested results: {request.n_results}")
+        # Only get the limited number of documents, matching the filters
+        results = browse_collections(names, limit, ["documents", "metadatas"], request.where, request.where_document)
+        print(f"Got {len(results['ids'])} documents")
         
-        # If query is empty, return limited documents
-        if not request.query.strip():
-            print("Empty query, getting limited documents")
-            # Add a hard limit for empty queries to prevent timeouts
-            limit = min(request.n_results, 50)  # Reduced to 50 for better performance
-            print(f"Using limit: {limit}")
-            
-            # Get all IDs first to know total count
-            all_ids = collection.get(include=[])["ids"]
-            total_count = len(all_ids)
-            print(f"Total documents in collection: {total_count}")
-            
-            # Only get the limited number of documents
-            limited_ids = all_ids[:limit] if all_ids else []
-            print(f"Getting {len(limited_ids)} documents")
-            
-            if limited_ids:
-                # Get only the limited documents with explicit include
-                results = collection.get(
-                    ids=limited_ids,
-                    include=["documents", "metadatas"]
-                )
-                
-                # Format results for empty query
-                matches = []
-                for i in range(len(results["ids"])):
-                    if i < limit:  # Extra safety check
-                        doc_text = results["documents"][i] if i < len(results["documents"]) else "No text available"
-                        doc_metadata = results["metadatas"][i] if i < len(results["metadatas"]) else {"source": "Unknown"}
-                        
-                        matches.append({
-                            "text": doc_text,
-                            "metadata": doc_metadata,
-                            "distance": 0
-                        })
-            else:
-                matches = []
-        else:
-            # Perform the query with a completely different approach
-            print("Performing semantic search with new approach")
-            limit = min(request.n_results, 50)  # Reduced to 50 for better performance
+        matches = []
+        # Format results for empty query
+        for i in range(len(results["ids"])):
+            doc_text = results["documents"][i] if i < len(results["documents"]) else "No text available"
+            doc_metadata = results["metadatas"][i] if i < len(results["metadatas"]) else {"source": "Unknown"}
             
-            # Connect directly to ChromaDB
-            import chromadb
-            client = chromadb.PersistentClient(path="../db")
-            chroma_collection = client.get_collection(name=request.collection)
-            
-            # Query with explicit includes
-            query_results = chroma_collection.query(
-                query_texts=[request.query],
-                n_results=limit,
-                include=["documents", "metadatas", "distances"]
-            )
-            
-            # Print debug info
-            print(f"ChromaDB query results keys: {query_results.keys()}")
-            print(f"Documents length: {len(query_results.get('documents', [[]]))} with first list length: {len(query_results.get('documents', [[]])[0]) if query_results.get('documents') and query_results.get('documents')[0] else 0}")
-            print(f"Metadatas length: {len(query_results.get('metadatas', [[]]))} with first list length: {len(query_results.get('metadatas', [[]])[0]) if query_results.get('metadatas') and query_results.get('metadatas')[0] else 0}")
-            
-            # Build matches manually
-            matches = []
-            if "documents" in query_results and len(query_results["documents"]) > 0:
-                documents = query_results["documents"][0]
-                metadatas = query_results["metadatas"][0] if "metadatas" in query_results and len(query_results["metadatas"]) > 0 else []
-                distances = query_results["distances"][0] if "distances" in query_results and len(query_results["distances"]) > 0 else []
-                
-                for i in range(len(documents)):
-                    if i < limit:  # Extra safety check
-                        doc_text = documents[i] if i < len(documents) else "No text available"
-                        doc_metadata = metadatas[i] if i < len(metadatas) else {"source": "Unknown"}
-                        doc_distance = distances[i] if i < len(distances) else 0
-                        
-                        # Debug output for each match
-                        print(f"Match {i} text type: {type(doc_text)}")
-                        print(f"Match {i} metadata type: {type(doc_metadata)}")
-                        print(f"Match {i} text (truncated): {doc_text[:50] if doc_text else 'None'}...")
-                        print(f"Match {i} metadata: {doc_metadata}")
-                        
-                        matches.append({
-                            "text": doc_text,
-                            "metadata": doc_metadata,
-                            "distance": doc_distance
-                        })
-        
+            matches.append({
+                "id": results["ids"][i],
+                "text": doc_text,
+                "metadata": doc_metadata,
+                "distance": 0
+            })
+        return matches
+
+    limit = min(request.n_results, MAX_N_RESULTS)
+
+    # When reranking, retrieve a wider candidate set and cut it down afterwards
+    n_candidates = limit
+    if request.rerank:
+        n_candidates = min(max(request.rerank_candidates or limit, limit), reranker.RERANK_MAX_CANDIDATES)
+
+    if request.mode == "hybrid":
+        print("Performing hybrid lexical + semantic search")
+        matches = []
+        for name in names:
+            matches += hybrid_search(get_collection(name), name, request.query, n_candidates,
+                                     request.where, request.where_document)
+        if len(names) > 1:
+            # Fused scores are rank-based, so per-shard rankings merge on score
+            matches = sorted(matches, key=lambda match: match["score"], reverse=True)
+            matches = unique_by_id(matches, lambda match: match["id"])[:n_candidates]
+        if request.rerank:
+            with profiling.span("rerank"):
+                # The cross-encoder is CPU-bound; keep it off the event loop so other requests are served meanwhile
+                matches = await run_in_threadpool(reranker.get_reranker().rerank, request.query, matches, limit)
+        return matches
+
+    # Perform the query with a completely different approach
+    print("Performing semantic search with new approach")
+    
+    # Only ask Chroma for what the caller wants back (reranking always needs the text)
+    include = ["distances"]
+    if wants(request, "text") or request.rerank:
+        include.append("documents")
+    if wants(request, "metadata"):
+        include.append("metadatas")
+    query_results = vector_query(names, request.query, n_candidates, include, request.where, request.where_document,
+                                 request.compact)
+    
+    # Build matches manually
+    matches = []
+    ids = query_results["ids"]
+    documents = query_results.get("documents") or []
+    metadatas = query_results.get("metadatas") or []
+    distances = query_results["distances"]
+    
+    for i in range(min(len(ids), n_candidates)):
+        match = {"id": ids[i], "distance": distances[i] if i < len(distances) else 0}
+        if "documents" in include:
+            match["text"] = documents[i] if i < len(documents) else "No text available"
+        if "metadatas" in include:
+            match["metadata"] = metadatas[i] if i < len(metadatas) else {"source": "Unknown"}
+        matches.append(match)
+
+    if request.rerank:
+        with profiling.span("rerank"):
+            matches = await run_in_threadpool(reranker.get_reranker().rerank, request.query, matches, limit)
+    return matches
+
+@app.post("/query")
+async def query_documents(request: QueryRequest):
+    try:
+        matches = await retrieve_matches(request)
         print(f"Returning {len(matches)} matches")
-        return {"matches": matches}
+        # Build the response ourselves so the fast encoder skips FastAPI's jsonable_encoder pass
+        with profiling.span("serialize"):
+            return FastJSONResponse({"matches": project_matches(matches, request.fields, request.preview_chars)})
     
     except Exception as e:
         print(f"Error in query_documents: {str(e)}")
@@ -293,70 +578,143 @@ async def query_documents(request: QueryRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def stream_matches(request: QueryRequest):
+    """Yield NDJSON match lines, materializing documents one page at a time"""
+    collection = get_collection(request.collection)
+    limit = min(request.n_results, MAX_N_RESULTS)
+    include = [key for field, key in (("text", "documents"), ("metadata", "metadatas")) if wants(request, field)]
+
+    filters = {"where": request.where or None, "where_document": request.where_document or None}
+
+    if not request.query.strip():
+        # Browse: page through the collection instead of listing every id up front
+        offset = 0
+        while offset < limit:
+            page = collection.get(include=include, limit=min(STREAM_PAGE_SIZE, limit - offset), offset=offset, **filters)
+            if not page["ids"]:
+                return
+            for i, doc_id in enumerate(page["ids"]):
+                match = {"id": doc_id, "distance": 0}
+                if "documents" in include:
+                    match["text"] = page["documents"][i]
+                if "metadatas" in include:
+                    match["metadata"] = page["metadatas"][i]
+                yield ndjson_line(project_matches([match], request.fields, request.preview_chars)[0])
+            offset += len(page["ids"])
+        return
+
+    # Ids and distances are cheap to get for the whole ranking; documents are fetched per page
+    results = collection.query(query_embeddings=[embed_query(request.query)], n_results=limit, include=["distances"], **filters)
+    ids = results["ids"][0] if results.get("ids") else []
+    distances = results["distances"][0] if results.get("distances") else []
+    for start in range(0, len(ids), STREAM_PAGE_SIZE):
+        page_ids = ids[start:start + STREAM_PAGE_SIZE]
+        records = {}
+        if include:
+            page = collection.get(ids=page_ids, include=include)
+            for i, doc_id in enumerate(page["ids"]):
+                records[doc_id] = (
+                    page["documents"][i] if "documents" in include else None,
+                    page["metadatas"][i] if "metadatas" in include else None
+                )
+        for offset, doc_id in enumerate(page_ids):
+            match = {"id": doc_id, "distance": distances[start + offset] if start + offset < len(distances) else 0}
+            if include:
+                if doc_id not in records:
+                    continue  # Deleted between the query and the page fetch
+                doc_text, doc_metadata = records[doc_id]
+                if "documents" in include:
+                    match["text"] = doc_text
+                if "metadatas" in include:
+                    match["metadata"] = doc_metadata
+            yield ndjson_line(project_matches([match], request.fields, request.preview_chars)[0])
+
+@app.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    print(f"Streaming query for collection: {request.collection} ({request.n_results} results requested)")
+    if request.mode == "hybrid" or request.rerank or request.compact or sharding.is_sharded(request.collection):
+        # Fused, reranked, compact-tier and cross-shard rankings are built in one piece (and bounded by their limits)
+        try:
+            matches = await retrieve_matches(request)
+        except Exception as e:
+            print(f"Error in query_documents_stream: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+        lines = (ndjson_line(match) for match in project_matches(matches, request.fields, request.preview_chars))
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    # A sync generator, so Starlette runs the Chroma calls in its threadpool between lines
+    return StreamingResponse(stream_matches(request), media_type="application/x-ndjson")
+
 @app.post("/query_direct")
 async def query_documents_direct(request: QueryRequest):
+    if request.format != "json":
+        try:
+            columnar_export.check_format(request.format)
+        except columnar_export.ExportFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        # Get the appropriate collection
-        collection = get_collection(request.collection)
+        # The collection itself, or the shards the filter leaves to search
+        names = search_targets(request.collection, request.where)
         
         # Print debug info
         print(f"Direct query for collection: {request.collection}")
         print(f"Query text: {request.query}")
         print(f"Requested results: {request.n_results}")
         
+        # Raw result keys to return; ids always come back from Chroma
+        wanted = [RAW_RESULT_FIELDS[field] for field in (request.fields or RAW_RESULT_FIELDS) if field in RAW_RESULT_FIELDS]
+        
         # If query is empty, return limited documents
         if not request.query.strip():
             print("Empty query, getting limited documents")
             # Add a hard limit for empty queries to prevent timeouts
-            limit = min(request.n_results, 50)  # Reduced to 50 for better performance
-            
-            # Get all IDs first to know total count
-            all_ids = collection.get(include=[])["ids"]
-            total_count = len(all_ids)
-            print(f"Total documents in collection: {total_count}")
+            limit = min(request.n_results, MAX_N_RESULTS)
             
-            # Only get the limited number of documents
-            limited_ids = all_ids[:limit] if all_ids else []
-            print(f"Getting {len(limited_ids)} documents")
-            
-            if limited_ids:
-                # Get only the limited documents
-                results = collection.get(ids=limited_ids, include=["documents", "metadatas"])
-                
-                # Return the raw results
-                return {
-                    "raw_results": {
-                        "ids": results.get("ids", []),
-                        "documents": results.get("documents", []),
-                        "metadatas": results.get("metadatas", [])
-                    }
-                }
-            else:
-                return {"raw_results": {"ids": [], "documents": [], "metadatas": []}}
+            # Only get the limited number of documents, matching the filters
+            include = [key for key in ("documents", "metadatas") if key in wanted]
+            results = browse_collections(names, limit, include, request.where, request.where_document)
+            print(f"Got {len(results['ids'])} documents")
+            raw_results = {key: results.get(key) or [] for key in ("ids", "documents", "metadatas") if key in wanted}
+            if request.preview_chars is not None and raw_results.get("documents"):
+                raw_results["documents"] = [doc[:request.preview_chars] if doc else doc for doc in raw_results["documents"]]
         else:
             # Perform the query with a direct approach
             print("Performing direct semantic search")
-            limit = min(request.n_results, 50)  # Reduced to 50 for better performance
+            limit = min(request.n_results, MAX_N_RESULTS)
             
-            # Direct query with all includes
-            results = collection.query(
-                query_texts=[request.query],
-                n_results=limit,
-                include=["documents", "metadatas", "distances"]
+            # Direct query with only the requested includes
+            results = vector_query(
+                names,
+                request.query,
+                limit,
+                [key for key in ("documents", "metadatas", "distances") if key in wanted],
+                request.where,
+                request.where_document,
+                request.compact
             )
             
-            # Print debug info
-            print(f"ChromaDB query results keys: {results.keys()}")
-            
-            # Return the raw results
-            return {
-                "raw_results": {
-                    "ids": results.get("ids", []),
-                    "documents": results.get("documents", []),
-                    "metadatas": results.get("metadatas", []),
-                    "distances": results.get("distances", [])
-                }
-            }
+            # Nested per query text, as Chroma returns them
+            raw_results = {key: [results[key]] for key in ("ids", "documents", "metadatas", "distances") if key in wanted}
+            if request.preview_chars is not None and raw_results.get("documents"):
+                raw_results["documents"] = [
+                    [doc[:request.preview_chars] if doc else doc for doc in docs] for docs in raw_results["documents"]
+                ]
+        
+        if request.format != "json":
+            # Binary columns for offline tooling; query results are nested per query text, take the only one
+            batch = raw_results
+            if request.query.strip():
+                batch = {key: value[0] if value else [] for key, value in raw_results.items()}
+            # Columns line up by row, so ids always go out even when fields leaves them out
+            batch = dict(batch, ids=results["ids"])
+            with profiling.span("serialize"):
+                return Response(
+                    content=columnar_export.encode_results(batch, request.format),
+                    media_type=columnar_export.MEDIA_TYPES[request.format]
+                )
+
+        # Return the raw results
+        with profiling.span("serialize"):
+            return FastJSONResponse({"raw_results": raw_results})
     
     except Exception as e:
         print(f"Error in query_documents_direct: {str(e)}")
@@ -364,6 +722,90 @@ async def query_documents_direct(request: QueryRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/context")
+async def build_query_context(request: ContextRequest):
+    # Retrieve as /query does, then merge adjacent chunks, strip overlap and pack into the token budget
+    # The context builder needs full text and metadata whatever projection was asked for
+    request.fields = None
+    try:
+        matches = await retrieve_matches(request)
+    except Exception as e:
+        print(f"Error in build_query_context: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    with profiling.span("build_context"):
+        context = context_builder.build_context(matches, request.token_budget)
+    print(f"Built context: {context['tokens_used']} tokens used, {context['tokens_saved']} saved "
+          f"({len(matches)} matches -> {len(context['passages'])} passages)")
+    return context
+
+@app.get("/download/{filename:path}")
+async def download_document(filename: str, request: Request):
+    original = get_originals_store().lookup(filename)
+    if original is None:
+        raise HTTPException(status_code=404, detail=f"No stored original for {filename}")
+
+    size = original["size"]
+    # Blobs are content-addressed, so the hash is a strong ETag
+    etag = f'"{original["sha256"]}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    byte_range = None
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            # Multi-range, malformed and non-byte ranges are ignored and get the whole file
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is not None:
+        start, end = byte_range
+        headers.update({
+            "Content-Range": f"bytes {start}-{end}/{size}",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": f"attachment; filename*=utf-8''{quote(original['filename'])}"
+        })
+        return StreamingResponse(
+            iter_file_range(original["path"], start, end),
+            status_code=206,
+            media_type=original["content_type"],
+            headers=headers
+        )
+
+    # Whole file: let FileResponse stream it straight from disk
+    return FileResponse(
+        original["path"],
+        media_type=original["content_type"],
+        filename=original["filename"],
+        headers=headers
+    )
+
+@app.get("/export/{collection_name}")
+def export_collection(collection_name: str, format: str = "arrow", include_embeddings: bool = False,
+                      page_size: int = columnar_export.EXPORT_PAGE_SIZE):
+    # Sync endpoint: Chroma paging runs in the threadpool, and the response streams one page at a time
+    try:
+        columnar_export.check_format(format)
+    except columnar_export.ExportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    client = residency.get_client(DB_PATH)
+    try:
+        collection = client.get_collection(
+            name=collection_name,
+            embedding_function=embedding_cache.get_embedding_function(DB_PATH)
+        )
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Collection {collection_name} does not exist")
+
+    print(f"Exporting {collection_name} as {format} (embeddings: {include_embeddings}, page size: {page_size})")
+    extension = "arrow" if format == "arrow" else "npzf"
+    return StreamingResponse(
+        columnar_export.export_collection(collection, format, include_embeddings, max(page_size, 1)),
+        media_type=columnar_export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename={quote(collection_name)}.{extension}"}
+    )
+
 @app.options("/delete")
 async def delete_options():
     return {"message": "OK"}
@@ -371,34 +813,97 @@ async def delete_options():
 @app.post("/delete")
 async def delete_documents(request: DeleteRequest):
     try:
-        # Get the appropriate collection
-        collection = get_collection(request.collection)
-        
-        # Get all documents
-        results = collection.get()
-        
-        # Find documents with matching source
-        ids_to_delete = []
-        for i, metadata in enumerate(results['metadatas']):
-            if metadata.get('source') == request.source:
-                ids_to_delete.append(results['ids'][i])
+        deleted = 0
+        # A sharded collection's chunks may sit in any shard
+        for name in search_targets(request.collection):
+            collection = get_collection(name)
+            
+            # Find documents with matching source, letting Chroma filter on metadata
+            ids_to_delete = collection.get(where={"source": request.source}, include=[])["ids"]
+            if not ids_to_delete:
+                continue
+            
+            # Delete the documents
+            collection.delete(ids=ids_to_delete)
+            get_lexical_index(name).remove(ids_to_delete)
+            deleted += len(ids_to_delete)
         
-        if not ids_to_delete:
+        if not deleted:
             raise HTTPException(status_code=404, detail=f"No documents found with source: {request.source}")
         
-        # Delete the documents
-        collection.delete(ids=ids_to_delete)
-        
-        return {"message": f"Successfully deleted {len(ids_to_delete)} documents from {request.source}"}
+        return {"message": f"Successfully deleted {deleted} documents from {request.source}"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/health")
 async def health_check():
+    # Liveness only; use /ready to know whether the server is warm
     return {"status": "healthy"}
 
+# Startup warm-up: load the embedding model and each collection's HNSW index in the
+# background so the first real query doesn't pay for it. /ready reports 503 until done.
+WARMUP_ENABLED = os.environ.get("RAG_WARMUP", "1") == "1"
+WARMUP_RERANKER = os.environ.get("RAG_WARMUP_RERANKER", "0") == "1"
+READINESS = {"ready": False, "seconds": None, "collections": [], "errors": []}
+
+def warm_up():
+    started = time.perf_counter()
+    try:
+        embed_fn = embedding_cache.get_embedding_function(DB_PATH)
+        # Call the model directly: a cache hit would return without loading it
+        probe = [float(x) for x in embed_fn.inner(["warm-up"])[0]]
+        client = residency.get_client(DB_PATH)
+        # Under a memory budget indexes load on first use; preloading them all would only churn the LRU
+        listed_collections = [] if residency.MEMORY_BUDGET_MB else client.list_collections()
+        for listed in listed_collections:
+            try:
+                if get_compact_index(listed.name) is not None:
+                    # Loading the compact tier is its warm-up; the HNSW index stays on disk
+                    READINESS["collections"].append(listed.name)
+                    continue
+                collection = client.get_collection(name=listed.name, embedding_function=embed_fn)
+                if collection.count() > 0:
+                    # Any query loads the collection's vector index into memory
+                    collection.query(query_embeddings=[probe], n_results=1, include=["distances"])
+                READINESS["collections"].append(listed.name)
+            except Exception as e:
+                print(f"Warm-up of collection {listed.name} failed: {str(e)}")
+                READINESS["errors"].append(f"{listed.name}: {str(e)}")
+        if WARMUP_RERANKER:
+            reranker.get_reranker().load()
+    except Exception as e:
+        # Without the embedding model no query can succeed, so stay unready
+        print(f"Warm-up failed: {str(e)}")
+        READINESS["errors"].append(str(e))
+        return
+    READINESS["seconds"] = round(time.perf_counter() - started, 2)
+    READINESS["ready"] = True
+    print(f"Warm-up done in {READINESS['seconds']}s ({len(READINESS['collections'])} collections)")
+
+@app.on_event("startup")
+async def start_warm_up():
+    if not WARMUP_ENABLED:
+        READINESS["ready"] = True
+        return
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+@app.get("/residency")
+async def residency_report():
+    # Which collections are hot, what each holds in memory, and the budget they share
+    return residency.manager.snapshot()
+
+@app.get("/ready")
+async def readiness_check():
+    if not READINESS["ready"]:
+        return JSONResponse(status_code=503, content=dict(READINESS, status="warming"))
+    return dict(READINESS, status="ready")
+
 if __name__ == "__main__":
+    import uvicorn
+
     # Ensure the db directory exists
     os.makedirs("db", exist_ok=True)
     
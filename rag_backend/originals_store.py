@@ -0,0 +1,114 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+class OriginalsStore:
+    """Content-addressed store for uploaded original files.
+
+    Blobs live at <root>/<sha[:2]>/<sha>, so identical uploads are stored once;
+    a small SQLite index maps download names (filename and source path) to blobs.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS originals (
+                name TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                content_type TEXT,
+                filename TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def put(self, content: bytes, filename: str, content_type: Optional[str] = None, source_path: Optional[str] = None) -> str:
+        """Store a file's bytes and register it under its filename (and source path)"""
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+
+        names = {filename, source_path or filename}
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO originals (name, sha256, size, content_type, filename, stored_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(name, sha256, len(content), content_type, filename, now) for name in names]
+            )
+        return sha256
+
+    def lookup(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, size, content_type, filename FROM originals WHERE name = ?", (name,)
+            ).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row[0])):
+            return None
+        sha256, size, content_type, filename = row
+        return {
+            "sha256": sha256,
+            "size": size,
+            "content_type": content_type or "application/octet-stream",
+            "filename": filename,
+            "path": self.blob_path(sha256)
+        }
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+def parse_range(header: str, size: int):
+    """Parse a single "bytes=start-end" range into (start, end) inclusive.
+
+    Returns None for headers that are to be ignored (serving the whole file):
+    other units, multiple ranges and malformed ones. Raises RangeNotSatisfiable
+    for a well-formed range that lies outside the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, dash, end_text = spec.strip().partition("-")
+    start_text, end_text = start_text.strip(), end_text.strip()
+    if not dash or not (start_text or end_text):
+        return None
+    if (start_text and not start_text.isdigit()) or (end_text and not end_text.isdigit()):
+        return None
+    if start_text == "":
+        # Suffix range: the last N bytes
+        length = int(end_text)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if end_text and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+def iter_file_range(path: str, start: int, end: int, chunk_size: int = 256 * 1024):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
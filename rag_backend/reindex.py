@@ -0,0 +1,98 @@
+import argparse
+import time
+from typing import Dict
+
+import chromadb
+
+import index_config
+from embedding_cache import get_embedding_function
+
+# Offline rebuild of a collection's HNSW index with new settings. Stored embeddings
+# are copied as they are, so nothing is re-embedded; ids and documents don't change,
+# so the BM25 index and stored originals stay valid. Stop the RAG backend first:
+# it creates missing collections on demand, which would race the name swap.
+
+def reindex_collection(db_path: str, name: str, overrides: Dict, page_size: int = 1000, keep_old: bool = False) -> Dict:
+    client = chromadb.PersistentClient(path=db_path)
+    embed_fn = get_embedding_function(db_path)
+    source = client.get_collection(name=name, embedding_function=embed_fn)
+    old_config = index_config.current_config(source)
+    new_config = index_config.validate(dict(index_config.config_for(name), **overrides))
+
+    stamp = time.strftime("%Y%m%d%H%M%S")
+    # Chroma collection names are limited to 63 characters
+    staging_name = f"{name[:40]}-reindex-{stamp}"
+    retired_name = f"{name[:40]}-old-{stamp}"
+    # Keep the collection's own metadata, replacing only the index settings
+    metadata = {key: value for key, value in (source.metadata or {}).items() if not key.startswith("hnsw:")}
+    metadata.update(index_config.hnsw_metadata(new_config))
+    target = client.create_collection(name=staging_name, metadata=metadata, embedding_function=embed_fn)
+    print(f"Rebuilding {name}: {old_config} -> {new_config}")
+
+    started = time.perf_counter()
+    try:
+        offset = 0
+        while True:
+            page = source.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            target.add(
+                ids=page["ids"],
+                documents=page["documents"],
+                metadatas=page["metadatas"],
+                embeddings=page["embeddings"]
+            )
+            offset += len(page["ids"])
+            print(f"Copied {offset} chunks")
+        if target.count() != source.count():
+            raise RuntimeError(f"Copied {target.count()} chunks but {name} has {source.count()}")
+    except Exception:
+        client.delete_collection(staging_name)
+        raise
+
+    # Chroma has no multi-collection transaction: retire the old name, then take it over,
+    # putting the old collection back if the second rename fails
+    source.modify(name=retired_name)
+    try:
+        target.modify(name=name)
+    except Exception:
+        source.modify(name=name)
+        client.delete_collection(staging_name)
+        raise
+    if keep_old:
+        print(f"Previous index kept as {retired_name}")
+    else:
+        client.delete_collection(retired_name)
+
+    return {
+        "collection": name,
+        "chunks": offset,
+        "old_config": old_config,
+        "new_config": new_config,
+        "seconds": round(time.perf_counter() - started, 2),
+        "previous": retired_name if keep_old else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild a collection's HNSW index with new settings, without re-embedding")
+    parser.add_argument("collection", help="Collection to rebuild")
+    parser.add_argument("--db", default="./db", help="ChromaDB directory (default: ./db)")
+    parser.add_argument("--space", choices=index_config.SPACES, help="Distance function")
+    parser.add_argument("--M", type=int, dest="M", help="Graph links per node")
+    parser.add_argument("--construction-ef", type=int, help="Candidate list size while building")
+    parser.add_argument("--search-ef", type=int, help="Candidate list size while querying")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--keep-old", action="store_true", help="Keep the previous collection under a -old-<timestamp> name")
+    args = parser.parse_args()
+
+    # Unset flags fall back to the configured settings for the collection (index_config.py)
+    overrides = {
+        param: getattr(args, param)
+        for param in index_config.INDEX_PARAMS
+        if getattr(args, param) is not None
+    }
+    report = reindex_collection(args.db, args.collection, overrides, args.page_size, args.keep_old)
+    print(f"Rebuilt {report['collection']} ({report['chunks']} chunks) in {report['seconds']}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+RERANK_MODEL = os.environ.get("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BATCH_SIZE = int(os.environ.get("RAG_RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.environ.get("RAG_RERANK_CACHE_SIZE", "100000"))
+# Upper bound on how many candidates a single request may ask us to rescore
+RERANK_MAX_CANDIDATES = int(os.environ.get("RAG_RERANK_MAX_CANDIDATES", "200"))
+
+class Reranker:
+    """CPU cross-encoder reranker with an LRU cache of (query, chunk id) scores"""
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE, cache_size: int = RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                print(f"Loading cross-encoder {self.model_name}")
+                self._model = CrossEncoder(self.model_name, device="cpu")
+            return self._model
+
+    def load(self):
+        """Load the model now rather than on the first rerank"""
+        self._get_model()
+
+    def score(self, query: str, candidates: List[Dict]) -> List[float]:
+        """Score candidates (dicts with "id" and "text") against the query"""
+        query_key = " ".join(query.split())
+        scores: List[float] = [0.0] * len(candidates)
+        missing = []
+
+        with self._cache_lock:
+            for i, candidate in enumerate(candidates):
+                key = (query_key, candidate["id"])
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+                else:
+                    missing.append(i)
+
+        print(f"Reranking {len(candidates)} candidates ({len(candidates) - len(missing)} cached)")
+        if missing:
+            pairs = [(query, candidates[i]["text"] or "") for i in missing]
+            predicted = self._get_model().predict(pairs, batch_size=self.batch_size)
+            with self._cache_lock:
+                for i, value in zip(missing, predicted):
+                    scores[i] = float(value)
+                    self._cache[(query_key, candidates[i]["id"])] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return scores
+
+    def rerank(self, query: str, candidates: List[Dict], top_n: int) -> List[Dict]:
+        """Return the top_n candidates by cross-encoder score, with "rerank_score" set"""
+        if not candidates:
+            return []
+        scores = self.score(query, candidates)
+        for candidate, value in zip(candidates, scores):
+            candidate["rerank_score"] = value
+        ranked = sorted(candidates, key=lambda candidate: candidate["rerank_score"], reverse=True)
+        return ranked[:top_n]
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+def get_reranker() -> Reranker:
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+        return _reranker
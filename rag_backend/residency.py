@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Per-collection resources are loaded on first use and, under a memory budget, the
+# least recently used ones are unloaded again. With RAG_MEMORY_BUDGET_MB unset (0)
+# nothing is ever unloaded, as before.
+#   HNSW vector indexes  Chroma's own LRU segment cache (chromadb >= 0.4.23), given
+#                        RAG_CHROMA_BUDGET_SHARE of the budget
+#   compact tiers, BM25  tracked here and kept within the rest
+MEMORY_BUDGET_MB = int(os.environ.get("RAG_MEMORY_BUDGET_MB", "0"))
+CHROMA_BUDGET_SHARE = float(os.environ.get("RAG_CHROMA_BUDGET_SHARE", "0.7"))
+# A BM25 handle is a SQLite connection; its page cache defaults to about 2MB
+BM25_HANDLE_BYTES = 2 * 1024 * 1024
+
+def chroma_budget_bytes() -> int:
+    return int(MEMORY_BUDGET_MB * 1024 * 1024 * CHROMA_BUDGET_SHARE)
+
+def managed_budget_bytes() -> int:
+    return MEMORY_BUDGET_MB * 1024 * 1024 - chroma_budget_bytes()
+
+def chroma_lru_supported() -> bool:
+    from chromadb.config import Settings
+    fields = getattr(Settings, "model_fields", None) or getattr(Settings, "__fields__", {})
+    return "chroma_segment_cache_policy" in fields
+
+_clients: Dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+def get_client(db_path: str):
+    """The process-wide Chroma client for db_path.
+
+    Chroma refuses a second client for the same path with different settings,
+    so everything in the server that opens the store has to come through here.
+    """
+    import chromadb
+    from chromadb.config import Settings
+
+    path = os.path.abspath(db_path)
+    with _clients_lock:
+        if path not in _clients:
+            if MEMORY_BUDGET_MB and chroma_lru_supported():
+                settings = Settings(chroma_segment_cache_policy="LRU", chroma_memory_limit_bytes=chroma_budget_bytes())
+                _clients[path] = chromadb.PersistentClient(path=db_path, settings=settings)
+                print(f"Chroma vector segments limited to {chroma_budget_bytes() // (1024 * 1024)}MB (LRU)")
+            else:
+                if MEMORY_BUDGET_MB:
+                    print("This chromadb has no segment cache policy (needs >= 0.4.23); vector indexes stay resident")
+                _clients[path] = chromadb.PersistentClient(path=db_path)
+        return _clients[path]
+
+class ResidencyManager:
+    """LRU bookkeeping of per-collection resources, unloading the coldest over budget.
+
+    Each (collection, kind) entry records its size and how to unload it.
+    Entries without an unload callback (Chroma's vector segments, which Chroma
+    evicts itself) are tracked for reporting only.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, collection: str, kind: str, size_bytes: Optional[int] = None, unload: Optional[Callable[[], None]] = None):
+        """Record a use, loading nothing itself; call after getting the resource"""
+        key = (collection, kind)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {"bytes": size_bytes, "unload": unload, "loaded_at": now, "hits": 0}
+                self._entries[key] = entry
+            else:
+                self._entries.move_to_end(key)
+                if size_bytes is not None:
+                    entry["bytes"] = size_bytes
+            entry["hits"] += 1
+            entry["last_used"] = now
+            evicted = self._over_budget(key)
+        # Unload outside the lock; requests already holding the resource finish with it
+        for (name, evicted_kind), entry in evicted:
+            entry["unload"]()
+            print(f"Unloaded {evicted_kind} of {name} ({(entry['bytes'] or 0) / (1024 * 1024):.1f}MB, "
+                  f"idle {now - entry['last_used']:.0f}s)")
+
+    def managed_bytes(self) -> int:
+        return sum(entry["bytes"] or 0 for entry in self._entries.values() if entry["unload"] is not None)
+
+    def _over_budget(self, keep: Tuple[str, str]) -> List:
+        if not self.budget_bytes:
+            return []
+        evicted = []
+        total = self.managed_bytes()
+        # Oldest first; the entry just used stays even if it alone exceeds the budget
+        for key in list(self._entries):
+            if total <= self.budget_bytes:
+                break
+            entry = self._entries[key]
+            if key == keep or entry["unload"] is None:
+                continue
+            del self._entries[key]
+            total -= entry["bytes"] or 0
+            evicted.append((key, entry))
+        self.evictions += len(evicted)
+        return evicted
+
+    def snapshot(self) -> Dict:
+        """Collections by recency of use (hottest first) with what they hold"""
+        now = time.time()
+        collections: "OrderedDict[str, Dict]" = OrderedDict()
+        with self._lock:
+            for (name, kind), entry in reversed(self._entries.items()):
+                item = collections.setdefault(name, {"collection": name, "idle_seconds": round(now - entry["last_used"], 1), "resources": {}})
+                item["resources"][kind] = {
+                    "mb": round(entry["bytes"] / (1024 * 1024), 2) if entry["bytes"] is not None else None,
+                    "hits": entry["hits"],
+                    "idle_seconds": round(now - entry["last_used"], 1),
+                    "managed_by": "residency" if entry["unload"] is not None else "chroma"
+                }
+            managed = self.managed_bytes()
+        return {
+            "budget_mb": MEMORY_BUDGET_MB or None,
+            "managed_budget_mb": round(self.budget_bytes / (1024 * 1024), 1) if self.budget_bytes else None,
+            "managed_mb": round(managed / (1024 * 1024), 2),
+            "chroma_budget_mb": round(chroma_budget_bytes() / (1024 * 1024), 1) if MEMORY_BUDGET_MB else None,
+            "chroma_lru": bool(MEMORY_BUDGET_MB) and chroma_lru_supported(),
+            "evictions": self.evictions,
+            "collections": list(collections.values())
+        }
+
+manager = ResidencyManager(managed_budget_bytes())
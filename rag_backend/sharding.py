@@ -0,0 +1,144 @@
+import argparse
+import os
+import re
+from typing import Dict, List, Optional
+
+import bm25_index
+import index_config
+from embedding_cache import get_embedding_function
+
+# Collections split into one sub-collection per value of a metadata field, e.g.
+# case_law -> case_law__supreme_court, case_law__court_of_appeal, ...
+# Opt-in per collection: RAG_SHARDED_COLLECTIONS=case_law
+SHARD_KEYS = {"case_law": "court"}
+SHARDED_COLLECTIONS = {
+    name.strip() for name in os.environ.get("RAG_SHARDED_COLLECTIONS", "").split(",") if name.strip()
+}
+SHARD_SEPARATOR = "__"
+UNKNOWN_SHARD = "unknown"
+# Chroma collection names are limited to 63 characters
+MAX_COLLECTION_NAME = 63
+
+def is_sharded(collection: str) -> bool:
+    return collection in SHARDED_COLLECTIONS and collection in SHARD_KEYS
+
+def shard_key(collection: str) -> str:
+    return SHARD_KEYS[collection]
+
+def shard_name(collection: str, value: Optional[str]) -> str:
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", str(value or "")).strip("_-").lower() or UNKNOWN_SHARD
+    return f"{collection}{SHARD_SEPARATOR}{slug}"[:MAX_COLLECTION_NAME].rstrip("_-")
+
+def shard_for_metadata(collection: str, metadata: Dict) -> str:
+    return shard_name(collection, metadata.get(shard_key(collection)))
+
+def write_target(collection: str, metadata: Dict) -> str:
+    """Collection a chunk is written to: its shard when the collection is sharded, else the collection"""
+    if not is_sharded(collection):
+        return collection
+    return shard_for_metadata(collection, metadata)
+
+def list_shards(client, collection: str) -> List[str]:
+    prefix = collection + SHARD_SEPARATOR
+    return sorted(c.name for c in client.list_collections() if c.name.startswith(prefix))
+
+def base_has_data(client, collection: str) -> bool:
+    """Whether the unsharded collection still holds chunks (written before sharding, not yet split off)"""
+    if collection not in {c.name for c in client.list_collections()}:
+        return False
+    return client.get_collection(name=collection, embedding_function=None).count() > 0
+
+def _pinned_values(where: Optional[Dict], field: str) -> Optional[List[str]]:
+    """Shard key values a where filter restricts results to, or None if it doesn't pin them"""
+    if not where:
+        return None
+    if field in where:
+        condition = where[field]
+        if not isinstance(condition, dict):
+            return [condition]
+        if "$eq" in condition:
+            return [condition["$eq"]]
+        if "$in" in condition:
+            return list(condition["$in"])
+        return None
+    if "$and" in where:
+        for clause in where["$and"]:
+            values = _pinned_values(clause, field)
+            if values is not None:
+                return values
+    return None
+
+def target_shards(client, collection: str, where: Optional[Dict]) -> List[str]:
+    """Collections a query must touch: the pinned shards when the filter names the shard key, else all.
+
+    The base collection is searched too while it still holds chunks, so data
+    written before sharding was turned on stays visible (and deletable) until
+    split_collection has copied it and the base collection is dropped.
+    """
+    base = [collection] if base_has_data(client, collection) else []
+    existing = list_shards(client, collection)
+    if not existing:
+        # Sharding is on but nothing has been split or routed yet: the data is still in the base collection
+        print(f"{collection} is sharded but has no shards yet; searching {collection} itself "
+              f"(run python sharding.py {collection} to split it)")
+        return [collection]
+    if base:
+        print(f"{collection} still holds unsplit chunks; searching it next to its shards "
+              f"(run python sharding.py {collection}, then drop {collection})")
+    values = _pinned_values(where, shard_key(collection))
+    if values is None:
+        return base + existing
+    wanted = {shard_name(collection, value) for value in values}
+    return base + [name for name in existing if name in wanted]
+
+def split_collection(db_path: str, collection_name: str, page_size: int = 1000) -> Dict[str, int]:
+    """Copy an unsharded collection into per-shard sub-collections, reusing stored embeddings.
+
+    The source collection is left in place; delete it once the shards are verified.
+    Until then queries search it next to the shards and drop the duplicate ids.
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=db_path)
+    embed_fn = get_embedding_function(db_path)
+    source = client.get_collection(name=collection_name, embedding_function=embed_fn)
+    shards: Dict[str, object] = {}
+    counts: Dict[str, int] = {}
+
+    offset = 0
+    while True:
+        page = source.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        grouped: Dict[str, Dict[str, list]] = {}
+        for i, doc_id in enumerate(page["ids"]):
+            name = shard_for_metadata(collection_name, page["metadatas"][i] or {})
+            group = grouped.setdefault(name, {"ids": [], "documents": [], "metadatas": [], "embeddings": []})
+            group["ids"].append(doc_id)
+            group["documents"].append(page["documents"][i])
+            group["metadatas"].append(page["metadatas"][i])
+            group["embeddings"].append(page["embeddings"][i])
+        for name, group in grouped.items():
+            if name not in shards:
+                shards[name] = index_config.open_collection(client, name, embed_fn)
+            shards[name].upsert(**group)
+            bm25_index.get_index(db_path, name).add(group["ids"], group["documents"])
+            counts[name] = counts.get(name, 0) + len(group["ids"])
+        offset += len(page["ids"])
+        print(f"Copied {offset} chunks into {len(shards)} shards")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Split a collection into per-shard sub-collections (e.g. case_law by court)")
+    parser.add_argument("collection", choices=sorted(SHARD_KEYS), help="Collection to split")
+    parser.add_argument("--db", default="./db", help="ChromaDB directory (default: ./db)")
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    counts = split_collection(args.db, args.collection, args.page_size)
+    for name, count in sorted(counts.items()):
+        print(f"{name}: {count} chunks")
+    print(f"Set RAG_SHARDED_COLLECTIONS={args.collection} on the RAG backend to route uploads and queries to the shards")
+
+if __name__ == "__main__":
+    main()
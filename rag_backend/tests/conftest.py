@@ -0,0 +1,37 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+# The backend is a flat directory of modules run from rag_backend/, not a package;
+# the repo root holds the common/ package it shares with the gateway
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(BACKEND_DIR))
+sys.path.insert(0, BACKEND_DIR)
+
+class FakeEmbedding:
+    """Deterministic 8-dim embedding so tests don't need the sentence-transformer model"""
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            vectors.append([b / 255.0 + 0.01 for b in digest[:8]])
+        return vectors
+
+    def embed_query(self, text):
+        return self([text])[0]
+
+@pytest.fixture
+def rag_app(monkeypatch, tmp_path):
+    """The RAG backend app on an empty store under tmp_path, with the fake embedding"""
+    pytest.importorskip("chromadb")
+    from fastapi.testclient import TestClient
+    import embedding_cache
+    import main
+
+    monkeypatch.setattr(main, "DB_PATH", str(tmp_path / "db"))
+    monkeypatch.setattr(main, "_originals_store", None)
+    monkeypatch.setattr(embedding_cache, "get_embedding_function", lambda db_path: FakeEmbedding())
+    return TestClient(main.app), main
@@ -0,0 +1,22 @@
+from bm25_index import BM25Index
+
+class StoredCollection:
+    """The slice of Collection.get that BM25Index.sync pages through"""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def get(self, ids=None, include=None, limit=None, offset=0):
+        chosen = ids if ids is not None else list(self.documents)[offset:offset + limit]
+        return {"ids": chosen, "documents": [self.documents[doc_id] for doc_id in chosen]}
+
+def test_sync_catches_up_with_writes_made_around_the_index(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25" / "qa.sqlite3"))
+    index.add(["a", "gone"], ["flood damage is covered", "removed elsewhere"])
+    collection = StoredCollection({"a": "flood damage is covered", "b": "storm damage needs a claim form"})
+
+    index.sync(collection)
+
+    assert index.count() == 2
+    assert [doc_id for doc_id, _ in index.search("storm claim", 5)] == ["b"]
+    assert index.search("removed", 5) == []
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from conftest import FakeEmbedding
+
+def test_bulk_ingest_of_an_uploaded_pdf_changes_nothing(rag_app, monkeypatch, tmp_path):
+    pytest.importorskip("pdfplumber")
+    pytest.importorskip("langchain")
+    import bulk_ingest
+    import ingestion
+    from bench_ingest import write_synthetic_pdf
+
+    client, main = rag_app
+    monkeypatch.setattr(bulk_ingest, "get_embedding_function", lambda db_path: FakeEmbedding())
+    root = tmp_path / "docs"
+    os.makedirs(root)
+    pdf_path = str(root / "ruling.pdf")
+    write_synthetic_pdf(pdf_path, pages=6)
+
+    with open(pdf_path, "rb") as f:
+        response = client.post("/upload", files={"file": ("ruling.pdf", f, "application/pdf")},
+                               data={"collection": "legal_docs", "metadata": "ruling.pdf"})
+    assert response.status_code == 200
+    uploaded = response.json()["summary"]["chunks"]
+
+    summaries = []
+    apply_sync_plan = ingestion.apply_sync_plan
+
+    def recording_apply(collection, plan, *args, **kwargs):
+        summaries.append(plan.summary())
+        return apply_sync_plan(collection, plan, *args, **kwargs)
+
+    monkeypatch.setattr(ingestion, "apply_sync_plan", recording_apply)
+    stats = bulk_ingest.bulk_ingest(str(root), "legal_docs", db_path=main.DB_PATH, workers=1)
+
+    assert stats["ingested"] == 1 and stats["chunks_written"] == 0
+    assert summaries == [{"chunks": uploaded, "added": 0, "updated": 0, "deleted": 0, "unchanged": uploaded}]
@@ -0,0 +1,28 @@
+import numpy as np
+
+import compact_index
+from bench_compact import ArraySource, clustered_vectors
+
+def build(tmp_path, mode="int8"):
+    vectors = clustered_vectors(np.random.default_rng(0), 3000, dim=32, clusters=20)
+    directory = str(tmp_path / mode)
+    compact_index.build_index(ArraySource(vectors), directory, mode, "cosine")
+    return vectors, compact_index.CompactIndex(directory)
+
+def test_rows_for_ids_skips_unknown_ids(tmp_path):
+    _, index = build(tmp_path)
+    rows = index.rows_for_ids(["v-42", "not-in-the-snapshot", "v-7"])
+    assert rows.tolist() == [7, 42]
+
+def test_filtered_search_only_returns_allowed_rows(tmp_path):
+    vectors, index = build(tmp_path)
+    allowed = [f"v-{i}" for i in range(0, 3000, 3)]
+    ids, distances = index.search(vectors[300], 5, rows=index.rows_for_ids(allowed))
+    assert ids[0] == "v-300"
+    assert set(ids) <= set(allowed)
+    assert distances == sorted(distances)
+
+def test_float16_first_pass_ranks_the_nearest_row_first(tmp_path):
+    vectors, index = build(tmp_path, "float16")
+    query = vectors[11]
+    assert index.candidates(query, 1).tolist() == [11]
@@ -0,0 +1,74 @@
+import gzip
+
+import pytest
+
+from common.compression import CompressionMiddleware, gzip_quality
+
+@pytest.mark.parametrize("header, accepted", [
+    ("gzip, deflate, br", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.0, deflate", False),
+    ("deflate, gzip;q=0.5", True),
+    ("*", True),
+    ("*;q=0", False),
+    ("gzip;q=0, *", False),
+    ("identity", False),
+    ("GZIP;Q=1", True),
+])
+def test_gzip_quality(header, accepted):
+    assert (gzip_quality(header) > 0) == accepted
+
+def make_app(body: bytes, etag: bytes = b'"v1"', content_type: bytes = b"application/json"):
+    """An ASGI app answering 304 when If-None-Match matches its identity ETag"""
+    async def app(scope, receive, send):
+        headers = dict(scope["headers"])
+        if headers.get(b"if-none-match") == etag:
+            await send({"type": "http.response.start", "status": 304, "headers": [(b"etag", etag)]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", content_type), (b"content-length", str(len(body)).encode()), (b"etag", etag)
+        ]})
+        await send({"type": "http.response.body", "body": body})
+    return CompressionMiddleware(app)
+
+async def call(app, headers):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(name.encode(), value.encode()) for name, value in headers.items()]}
+    await app(scope, None, send)
+    start = sent[0]
+    return start["status"], dict(start["headers"]), b"".join(m.get("body", b"") for m in sent[1:])
+
+@pytest.mark.anyio
+async def test_refused_gzip_is_not_sent():
+    status, headers, body = await call(make_app(b"x" * 4096), {"accept-encoding": "gzip;q=0, deflate"})
+    assert b"content-encoding" not in headers
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert body == b"x" * 4096
+
+@pytest.mark.anyio
+async def test_small_responses_still_vary():
+    status, headers, body = await call(make_app(b"{}"), {"accept-encoding": "gzip"})
+    assert b"content-encoding" not in headers
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert headers[b"etag"] == b'"v1"'
+
+@pytest.mark.anyio
+async def test_compressed_etag_differs_and_revalidates():
+    app = make_app(b"x" * 4096)
+    status, headers, body = await call(app, {"accept-encoding": "gzip"})
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"etag"] == b'"v1-gzip"'
+    assert gzip.decompress(body) == b"x" * 4096
+
+    status, headers, _ = await call(app, {"accept-encoding": "gzip", "if-none-match": '"v1-gzip"'})
+    assert status == 304
+    assert headers[b"etag"] == b'"v1-gzip"'
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
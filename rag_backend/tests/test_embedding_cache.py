@@ -0,0 +1,25 @@
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+
+class CountingEmbedding:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, input):
+        self.calls += 1
+        return [[float(len(text)), 1.0] for text in input]
+
+def stored_bytes(cache):
+    return cache._conn.execute("SELECT SUM(LENGTH(vector)) FROM embeddings").fetchone()[0]
+
+def test_replacing_entries_keeps_size_exact(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    cache.put_many({"a": [1.0, 2.0], "b": [3.0, 4.0]})
+    cache.put_many({"a": [5.0, 6.0], "c": [7.0, 8.0]})
+    assert cache._size == stored_bytes(cache) == 3 * 2 * 4
+
+def test_queries_bypass_the_cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    embed_fn = CachedEmbeddingFunction(CountingEmbedding(), cache)
+    assert embed_fn.embed_query("what is covered?") == [16.0, 1.0]
+    assert cache._size == 0
+    assert embed_fn.hits == embed_fn.misses == 0
@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip("langchain")
+from ingest_pipeline import IngestionPipeline
+
+class RecordingCollection:
+    """Keeps chunks in a dict and records the write calls the pipeline makes"""
+
+    def __init__(self):
+        self.records = {}
+        self.calls = []
+
+    def get(self, where=None, include=None):
+        key, value = next(iter(where.items()))
+        ids = [doc_id for doc_id, metadata in self.records.items() if metadata.get(key) == value]
+        return {"ids": ids, "metadatas": [self.records[doc_id] for doc_id in ids]}
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        self.calls.append(("upsert", len(ids)))
+        self.records.update(zip(ids, (dict(metadata) for metadata in metadatas)))
+
+    def update(self, ids, metadatas):
+        self.calls.append(("update", len(ids)))
+        for doc_id, metadata in zip(ids, metadatas):
+            self.records[doc_id].update(metadata)
+
+    def delete(self, ids):
+        self.calls.append(("delete", len(ids)))
+        for doc_id in ids:
+            del self.records[doc_id]
+
+def embed(texts):
+    return [[float(len(text)), 1.0] for text in texts]
+
+def ingest(collection, pages):
+    pipeline = IngestionPipeline(collection, "docs/policy.pdf", {"source": "policy.pdf"}, embed,
+                                 chunk_size=200, chunk_overlap=0)
+    return pipeline.run(pages)["summary"]
+
+def test_fresh_upload_writes_each_chunk_once():
+    collection = RecordingCollection()
+    pages = [f"Page {i} " + "covered loss " * 40 for i in range(5)]
+    summary = ingest(collection, pages)
+    assert summary["added"] == summary["chunks"] > 1
+    assert {name for name, _ in collection.calls} == {"upsert"}
+    assert all("total_chunks" not in metadata for metadata in collection.records.values())
+
+def test_reupload_only_retags_moved_chunks():
+    collection = RecordingCollection()
+    pages = [f"Page {i} " + "covered loss " * 40 for i in range(5)]
+    ingest(collection, pages)
+    collection.calls = []
+    summary = ingest(collection, pages[1:])
+    assert summary["updated"] > 0 and summary["deleted"] > 0
+    # Only chunks whose position moved are re-tagged, in one pass
+    assert [call for call in collection.calls if call[0] == "update"] == [("update", summary["updated"])]
+    assert sorted(metadata["chunk_index"] for metadata in collection.records.values()) == list(range(summary["chunks"]))
+
+def test_reupload_leaves_legacy_chunks_of_same_named_files_elsewhere():
+    collection = RecordingCollection()
+    collection.records = {
+        "policy.pdf-0": {"source": "policy.pdf", "relative_path": "docs/policy.pdf", "chunk_index": 0},
+        "policy.pdf-1": {"source": "policy.pdf", "relative_path": "archive/policy.pdf", "chunk_index": 0},
+        "policy.pdf-2": {"source": "policy.pdf", "chunk_index": 0},
+    }
+    summary = ingest(collection, ["Page 0 " + "covered loss " * 10])
+    # Only the legacy chunk stored under the same relative path is replaced
+    assert summary["deleted"] == 1
+    assert "policy.pdf-0" not in collection.records
+    assert {"policy.pdf-1", "policy.pdf-2"} <= set(collection.records)
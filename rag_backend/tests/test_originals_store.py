@@ -0,0 +1,58 @@
+import pytest
+
+from originals_store import OriginalsStore, RangeNotSatisfiable, parse_range
+
+CONTENT = bytes(range(256)) * 4
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=1000-", (1000, 1023)),
+    ("bytes=-24", (1000, 1023)),
+    ("bytes=-5000", (0, 1023)),
+    ("bytes=1000-9999", (1000, 1023)),
+])
+def test_parse_range_satisfiable(header, expected):
+    assert parse_range(header, len(CONTENT)) == expected
+
+@pytest.mark.parametrize("header", [
+    "bytes=0-9,20-29",
+    "items=0-9",
+    "bytes=abc",
+    "bytes=5",
+    "bytes=-",
+    "bytes=9-0",
+    "bytes=-+5",
+    "bytes= 1-x",
+])
+def test_parse_range_ignores_invalid_headers(header):
+    assert parse_range(header, len(CONTENT)) is None
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=5000-6000", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, len(CONTENT))
+
+@pytest.fixture
+def client(rag_app, tmp_path):
+    client, main = rag_app
+    store = OriginalsStore(str(tmp_path / "originals"))
+    store.put(CONTENT, "policy.pdf", "application/pdf")
+    main._originals_store = store
+    return client
+
+def test_download_serves_single_range(client):
+    response = client.get("/download/policy.pdf", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 10-19/1024"
+    assert response.content == CONTENT[10:20]
+
+@pytest.mark.parametrize("header", ["bytes=0-9,20-29", "bytes=oops", "items=0-9"])
+def test_download_ignores_multi_and_malformed_ranges(client, header):
+    response = client.get("/download/policy.pdf", headers={"Range": header})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+def test_download_rejects_unsatisfiable_range(client):
+    response = client.get("/download/policy.pdf", headers={"Range": "bytes=2000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
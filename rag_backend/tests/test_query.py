@@ -0,0 +1,49 @@
+import io
+
+import pytest
+
+import columnar_export
+
+@pytest.fixture
+def client(rag_app):
+    client, main = rag_app
+    main.get_collection("insurance_qa").add(
+        ids=["qa-1", "qa-2", "qa-3"],
+        documents=["Is flood damage covered?", "How do I file a claim?", "What is the excess?"],
+        metadatas=[{"source": "faq.csv"}] * 3
+    )
+    return client
+
+@pytest.mark.parametrize("query", ["", "flood"])
+def test_packed_output_keeps_ids_when_fields_leave_them_out(client, query):
+    response = client.post("/query_direct", json={
+        "query": query, "collection": "insurance_qa", "n_results": 3, "fields": ["text"], "format": "packed"
+    })
+    assert response.status_code == 200
+    (frame,) = columnar_export.read_packed_frames(io.BytesIO(response.content))
+    assert sorted(frame["ids"]) == ["qa-1", "qa-2", "qa-3"]
+    assert len(frame["documents"]) == 3
+
+def test_browse_matches_carry_ids_in_query_and_stream(client):
+    request = {"query": "", "collection": "insurance_qa", "n_results": 3}
+    matches = client.post("/query", json=request).json()["matches"]
+    streamed = [line for line in client.post("/query/stream", json=request).text.splitlines() if line]
+    assert sorted(match["id"] for match in matches) == ["qa-1", "qa-2", "qa-3"]
+    assert len(streamed) == 3 and all('"id"' in line for line in streamed)
+
+def test_rerank_runs_off_the_event_loop(client, monkeypatch):
+    import threading
+
+    import reranker
+
+    threads = []
+
+    class RecordingReranker:
+        def rerank(self, query, candidates, top_n):
+            threads.append(threading.current_thread())
+            return candidates[:top_n]
+
+    monkeypatch.setattr(reranker, "_reranker", RecordingReranker())
+    response = client.post("/query", json={"query": "flood", "collection": "insurance_qa", "n_results": 2, "rerank": True})
+    assert response.status_code == 200 and len(response.json()["matches"]) == 2
+    assert threads and threads[0].name.startswith("AnyIO worker thread")
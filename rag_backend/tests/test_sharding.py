@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+import sharding
+from conftest import FakeEmbedding
+
+class Listed:
+    def __init__(self, name):
+        self.name = name
+
+class Counted:
+    def __init__(self, count):
+        self._count = count
+
+    def count(self):
+        return self._count
+
+class FakeClient:
+    def __init__(self, names, counts=None):
+        self.names = names
+        self.counts = counts or {}
+
+    def list_collections(self):
+        return [Listed(name) for name in self.names]
+
+    def get_collection(self, name, embedding_function=None):
+        return Counted(self.counts.get(name, 0))
+
+@pytest.fixture
+def case_law_sharded(monkeypatch):
+    monkeypatch.setattr(sharding, "SHARDED_COLLECTIONS", {"case_law"})
+
+def test_write_target_routes_by_court(case_law_sharded):
+    assert sharding.write_target("case_law", {"court": "Supreme Court"}) == "case_law__supreme_court"
+    assert sharding.write_target("case_law", {}) == "case_law__unknown"
+    assert sharding.write_target("legal_docs", {"court": "Supreme Court"}) == "legal_docs"
+
+def test_target_shards_pins_court(case_law_sharded):
+    client = FakeClient(["case_law", "case_law__supreme_court", "case_law__court_of_appeal", "legal_docs"])
+    assert sharding.target_shards(client, "case_law", {"court": "Supreme Court"}) == ["case_law__supreme_court"]
+    assert sharding.target_shards(client, "case_law", {"$and": [{"court": {"$in": ["Court of Appeal"]}}, {"type": "pdf_document"}]}) == ["case_law__court_of_appeal"]
+    assert sharding.target_shards(client, "case_law", None) == ["case_law__court_of_appeal", "case_law__supreme_court"]
+
+def test_target_shards_falls_back_to_base_collection_without_shards(case_law_sharded):
+    client = FakeClient(["case_law", "legal_docs"])
+    assert sharding.target_shards(client, "case_law", None) == ["case_law"]
+    assert sharding.target_shards(client, "case_law", {"court": "Supreme Court"}) == ["case_law"]
+
+def test_bulk_ingest_writes_into_court_shards(case_law_sharded, monkeypatch, tmp_path):
+    chromadb = pytest.importorskip("chromadb")
+    import bulk_ingest
+
+    monkeypatch.setattr(bulk_ingest, "get_embedding_function", lambda db_path: FakeEmbedding())
+    root = tmp_path / "docs"
+    for court, rows in (("Supreme Court", 3), ("Court of Appeal", 2)):
+        os.makedirs(root / court)
+        lines = ["Question,Answer"] + [f"Is {court} case {i} binding?,Yes in part {i}" for i in range(rows)]
+        (root / court / "cases.csv").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    db_path = str(tmp_path / "db")
+
+    stats = bulk_ingest.bulk_ingest(str(root), "case_law", db_path=db_path, workers=1)
+
+    assert stats["ingested"] == 2
+    client = chromadb.PersistentClient(path=db_path)
+    names = {collection.name for collection in client.list_collections()}
+    assert "case_law" not in names
+    assert client.get_collection("case_law__supreme_court").count() == 3
+    assert client.get_collection("case_law__court_of_appeal").count() == 2
+    # A court-filtered query is routed to the shard holding the bulk-loaded chunks
+    assert sharding.target_shards(client, "case_law", {"court": "Supreme Court"}) == ["case_law__supreme_court"]
+
+def test_target_shards_keeps_base_collection_while_it_holds_data(case_law_sharded):
+    client = FakeClient(["case_law", "case_law__supreme_court"], counts={"case_law": 14})
+    assert sharding.target_shards(client, "case_law", None) == ["case_law", "case_law__supreme_court"]
+    assert sharding.target_shards(client, "case_law", {"court": "High Court"}) == ["case_law"]
+
+def test_data_written_before_sharding_stays_searchable_after_first_routed_upload(rag_app, monkeypatch):
+    client, main = rag_app
+    # Chunks stored while case_law was still a single collection
+    main.get_collection("case_law").add(
+        ids=["old-1", "old-2"],
+        documents=["High Court ruling on negligence", "High Court ruling on damages"],
+        metadatas=[{"source": "old.pdf", "court": "High Court"}] * 2
+    )
+    monkeypatch.setattr(sharding, "SHARDED_COLLECTIONS", {"case_law"})
+    content = "Question,Answer\nIs the appeal allowed?,Yes\n"
+    response = client.post("/upload", files={"file": ("new.csv", content, "text/csv")}, data={"collection": "case_law"})
+    assert response.status_code == 200
+
+    matches = client.post("/query", json={"query": "ruling", "collection": "case_law", "n_results": 10}).json()["matches"]
+    assert {match["metadata"]["source"] for match in matches} == {"old.pdf", "new.csv"}
+    filtered = client.post("/query", json={
+        "query": "ruling", "collection": "case_law", "n_results": 10, "where": {"court": "High Court"}
+    }).json()["matches"]
+    assert sorted(match["id"] for match in filtered) == ["old-1", "old-2"]
+    assert client.post("/delete", json={"source": "old.pdf", "collection": "case_law"}).status_code == 200
@@ -0,0 +1,11 @@
+def test_csv_upload_reports_stage_timings(rag_app):
+    client, main = rag_app
+    content = "Question,Answer\nIs flood covered?,Yes\nHow do I claim?,Online\n"
+    response = client.post("/upload", files={"file": ("faq.csv", content, "text/csv")}, data={"collection": "insurance_qa"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["summary"]["added"] == 2
+    assert set(body["stages"]) == {"parse", "plan", "embed", "write", "index"}
+    assert main.get_collection("insurance_qa").count() == 2
+    assert main.get_lexical_index("insurance_qa").count() == 2
@@ -1,16 +1,19 @@
 import chromadb
 import pandas as pd
+import time
 import uuid
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 import textwrap
+import bm25_index
+from embedding_cache import get_embedding_function
+from index_config import open_collection
+
+DB_PATH = "./db"
 
 def get_collection():
     """Get or create the insurance_qa collection"""
-    client = chromadb.PersistentClient(path="./db")
-    return client.get_or_create_collection(
-        name="insurance_qa",
-        metadata={"hnsw:space": "cosine"}
-    )
+    client = chromadb.PersistentClient(path=DB_PATH)
+    return open_collection(client, "insurance_qa", get_embedding_function(DB_PATH))
 
 def process_qa_pair(question: str, answer: str, chunk_size: int = 1000, chunk_overlap: int = 50) -> List[Tuple[str, Dict]]:
     """Process a Q&A pair into chunks with metadata"""
@@ -65,10 +68,38 @@ def process_qa_pair(question: str, answer: str, chunk_size: int = 1000, chunk_ov
     
     return chunks
 
-def upload_csv(file_path: str, chunk_size: int = 1000, chunk_overlap: int = 50):
-    """Upload CSV file to ChromaDB"""
+def add_batch(collection, ids: List[str], chunks: List[str], metadatas: List[Dict], stats: Optional[Dict] = None):
+    """Embed and store one batch (and index it for BM25), timing the two steps separately when stats is given"""
+    t0 = time.perf_counter()
+    embeddings = get_embedding_function(DB_PATH)(chunks)
+    t1 = time.perf_counter()
+    collection.add(
+        ids=ids,
+        documents=chunks,
+        metadatas=metadatas,
+        embeddings=embeddings
+    )
+    # Keep hybrid search's lexical index in step with the collection
+    bm25_index.get_index(DB_PATH, collection.name).add(ids, chunks)
+    if stats is not None:
+        stats["embed_seconds"] += t1 - t0
+        stats["write_seconds"] += time.perf_counter() - t1
+        stats["chunks"] += len(ids)
+
+def upload_csv(file_path: str, chunk_size: int = 1000, chunk_overlap: int = 50, stats: Optional[Dict] = None):
+    """Upload CSV file to ChromaDB.
+
+    Pass a dict as stats to collect per-stage timings (read, chunk, embed,
+    write) plus row and chunk counts, e.g. for bench_ingest.py.
+    """
+    if stats is not None:
+        stats.update(rows=0, chunks=0, read_seconds=0.0, chunk_seconds=0.0, embed_seconds=0.0, write_seconds=0.0)
+
     # Read CSV file
+    t0 = time.perf_counter()
     df = pd.read_csv(file_path)
+    if stats is not None:
+        stats["read_seconds"] += time.perf_counter() - t0
     
     # Get collection
     collection = get_collection()
@@ -87,7 +118,11 @@ def upload_csv(file_path: str, chunk_size: int = 1000, chunk_overlap: int = 50):
             continue
             
         # Process the Q&A pair into chunks
+        t0 = time.perf_counter()
         chunks = process_qa_pair(question, answer, chunk_size, chunk_overlap)
+        if stats is not None:
+            stats["chunk_seconds"] += time.perf_counter() - t0
+            stats["rows"] += 1
         
         # Generate unique ID base for this Q&A pair
         qa_id_base = str(uuid.uuid4())
@@ -101,22 +136,14 @@ def upload_csv(file_path: str, chunk_size: int = 1000, chunk_overlap: int = 50):
             
             # Add chunks in batches of 100 to avoid memory issues
             if len(all_chunks) >= 100:
-                collection.add(
-                    ids=all_ids,
-                    documents=all_chunks,
-                    metadatas=all_metadatas
-                )
+                add_batch(collection, all_ids, all_chunks, all_metadatas, stats)
                 all_chunks = []
                 all_ids = []
                 all_metadatas = []
     
     # Add any remaining chunks
     if all_chunks:
-        collection.add(
-            ids=all_ids,
-            documents=all_chunks,
-            metadatas=all_metadatas
-        )
+        add_batch(collection, all_ids, all_chunks, all_metadatas, stats)
 
 if __name__ == "__main__":
     import sys
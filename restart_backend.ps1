@@ -1,6 +1,24 @@
 # Restart Backend server
 Write-Host "Restarting Backend server..." -ForegroundColor Green
 
+# Wait until the RAG backend is warm so the gateway doesn't route traffic to a cold server
+Write-Host "Waiting for RAG backend readiness (http://localhost:8082/ready)..." -ForegroundColor Cyan
+$ready = $false
+for ($i = 0; $i -lt 120; $i++) {
+    try {
+        Invoke-WebRequest -Uri "http://localhost:8082/ready" -UseBasicParsing -TimeoutSec 2 | Out-Null
+        $ready = $true
+        break
+    } catch {
+        Start-Sleep -Seconds 1
+    }
+}
+if ($ready) {
+    Write-Host "RAG backend is ready" -ForegroundColor Green
+} else {
+    Write-Host "RAG backend did not report ready within 120s, starting anyway" -ForegroundColor Yellow
+}
+
 # Change to the backend directory
 Set-Location -Path "backend"
 
@@ -70,7 +70,7 @@ echo Starting RAG Backend...
 cd rag_backend
 start /B cmd /c "call venv\Scripts\activate && python main.py"
 cd ..
-timeout /t 5 /nobreak > nul
+call :wait_for_ready http://localhost:8082/ready
 
 REM Start OdesAI RAG Dashboard
 echo Starting OdesAI RAG Dashboard...
@@ -125,6 +125,24 @@ for /f "tokens=5" %%a in ('netstat -aon ^| find "%1" ^| find "LISTENING"') do (
 timeout /t 2 /nobreak > nul
 goto :eof
 
+:wait_for_ready
+REM Poll a readiness URL (up to 120s) so later servers don't route traffic to a cold one
+echo Waiting for %1 ...
+set /a ready_attempts=0
+:wait_for_ready_loop
+curl -s -f %1 >nul 2>&1
+if not errorlevel 1 (
+    echo Ready: %1
+    goto :eof
+)
+set /a ready_attempts+=1
+if !ready_attempts! geq 120 (
+    echo %1 did not become ready within 120s, continuing anyway
+    goto :eof
+)
+timeout /t 1 /nobreak > nul
+goto wait_for_ready_loop
+
 :server_selection
 cls
 echo Select server to start:
@@ -169,6 +187,7 @@ if "%server_choice%"=="1" (
     cd rag_backend
     start /B cmd /c "call venv\Scripts\activate && python main.py"
     cd ..
+    call :wait_for_ready http://localhost:8082/ready
 ) else if "%server_choice%"=="6" (
     call :clear_port 11434
     echo Starting Ollama API...